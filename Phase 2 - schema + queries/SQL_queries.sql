@@ -92,21 +92,27 @@ FROM Person
 ORDER BY lastName, firstName;
 
 
--- Q9 — People matching criteria {birthday month, relationship type, location like}
+-- Q9 — People matching criteria {birthday month, relationship type, location prefix}
 -- English: "Search for people that meet a certain criteria {birthday, relationship, location}"
--- Params: (birthMonthOrNull, birthMonthCopy, relTypeNameOrNull, relTypeNameCopy, locationLikeOrNull, locationLikeCopy)
-SELECT DISTINCT p.perkey,
-       p.firstName,
-       p.lastName,
-       p.birthday,
-       p.location
+-- Params: (birthMonth 1-12, locationPrefix || '%', relTypeName, relTypeName)
+-- birthMonth is an indexed generated column; ix_person_birth_name holds the
+-- people of a month in name order with their location, so the prefix LIKE
+-- (+ keeps it off ix_person_location_name) is checked in the index and the
+-- walk stops at the page. The OR join is an EXISTS per relationship side,
+-- each probing its (perkey, relTypeKey) index.
+-- Drop the predicate of any criterion that isn't given; a location without
+-- a month picks between two plans at run time (see backend/person_search.py).
+SELECT p.perkey, p.firstName, p.lastName, p.birthday, p.location
 FROM Person p
-LEFT JOIN Relationships r  ON r.perkey1 = p.perkey OR r.perkey2 = p.perkey
-LEFT JOIN RelationshipType rt ON rt.relTypeKey = r.relTypeKey
-WHERE (? IS NULL OR strftime('%m', p.birthday) = printf('%02d', ?))
-  AND (? IS NULL OR rt.name = ?)
-  AND (? IS NULL OR p.location LIKE ?)
-ORDER BY p.lastName, p.firstName;
+WHERE p.birthMonth = ?
+  AND +p.location LIKE ?
+  AND (EXISTS (SELECT 1 FROM Relationships r
+               WHERE r.perkey1 = p.perkey
+                 AND r.relTypeKey = (SELECT relTypeKey FROM RelationshipType WHERE name = ?))
+       OR EXISTS (SELECT 1 FROM Relationships r
+                  WHERE r.perkey2 = p.perkey
+                    AND r.relTypeKey = (SELECT relTypeKey FROM RelationshipType WHERE name = ?)))
+ORDER BY p.lastName, p.firstName, p.location, p.perkey;
 
 
 -- Q10 — Delete a person
@@ -244,8 +250,8 @@ SELECT remkey,
        completed
 FROM Reminders
 WHERE completed = 0
-  AND date(dueDate) >= date('now')
-ORDER BY datetime(dueDate);
+  AND dueAt >= unixepoch('now', 'start of day')   -- dueAt = unixepoch(dueDate), migration 5
+ORDER BY dueAt;
 
 
 -- Q22 — Reminders due today
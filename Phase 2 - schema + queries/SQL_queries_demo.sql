@@ -110,14 +110,17 @@ ORDER BY lastName, firstName;
 
 -- Q9 — People matching criteria {birthday month, relationship type, location like}
 -- Demo: people with birthday in July, who are Classmates, located in Merced
-SELECT DISTINCT p.perkey, p.firstName, p.lastName, p.birthday, p.location
+SELECT p.perkey, p.firstName, p.lastName, p.birthday, p.location
 FROM Person p
-LEFT JOIN Relationships r ON r.perkey1 = p.perkey OR r.perkey2 = p.perkey
-LEFT JOIN RelationshipType rt ON rt.relTypeKey = r.relTypeKey
-WHERE strftime('%m', p.birthday) = '07'
-  AND rt.name = 'Classmate'
-  AND p.location LIKE '%Merced%'
-ORDER BY p.lastName, p.firstName;
+WHERE p.birthMonth = 7
+  AND +p.location LIKE 'Merced%'
+  AND (EXISTS (SELECT 1 FROM Relationships r
+               WHERE r.perkey1 = p.perkey
+                 AND r.relTypeKey = (SELECT relTypeKey FROM RelationshipType WHERE name = 'Classmate'))
+       OR EXISTS (SELECT 1 FROM Relationships r
+                  WHERE r.perkey2 = p.perkey
+                    AND r.relTypeKey = (SELECT relTypeKey FROM RelationshipType WHERE name = 'Classmate')))
+ORDER BY p.lastName, p.firstName, p.location, p.perkey;
 
 
 -- Q10 — Delete a person
@@ -274,8 +277,8 @@ SELECT * FROM Reminders ORDER BY remkey DESC LIMIT 3;
 SELECT remkey, title, description, dueDate, completed
 FROM Reminders
 WHERE completed = 0
-  AND date(dueDate) >= date('now')
-ORDER BY datetime(dueDate);
+  AND dueAt >= unixepoch('now', 'start of day')
+ORDER BY dueAt;
 
 
 -- Q22 — Reminders due today
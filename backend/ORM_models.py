@@ -1,14 +1,24 @@
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import CheckConstraint, text
 from sqlalchemy.sql import func
+from db_roles import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 class Photo(db.Model):
     __tablename__ = "Photo"
 
     photokey = db.Column(db.Integer, primary_key=True)
-    imagedata = db.Column(db.Text, nullable=False)
+    # legacy inline image; new photos live in the blob store (blobstore.py)
+    # and migrate_photos.py moves old rows there
+    imagedata = db.Column(db.Text, nullable=True)
+    contentHash = db.Column(db.String, nullable=True)
+    mimeType = db.Column(db.String, nullable=True)
+    byteSize = db.Column(db.Integer, nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_photo_contenthash", "contentHash"),
+    )
 
     people = db.relationship("Person", back_populates="photo", passive_deletes=True)
     note_photos = db.relationship("NotePhoto", back_populates="photo", passive_deletes=True)
@@ -33,7 +43,10 @@ class Notes(db.Model):
         db.String,
         nullable=False,
         server_default=func.current_timestamp(),
+        onupdate=func.current_timestamp(),
     )
+    # the start of content, for list pages (views.py); loaded only when undeferred
+    contentPreview = db.column_property(func.substr(content, 1, 100), deferred=True)
 
     note_photos = db.relationship("NotePhoto", back_populates="note", passive_deletes=True)
     noted_people = db.relationship("NotedPerson", back_populates="note", passive_deletes=True)
@@ -95,6 +108,18 @@ class Person(db.Model):
     lastName = db.Column(db.String, nullable=False)
     birthday = db.Column(db.String, nullable=True)
     location = db.Column(db.String, nullable=True)
+    birthMonth = db.Column(db.Integer, db.Computed("CAST(strftime('%m', birthday) AS INTEGER)", persisted=False))
+    birthDayOfMonth = db.Column(db.Integer, db.Computed("CAST(strftime('%d', birthday) AS INTEGER)", persisted=False))
+
+    # secondary indexes are created by the migrations in migrations.py
+    __table_args__ = (
+        db.Index("ix_person_photokey", "photokey"),
+        db.Index("ix_person_name", "lastName", "firstName", "location"),
+        db.Index("ix_person_lower_name", func.lower(lastName), func.lower(firstName)),
+        db.Index("ix_person_location_name", location.collate("NOCASE"), "lastName", "firstName"),
+        db.Index("ix_person_birth_md", "birthMonth", "birthDayOfMonth"),
+        db.Index("ix_person_birth_name", "birthMonth", "lastName", "firstName", "location"),
+    )
 
     photo = db.relationship("Photo", back_populates="people")
 
@@ -136,6 +161,10 @@ class SocialLinks(db.Model):
     handle = db.Column(db.String, nullable=False)
     profileURL = db.Column(db.String, nullable=True)
 
+    __table_args__ = (
+        db.Index("ix_sociallinks_perkey", "perkey", "socialkey"),
+    )
+
     social_type = db.relationship("SocialType", back_populates="links")
     person = db.relationship("Person", back_populates="social_links")
 
@@ -157,6 +186,10 @@ class NotePhoto(db.Model):
         primary_key=True,
     )
 
+    __table_args__ = (
+        db.Index("ix_notephoto_photokey", "photokey", "notekey"),
+    )
+
     note = db.relationship("Notes", back_populates="note_photos")
     photo = db.relationship("Photo", back_populates="note_photos")
 
@@ -178,6 +211,10 @@ class NotedPerson(db.Model):
         primary_key=True,
     )
 
+    __table_args__ = (
+        db.Index("ix_notedperson_notekey", "notekey", "perkey"),
+    )
+
     person = db.relationship("Person", back_populates="noted_person_entries")
     note = db.relationship("Notes", back_populates="noted_people")
 
@@ -206,6 +243,10 @@ class Relationships(db.Model):
 
     __table_args__ = (
         CheckConstraint("perkey1 < perkey2", name="ck_relationships_perkey_order"),
+        db.Index("ix_relationships_perkey2", "perkey2", "perkey1"),
+        db.Index("ix_relationships_reltype", "relTypeKey"),
+        db.Index("ix_relationships_perkey1_type", "perkey1", "relTypeKey"),
+        db.Index("ix_relationships_perkey2_type", "perkey2", "relTypeKey"),
     )
 
     rel_type = db.relationship("RelationshipType", back_populates="relationships")
@@ -228,6 +269,13 @@ class Reminders(db.Model):
         nullable=False,
         server_default=text("0"),
     )
+    dueAt = db.Column(db.Integer, db.Computed("unixepoch(dueDate)", persisted=False))
+
+    __table_args__ = (
+        db.Index("ix_reminders_due", func.date(dueDate)),
+        db.Index("ix_reminders_open_due", func.date(dueDate), sqlite_where=text("completed = 0")),
+        db.Index("ix_reminders_open_due_at", "dueAt", "remkey", sqlite_where=text("completed = 0")),
+    )
 
     rem_pers = db.relationship("RemPer", back_populates="reminder", passive_deletes=True)
     rem_cats = db.relationship("RemCat", back_populates="reminder", passive_deletes=True)
@@ -250,6 +298,10 @@ class PerCat(db.Model):
         primary_key=True,
     )
 
+    __table_args__ = (
+        db.Index("ix_percat_catkey", "catkey", "perkey"),
+    )
+
     person = db.relationship("Person", back_populates="per_cats")
     category = db.relationship("Category", back_populates="per_cats")
 
@@ -271,6 +323,10 @@ class RemPer(db.Model):
         primary_key=True,
     )
 
+    __table_args__ = (
+        db.Index("ix_remper_perkey", "perkey", "remkey"),
+    )
+
     reminder = db.relationship("Reminders", back_populates="rem_pers")
     person = db.relationship("Person", back_populates="rem_pers")
 
@@ -292,8 +348,31 @@ class RemCat(db.Model):
         primary_key=True,
     )
 
+    __table_args__ = (
+        db.Index("ix_remcat_catkey", "catkey", "remkey"),
+    )
+
     reminder = db.relationship("Reminders", back_populates="rem_cats")
     category = db.relationship("Category", back_populates="rem_cats")
 
     def __repr__(self):
-        return f"<RemCat rem={self.remkey} cat={self.catkey}>"
\ No newline at end of file
+        return f"<RemCat rem={self.remkey} cat={self.catkey}>"
+
+class PersonSummary(db.Model):
+    """Per-person aggregates kept up to date by triggers (migration 7,
+    migrations.py); read-only for the application."""
+    __tablename__ = "PersonSummary"
+
+    perkey = db.Column(db.Integer, primary_key=True)
+    noteCount = db.Column(db.Integer, nullable=False, default=0)
+    openReminderCount = db.Column(db.Integer, nullable=False, default=0)
+    nextDueDate = db.Column(db.String, nullable=True)
+    relationshipCount = db.Column(db.Integer, nullable=False, default=0)
+    categories = db.Column(db.String, nullable=True)
+
+    # the triggers change it when these do (response_cache.table_dependents)
+    __table_args__ = {"info": {"derived_from": ("Person", "NotedPerson", "remPer", "Reminders", "Relationships",
+                                                "perCat", "Category")}}
+
+    def __repr__(self):
+        return f"<PersonSummary {self.perkey}>"
@@ -1,67 +1,629 @@
-from flask import Blueprint, jsonify, request
-from ORM_models import db, Person, Notes, Reminders, Relationships, NotedPerson, RemPer, RelationshipType
-from sqlalchemy import func
+import io
+import os
+import sqlite3
+import time
+
+from flask import Blueprint, Response, abort, jsonify, request, send_file, stream_with_context
+from ORM_models import db, Person, PersonSummary, Notes, Reminders, Relationships, NotedPerson, RemPer, RelationshipType, Photo, SocialLinks, PerCat
+from sqlalchemy import func, or_, select, text, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
+from db_roles import read_only, reading
+from blobstore import get_store, sniff_mimetype, decode_legacy_imagedata
+import blobstore
+from thumbnails import SIZES as THUMBNAIL_SIZES, get_pipeline
+import search as fts
+import bulk_import
+import export
+import batch
+import changelog
+import person_search
+import scheduler
+import stream
+import metrics
+import write_queue
+from graph import get_graph
+from response_cache import cached, get_cache
+import serializers as ser
 
 bp = Blueprint('api', __name__, url_prefix='/api')
 
 # -------------------------------------------------
-# Utility: Convert a SQLAlchemy model to dict
+# Utility: keyset pagination + field projection
 # -------------------------------------------------
-def model_to_dict(obj):
-    result = {}
-    for col in obj.__table__.columns:
-        result[col.name] = getattr(obj, col.name)
-    return result
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+
+def keyset_page(serializer, pk_name):
+    """Return one page of `serializer`'s model ordered by its integer primary key.
+
+    Query args:
+      limit  - page size (default DEFAULT_PAGE_LIMIT, capped at MAX_PAGE_LIMIT)
+      after  - primary key of the last row of the previous page
+      fields - comma separated output names to return (default: all)
+
+    Raises ValueError on bad arguments so handlers can answer 400.
+    """
+    serializer, stmt, limit = keyset_query(serializer, pk_name, request.args)
+    return keyset_result(serializer, db.session.execute(stmt).all(), limit)
+
+
+def keyset_query(serializer, pk_name, args):
+    """(serializer, statement, limit) for keyset_page; the async handlers in
+    asgi.py run the statement themselves."""
+    try:
+        limit = int(args.get("limit", DEFAULT_PAGE_LIMIT))
+        after = args.get("after")
+        after = int(after) if after not in (None, "") else None
+    except ValueError:
+        raise ValueError("limit and after must be integers")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    limit = min(limit, MAX_PAGE_LIMIT)
+
+    fields = args.get("fields")
+    if fields:
+        names = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in names if f not in serializer.fields]
+        if unknown:
+            raise ValueError("unknown fields: " + ", ".join(unknown))
+        serializer = serializer.only(names)
+
+    # row tuples, not ORM objects; the primary key (the cursor) rides along last
+    pk = getattr(serializer.model, pk_name)
+    stmt = serializer.query(pk)
+    if after is not None:
+        stmt = stmt.where(pk > after)
+    return serializer, stmt.order_by(pk).limit(limit + 1), limit
+
+
+def keyset_result(serializer, rows, limit):
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = rows[-1][len(serializer.names)]
+
+    return {"items": serializer.rows(rows), "next_after": next_after}
 
 
 # =================================================
 # PERSONS API
 # =================================================
+# include=summary adds each person's PersonSummary row (note, open reminder
+# and relationship counts, next due date, category names), which triggers
+# keep up to date (migrations.py), so the list needs no aggregate queries.
+PERSON_LIST_INCLUDES = {"summary": ("PersonSummary",)}
+
+
 @bp.route('/persons', methods=['GET'])
+@cached("Person", include=PERSON_LIST_INCLUDES)
+@read_only
 def list_persons():
-    persons = Person.query.all()
-    return jsonify([model_to_dict(p) for p in persons])
+    try:
+        query = person_list_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    serializer, stmt, limit, summary = query
+    return jsonify(person_list_result(serializer, db.session.execute(stmt).all(), limit, summary))
+
+
+def person_list_query(args):
+    """keyset_query for list_persons, plus whether the summary is included
+    (its columns go after the cursor); raises ValueError."""
+    include = {x.strip() for x in (args.get("include") or "").split(",") if x.strip()}
+    unknown = include - set(PERSON_LIST_INCLUDES)
+    if unknown:
+        raise ValueError("unknown include: " + ", ".join(sorted(unknown)))
+    serializer, stmt, limit = keyset_query(ser.PERSON, "perkey", args)
+    summary = "summary" in include
+    if summary:
+        stmt = stmt.outerjoin(PersonSummary, PersonSummary.perkey == Person.perkey).add_columns(
+            *ser.PERSON_SUMMARY.columns)
+    return serializer, stmt, limit, summary
+
+
+def person_list_result(serializer, rows, limit, summary):
+    page = keyset_result(serializer, rows, limit)
+    if summary:
+        start = len(serializer.names) + 1
+        for item, row in zip(page["items"], rows):
+            item["summary"] = ser.PERSON_SUMMARY.row(row[start:])
+    return page
+
+
+# People matching criteria (Q9): birthMonth (1-12), birthDay (needs birthMonth),
+# relType (relationship type name), location (prefix, case-insensitive).
+# Paged with limit/offset, ordered by name (then location).
+@bp.route('/persons/search', methods=['GET'])
+@cached("Person", "Relationships", "RelationshipType")
+@read_only
+def search_persons():
+    try:
+        criteria, limit, offset = person_search_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    rows = person_search.search(db.session, limit=limit + 1, offset=offset, **criteria)
+    return jsonify(person_search_result(rows, limit, offset))
+
+
+def person_search_args(args):
+    """(criteria, limit, offset) for person_search.search; raises ValueError."""
+    try:
+        month = int(args["birthMonth"]) if args.get("birthMonth") else None
+        day = int(args["birthDay"]) if args.get("birthDay") else None
+    except ValueError:
+        raise ValueError("birthMonth and birthDay must be integers")
+    try:
+        limit = min(int(args.get("limit", DEFAULT_PAGE_LIMIT)), MAX_PAGE_LIMIT)
+        offset = int(args.get("offset", 0))
+    except ValueError:
+        raise ValueError("limit and offset must be integers")
+    rel_type = args.get("relType") or None
+    location = args.get("location") or None
+
+    if month is None and day is None and rel_type is None and location is None:
+        raise ValueError("give at least one of birthMonth, birthDay, relType, location")
+    if month is not None and not 1 <= month <= 12:
+        raise ValueError("birthMonth must be 1-12")
+    if day is not None and (month is None or not 1 <= day <= 31):
+        raise ValueError("birthDay must be 1-31 and needs birthMonth")
+    if limit < 1 or offset < 0:
+        raise ValueError("limit or offset out of range")
+
+    criteria = dict(birth_month=month, birth_day=day, rel_type=rel_type, location=location)
+    return criteria, limit, offset
+
+
+def person_search_result(rows, limit, offset):
+    return {
+        "items": [dict(r) for r in rows[:limit]],
+        "next_offset": offset + limit if len(rows) > limit else None,
+    }
 
 
 @bp.route('/persons/<int:perkey>', methods=['GET'])
+@cached("Person")
+@read_only
 def get_person(perkey):
-    p = Person.query.get_or_404(perkey)
-    return jsonify(model_to_dict(p))
+    row = db.session.execute(ser.PERSON.query().where(Person.perkey == perkey)).first()
+    if row is None:
+        abort(404)
+    return jsonify(ser.PERSON.row(row))
+
+
+# -------------------------------------------------
+# Person detail aggregate: everything the detail page shows, in one response
+# -------------------------------------------------
+# include: comma separated subset of PERSON_PARTS (default: all). The person
+# itself is always returned, with the photo joined in. Every other part is
+# one selectinload query (junction targets and relationship counterparts are
+# joined into it; relationships take one query per side), so the whole
+# aggregate is at most eight queries however much the person has.
+PERSON_PARTS = ["photo", "socialLinks", "categories", "notes", "reminders", "relationships", "relationshipTypes"]
+PERSON_FULL_TABLES = [
+    "Person", "Photo", "SocialLinks", "SocialType", "perCat", "Category", "NotedPerson", "Notes",
+    "remPer", "Reminders", "Relationships", "RelationshipType",
+]
+
+
+def person_detail_options(parts):
+    options = []
+    if "photo" in parts:
+        options.append(
+            joinedload(Person.photo).load_only(Photo.contentHash, Photo.mimeType, Photo.byteSize)
+        )
+    if "socialLinks" in parts:
+        options.append(selectinload(Person.social_links).joinedload(SocialLinks.social_type))
+    if "categories" in parts:
+        options.append(selectinload(Person.per_cats).joinedload(PerCat.category))
+    if "notes" in parts:
+        options.append(selectinload(Person.noted_person_entries).joinedload(NotedPerson.note))
+    if "reminders" in parts:
+        options.append(selectinload(Person.rem_pers).joinedload(RemPer.reminder))
+    if "relationships" in parts:
+        for rels, other in ((Person.rels_as_first, Relationships.person2),
+                            (Person.rels_as_second, Relationships.person1)):
+            options.append(selectinload(rels).options(
+                joinedload(other).load_only(Person.firstName, Person.lastName),
+                joinedload(Relationships.rel_type),
+            ))
+    return options
+
+
+@bp.route('/persons/<int:perkey>/full', methods=['GET'])
+@cached(*PERSON_FULL_TABLES)
+@read_only
+def get_person_full(perkey):
+    try:
+        parts = person_parts(request.args.get("include"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    result = person_full(db.session, perkey, parts)
+    if result is None:
+        return jsonify({"error": "person not found"}), 404
+    return jsonify(result)
+
+
+def person_parts(include):
+    parts = set(PERSON_PARTS) if not include else {x.strip() for x in include.split(",") if x.strip()}
+    unknown = parts - set(PERSON_PARTS)
+    if unknown:
+        raise ValueError("unknown include: " + ", ".join(sorted(unknown)))
+    return parts
+
+
+def person_full(session, perkey, parts):
+    """The aggregate for get_person_full, or None if there is no such person.
+    Takes the session so asgi.py can run it through AsyncSession.run_sync."""
+    p = session.scalars(
+        select(Person).where(Person.perkey == perkey).options(*person_detail_options(parts))
+    ).first()
+    if p is None:
+        return None
+
+    # same item shapes as the per-part endpoints below
+    result = {"person": ser.PERSON.obj(p)}
+    if "photo" in parts:
+        result["photo"] = None if p.photo is None else {
+            "photokey": p.photo.photokey,
+            "url": f"/api/photos/{p.photo.photokey}",
+            "mimeType": p.photo.mimeType,
+            "byteSize": p.photo.byteSize,
+            "contentHash": p.photo.contentHash,
+        }
+    if "socialLinks" in parts:
+        result["socialLinks"] = [
+            {
+                "socialkey": link.socialkey,
+                "platform": link.social_type.platformName,
+                "handle": link.handle,
+                "profileURL": link.profileURL,
+            }
+            for link in p.social_links
+        ]
+    if "categories" in parts:
+        result["categories"] = [
+            {"catkey": pc.catkey, "name": pc.category.name} for pc in p.per_cats
+        ]
+    if "notes" in parts:
+        result["notes"] = [
+            {"id": np.notekey, "title": np.note.title, "content": np.note.content}
+            for np in p.noted_person_entries
+        ]
+    if "reminders" in parts:
+        result["reminders"] = [
+            {
+                "id": rp.remkey,
+                "label": rp.reminder.title,
+                "description": rp.reminder.description,
+                "due_date": rp.reminder.dueDate,
+                "completed": rp.reminder.completed,
+            }
+            for rp in p.rem_pers
+        ]
+    if "relationships" in parts:
+        result["relationships"] = [
+            {
+                "relTypeKey": rel.relTypeKey,
+                "type": rel.rel_type.name,
+                "withPerson": {"perkey": other.perkey, "firstName": other.firstName, "lastName": other.lastName},
+            }
+            for rel, other in [(r, r.person2) for r in p.rels_as_first] + [(r, r.person1) for r in p.rels_as_second]
+        ]
+    if "relationshipTypes" in parts:
+        result["relationshipTypes"] = ser.RELATIONSHIP_TYPE.rows(
+            session.execute(ser.RELATIONSHIP_TYPE.query().order_by(RelationshipType.relTypeKey))
+        )
+    return result
 
 
 @bp.route('/persons', methods=['POST'])
 def create_person():
     data = request.json or {}
-    p = Person(
-        firstName=data.get('firstName', ''),
-        lastName=data.get('lastName', ''),
-        birthday=data.get('birthday'),
-        location=data.get('location'),
-        photokey=data.get('photokey')
-    )
-    db.session.add(p)
-    db.session.commit()
-    return jsonify(model_to_dict(p)), 201
+
+    def unit():
+        p = Person(
+            firstName=data.get('firstName', ''),
+            lastName=data.get('lastName', ''),
+            birthday=data.get('birthday'),
+            location=data.get('location'),
+            photokey=data.get('photokey')
+        )
+        db.session.add(p)
+        db.session.flush()
+        return ser.PERSON.obj(p)
+    return jsonify(write_queue.run(unit)), 201
 
 
 @bp.route('/persons/<int:perkey>', methods=['PUT'])
 def update_person(perkey):
-    p = Person.query.get_or_404(perkey)
     data = request.json or {}
 
-    for field in ['firstName', 'lastName', 'birthday', 'location', 'photokey']:
-        if field in data:
-            setattr(p, field, data[field])
-
-    db.session.commit()
-    return jsonify(model_to_dict(p))
+    def unit():
+        p = Person.query.get_or_404(perkey)
+        for field in ['firstName', 'lastName', 'birthday', 'location', 'photokey']:
+            if field in data:
+                setattr(p, field, data[field])
+        db.session.flush()
+        return ser.PERSON.obj(p)
+    return jsonify(write_queue.run(unit))
 
 
 @bp.route('/persons/<int:perkey>', methods=['DELETE'])
 def delete_person(perkey):
-    p = Person.query.get_or_404(perkey)
-    db.session.delete(p)
-    db.session.commit()
+    def unit():
+        db.session.delete(Person.query.get_or_404(perkey))
+    write_queue.run(unit)
+    return '', 204
+
+
+# =================================================
+# SEARCH API
+# =================================================
+MAX_SEARCH_OFFSET = 10000
+
+
+# Full-text search across notes, persons and reminders, best matches first.
+# title/snippet are escaped HTML with the matches in <mark>; score is the
+# hit's bm25 rank relative to the best hit of its type (search.py).
+#   q      - search text (each word is prefix-matched)
+#   types  - comma separated subset of note,person,reminder (default: all)
+#   limit, offset - paging
+@bp.route('/search', methods=['GET'])
+@cached("Notes", "Person", "Reminders")
+@read_only
+def search():
+    q = request.args.get("q", "").strip()
+    if not q:
+        return jsonify({"error": "q required"}), 400
+
+    types = request.args.get("types")
+    if types:
+        types = [t.strip() for t in types.split(",") if t.strip()]
+        unknown = [t for t in types if t not in fts.TYPES]
+        if unknown:
+            return jsonify({"error": "unknown types: " + ", ".join(unknown)}), 400
+
+    try:
+        limit = min(int(request.args.get("limit", 20)), MAX_PAGE_LIMIT)
+        offset = int(request.args.get("offset", 0))
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers"}), 400
+    if limit < 1 or offset < 0 or offset > MAX_SEARCH_OFFSET:
+        return jsonify({"error": "limit or offset out of range"}), 400
+
+    hits, has_more = fts.search(db.session, q, types, limit, offset)
+    return jsonify({
+        "items": hits,
+        "next_offset": offset + limit if has_more else None,
+    })
+
+
+# =================================================
+# IMPORT API
+# =================================================
+# Bulk load one or more uploaded files (multipart field "file").
+#   format - tbl, csv or vcard (default: from each file name)
+#   table  - target table for .tbl files (default: from each file name)
+@bp.route('/import', methods=['POST'])
+def import_files():
+    uploads = request.files.getlist("file")
+    if not uploads:
+        return jsonify({"error": "file required"}), 400
+
+    jobs = []
+    for upload in uploads:
+        fmt = request.args.get("format") or bulk_import.detect_format(upload.filename or "")
+        table = request.args.get("table") or bulk_import.table_for_file(upload.filename or "")
+        if fmt is None:
+            return jsonify({"error": f"cannot tell the format of {upload.filename!r}"}), 400
+        if fmt == "tbl" and table is None:
+            return jsonify({"error": f"cannot tell the table for {upload.filename!r}"}), 400
+        jobs.append((upload, fmt, table))
+
+    # .tbl uploads go parents-first, like load_data.sql
+    order = {t: i for i, t in enumerate(bulk_import.TABLE_ORDER)}
+    jobs.sort(key=lambda job: order.get(job[2], len(order)))
+
+    # on the writer thread's raw connection, between two groups of API writes
+    store = get_store()
+
+    def load(conn):
+        importer = bulk_import.BulkImporter(conn, store=store)
+        for upload, fmt, table in jobs:
+            bulk_import.import_stream(importer, bulk_import.text_stream(upload.stream), fmt, table)
+        return importer.stats.as_dict()
+
+    try:
+        stats = write_queue.run_exclusive(load)
+    except (ValueError, sqlite3.Error) as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        # rows written on a raw connection bypass the session hooks
+        scheduler.get_scheduler().mark_stale()
+        get_graph().mark_stale()
+        stream.get_broker().wake()
+        if get_cache() is not None:
+            get_cache().bump_all()
+
+    return jsonify(stats), 201
+
+
+# =================================================
+# BATCH API
+# =================================================
+# Many creates/updates/deletes in one transaction; see batch.py for the format.
+# 200 with per-item results, or 422 (nothing applied) when "atomic" is set
+# and any item is invalid.
+@bp.route('/batch', methods=['POST'])
+def apply_batch():
+    data = request.json or {}
+    try:
+        results, applied = write_queue.run(lambda: batch.apply_batch(data.get("operations"), bool(data.get("atomic"))))
+    except batch.BatchError as e:
+        return jsonify({"error": str(e)}), 400
+    except IntegrityError as e:
+        return jsonify({"error": str(e.orig)}), 409
+    return jsonify({"applied": applied, "results": results}), 200 if applied else 422
+
+
+# =================================================
+# EXPORT API
+# =================================================
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", export.ndjson_chunks),
+    "csv": ("text/csv", export.csv_chunks),
+}
+
+
+# Stream every person with their links, categories, notes, reminders and
+# relationships. ?format=ndjson|csv, ?gzip=1 compresses on the fly into a
+# .gz download (application/gzip, no Content-Encoding, so clients save the
+# compressed file instead of inflating it). No Content-Length is sent, so the server uses chunked transfer encoding.
+@bp.route('/export', methods=['GET'])
+def export_all():
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": "format must be ndjson or csv"}), 400
+    mimetype, make_chunks = EXPORT_FORMATS[fmt]
+    compress = request.args.get("gzip") in ("1", "true")
+
+    def generate():
+        # the generator runs after the view returns, so it sets its own role
+        with reading():
+            chunks = make_chunks()
+            if compress:
+                chunks = export.gzip_chunks(chunks)
+            yield from chunks
+
+    filename = f"crm-export.{fmt}"
+    if compress:
+        mimetype, filename = "application/gzip", filename + ".gz"
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
+
+
+# =================================================
+# PHOTOS API
+# =================================================
+def photo_to_dict(photo):
+    return {
+        "photokey": photo.photokey,
+        "hash": photo.contentHash,
+        "mimeType": photo.mimeType,
+        "byteSize": photo.byteSize,
+    }
+
+
+# Upload a photo: multipart field "file", or the raw bytes as the request body
+@bp.route('/photos', methods=['POST'])
+def create_photo():
+    store = get_store()
+    upload = request.files.get("file")
+    if upload is not None:
+        digest, size, tmp = store.stage_stream(upload.stream)
+        mimetype = upload.mimetype
+    else:
+        data = request.get_data()
+        if not data:
+            return jsonify({"error": "no image data"}), 400
+        digest, size, tmp = store.stage(data)
+        mimetype = request.mimetype
+
+    if not mimetype or mimetype in ("application/octet-stream", "multipart/form-data"):
+        with open(tmp, "rb") as f:
+            mimetype = sniff_mimetype(f.read(16))
+
+    def unit():
+        photo = Photo(contentHash=digest, mimeType=mimetype, byteSize=size)
+        db.session.add(photo)
+        db.session.flush()
+        # on the writer with the row, so a delete of the last photo with
+        # these bytes can't unlink them in between (blobstore.py)
+        blobstore.claim(db.session, digest)
+        store.place(tmp, digest)
+        return photo_to_dict(photo)
+    try:
+        result = write_queue.run(unit)
+    finally:
+        store.discard(tmp)   # still there if the unit failed before placing it
+
+    # thumbnails are built in the background; the upload returns right away
+    get_pipeline().submit(digest)
+    return jsonify(result), 201
+
+
+THUMBNAIL_WAIT_SECONDS = 10
+
+
+# Stream a photo's bytes. send_file handles ETag/If-None-Match and Range, and
+# hands the open file to the server's wsgi.file_wrapper (sendfile where the
+# server supports it, or X-Sendfile when USE_X_SENDFILE is on).
+# ?size=small|medium|large returns a cached JPEG thumbnail instead.
+@bp.route('/photos/<int:photokey>', methods=['GET'])
+@read_only
+def get_photo(photokey):
+    size = request.args.get("size")
+    if size is not None and size not in THUMBNAIL_SIZES:
+        return jsonify({"error": "size must be one of " + ", ".join(THUMBNAIL_SIZES)}), 400
+
+    photo = Photo.query.get_or_404(photokey)
+
+    pipeline = get_pipeline()
+    if size is not None and photo.contentHash is not None and pipeline.enabled:
+        thumb = pipeline.path(photo.contentHash, size)
+        if not os.path.exists(thumb):
+            # not built yet (upload still in flight, or never backfilled)
+            future = pipeline.submit(photo.contentHash)
+            try:
+                if future is not None:
+                    future.result(timeout=THUMBNAIL_WAIT_SECONDS)
+            except Exception:
+                pass  # undecodable image or timeout: serve the original below
+        if os.path.exists(thumb):
+            return send_file(
+                thumb,
+                mimetype="image/jpeg",
+                etag=f"{photo.contentHash}-{size}",
+                conditional=True,
+                max_age=0,
+            )
+
+    if photo.contentHash is None:
+        # row not moved by migrate_photos.py yet; serve the inline copy
+        if photo.imagedata is None:
+            return jsonify({"error": "photo has no image data"}), 404
+        data = decode_legacy_imagedata(photo.imagedata)
+        return send_file(
+            io.BytesIO(data),
+            mimetype=sniff_mimetype(data[:16]),
+            conditional=True,
+        )
+
+    return send_file(
+        get_store().path(photo.contentHash),
+        mimetype=photo.mimeType or "application/octet-stream",
+        etag=photo.contentHash,
+        conditional=True,
+        max_age=0,
+    )
+
+
+@bp.route('/photos/<int:photokey>', methods=['DELETE'])
+def delete_photo(photokey):
+    store = get_store()
+
+    def unit():
+        photo = Photo.query.get_or_404(photokey)
+        db.session.delete(photo)
+        db.session.flush()
+        # blobs are shared between identical photos; the file goes with the
+        # last row, once this transaction commits (blobstore.py)
+        digest = photo.contentHash
+        if digest and not Photo.query.filter_by(contentHash=digest).first():
+            blobstore.release(db.session, store, digest)
+    write_queue.run(unit)
     return '', 204
 
 
@@ -69,119 +631,176 @@ def delete_person(perkey):
 # NOTES API
 # =================================================
 @bp.route('/notes', methods=['GET'])
+@cached("Notes")
+@read_only
 def list_notes():
-    notes = Notes.query.all()
-    return jsonify([
-        {
-            "id": n.notekey,
-            "title": n.title,
-            "content": n.content,
-            "created_at": n.dateCreated,
-            "updated_at": n.lastModified
-        }
-        for n in notes
-    ])
+    try:
+        page = keyset_page(ser.NOTE, "notekey")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(page)
 
 
 @bp.route('/notes', methods=['POST'])
 def create_note():
     data = request.json or {}
-    note = Notes(
-        title=data.get("title", ""),
-        content=data.get("content", "")
-    )
-    db.session.add(note)
-    db.session.commit()
-    return jsonify({"id": note.notekey}), 201
+
+    def unit():
+        note = Notes(
+            title=data.get("title", ""),
+            content=data.get("content", "")
+        )
+        db.session.add(note)
+        db.session.flush()
+        return note.notekey
+    return jsonify({"id": write_queue.run(unit)}), 201
 
 
 @bp.route('/notes/<int:id>', methods=['GET'])
+@cached("Notes")
+@read_only
 def get_note(id):
-    note = Notes.query.get_or_404(id)
-    return jsonify({
-        "id": note.notekey,
-        "title": note.title,
-        "content": note.content,
-        "created_at": note.dateCreated,
-        "updated_at": note.lastModified
-    })
+    row = db.session.execute(ser.NOTE.query().where(Notes.notekey == id)).first()
+    if row is None:
+        abort(404)
+    return jsonify(ser.NOTE.row(row))
 
 
 @bp.route('/notes/<int:id>', methods=['PUT'])
 def update_note(id):
-    note = Notes.query.get_or_404(id)
     data = request.json or {}
 
-    note.title = data.get("title", note.title)
-    note.content = data.get("content", note.content)
-
-    db.session.commit()
+    def unit():
+        note = Notes.query.get_or_404(id)
+        note.title = data.get("title", note.title)
+        note.content = data.get("content", note.content)
+    write_queue.run(unit)
     return jsonify({"message": "updated"})
 
 
 @bp.route('/notes/<int:id>', methods=['DELETE'])
 def delete_note(id):
-    note = Notes.query.get_or_404(id)
-    db.session.delete(note)
-    db.session.commit()
+    def unit():
+        db.session.delete(Notes.query.get_or_404(id))
+    write_queue.run(unit)
     return jsonify({"message": "deleted"})
 
 
 @bp.route('/reminders', methods=['GET'])
+@cached("Reminders")
+@read_only
 def list_reminders():
-    reminders = Reminders.query.all()
-    return jsonify([
-        {
-            "id": r.remkey,
-            "label": r.title,                 # map DB title → frontend label
-            "description": r.description,
-            "due_date": r.dueDate,           # map dueDate → due_date
-            "completed": r.completed
-        }
-        for r in reminders
-    ])
+    try:
+        page = keyset_page(ser.REMINDER, "remkey")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(page)
+
+
+# -------------------------------------------------
+# Upcoming / due reminders, served by the in-memory scheduler
+# -------------------------------------------------
+# window: seconds, or a number with an s/m/h/d/w suffix ("90m", "2d")
+WINDOW_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+DEFAULT_DUE_WINDOW = "1d"
+MAX_DUE_WINDOW = 31 * 86400
+
+
+def parse_window(value):
+    value = value.strip().lower()
+    unit = WINDOW_UNITS.get(value[-1:])
+    number = value[:-1] if unit else value
+    try:
+        seconds = int(number) * (unit or 1)
+    except ValueError:
+        raise ValueError("window must be seconds or a number with s/m/h/d/w")
+    if not 0 <= seconds <= MAX_DUE_WINDOW:
+        raise ValueError(f"window must be between 0 and {MAX_DUE_WINDOW} seconds")
+    return seconds
+
+
+def scheduled_reminder_dict(row, now):
+    return {
+        "id": row["remkey"],
+        "label": row["title"],
+        "description": row["description"],
+        "due_date": row["dueDate"],
+        "due_at": row["dueAt"],
+        "completed": bool(row["completed"]),
+        "overdue": row["dueAt"] < now,
+    }
+
+
+@bp.route('/reminders/upcoming', methods=['GET'])
+def upcoming_reminders():
+    try:
+        limit = max(1, min(int(request.args.get("limit", DEFAULT_PAGE_LIMIT)), MAX_PAGE_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    now = time.time()
+    rows = scheduler.get_scheduler().upcoming(limit)
+    return jsonify({"items": [scheduled_reminder_dict(r, now) for r in rows]})
+
+
+# Open reminders due within the window, including ones that went overdue
+# within the scheduler's lookback (a day by default).
+@bp.route('/reminders/due', methods=['GET'])
+def due_reminders():
+    try:
+        limit = max(1, min(int(request.args.get("limit", DEFAULT_PAGE_LIMIT)), MAX_PAGE_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    try:
+        window = parse_window(request.args.get("window", DEFAULT_DUE_WINDOW))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    now = time.time()
+    rows = scheduler.get_scheduler().due(window, limit)
+    return jsonify({"items": [scheduled_reminder_dict(r, now) for r in rows]})
 
 
 @bp.route('/reminders', methods=['POST'])
 def create_reminder():
     data = request.json or {}
 
-    r = Reminders(
-        title=data.get("label", ""),         # label → title
-        description=data.get("description"),
-        dueDate=data.get("due_date"),        # due_date → dueDate
-        completed=data.get("completed", False)
-    )
-
-    db.session.add(r)
-    db.session.commit()
+    def unit():
+        r = Reminders(
+            title=data.get("label", ""),         # label → title
+            description=data.get("description"),
+            dueDate=data.get("due_date"),        # due_date → dueDate
+            completed=data.get("completed", False)
+        )
+        db.session.add(r)
+        db.session.flush()
+        return r.remkey
 
-    return jsonify({"id": r.remkey}), 201
+    return jsonify({"id": write_queue.run(unit)}), 201
 
 
 @bp.route('/reminders/<int:id>', methods=['PUT'])
 def update_reminder(id):
-    r = Reminders.query.get_or_404(id)
     data = request.json or {}
 
-    if "label" in data:
-        r.title = data["label"]
-    if "description" in data:
-        r.description = data["description"]
-    if "due_date" in data:
-        r.dueDate = data["due_date"]
-    if "completed" in data:
-        r.completed = data["completed"]
-
-    db.session.commit()
+    def unit():
+        r = Reminders.query.get_or_404(id)
+        if "label" in data:
+            r.title = data["label"]
+        if "description" in data:
+            r.description = data["description"]
+        if "due_date" in data:
+            r.dueDate = data["due_date"]
+        if "completed" in data:
+            r.completed = data["completed"]
+
+    write_queue.run(unit)
     return jsonify({"message": "Reminder updated"})
 
 
 @bp.route('/reminders/<int:id>', methods=['DELETE'])
 def delete_reminder(id):
-    r = Reminders.query.get_or_404(id)
-    db.session.delete(r)
-    db.session.commit()
+    def unit():
+        db.session.delete(Reminders.query.get_or_404(id))
+    write_queue.run(unit)
     return '', 204
 
 
@@ -191,76 +810,77 @@ def delete_reminder(id):
 
 # List reminders for a specific person
 @bp.route('/persons/<int:perkey>/reminders', methods=['GET'])
+@cached("Person", "remPer", "Reminders")
+@read_only
 def list_person_reminders(perkey):
-    p = Person.query.get_or_404(perkey)
-    reminders = [
-        {
-            "id": rp.remkey,
-            "label": rp.reminder.title,
-            "description": rp.reminder.description,
-            "due_date": rp.reminder.dueDate,
-            "completed": rp.reminder.completed
-        }
-        for rp in p.rem_pers
-    ]
-    return jsonify(reminders)
+    Person.query.get_or_404(perkey)
+    rows = db.session.execute(
+        ser.REMINDER.query().join(RemPer, RemPer.remkey == Reminders.remkey).where(RemPer.perkey == perkey)
+    )
+    return jsonify(ser.REMINDER.rows(rows))
 
 
 # Add a reminder to a person
 
 @bp.route('/persons/<int:perkey>/reminders', methods=['POST'])
 def add_person_reminder(perkey):
-    Person.query.get_or_404(perkey)  # ensure person exists
     data = request.json or {}
-    rem = Reminders(
-        title=data.get("label", ""),
-        description=data.get("description"),
-        dueDate=data.get("due_date"),
-        completed=data.get("completed", False)
-    )
-    db.session.add(rem)
-    db.session.flush()  # assign rem.remkey
 
     # Accept array of person keys; default to [perkey]
     person_keys = data.get("personKeys")
     if not person_keys:
         person_keys = [perkey]
-
-    # Create RemPer junction for each unique person
-    for pk in set(int(k) for k in person_keys):
-        Person.query.get_or_404(pk)
-        db.session.add(RemPer(remkey=rem.remkey, perkey=pk))
-
-    db.session.commit()
-    return jsonify({"id": rem.remkey}), 201
+    person_keys = set(int(k) for k in person_keys)
+
+    def unit():
+        Person.query.get_or_404(perkey)  # ensure person exists
+        # one RemPer junction for each unique person (validated with one IN query)
+        missing = batch.missing_keys(Person, "perkey", person_keys)
+        if missing:
+            return {"error": f"persons not found: {sorted(missing)}"}, 404
+        rem = Reminders(
+            title=data.get("label", ""),
+            description=data.get("description"),
+            dueDate=data.get("due_date"),
+            completed=data.get("completed", False)
+        )
+        db.session.add(rem)
+        db.session.flush()  # assign rem.remkey
+        db.session.add_all([RemPer(remkey=rem.remkey, perkey=pk) for pk in person_keys])
+        return {"id": rem.remkey}, 201
+
+    body, status = write_queue.run(unit)
+    return jsonify(body), status
 
 
 # Update a reminder for a person
 @bp.route('/persons/<int:perkey>/reminders/<int:remkey>', methods=['PUT'])
 def update_person_reminder(perkey, remkey):
-    rp = RemPer.query.filter_by(perkey=perkey, remkey=remkey).first_or_404()
-    rem = rp.reminder
-
     data = request.json or {}
-    rem.title = data.get("label", rem.title)
-    rem.description = data.get("description", rem.description)
-    rem.dueDate = data.get("due_date", rem.dueDate)
-    rem.completed = data.get("completed", rem.completed)
 
-    db.session.commit()
+    def unit():
+        rp = RemPer.query.filter_by(perkey=perkey, remkey=remkey).first_or_404()
+        rem = rp.reminder
+        rem.title = data.get("label", rem.title)
+        rem.description = data.get("description", rem.description)
+        rem.dueDate = data.get("due_date", rem.dueDate)
+        rem.completed = data.get("completed", rem.completed)
+
+    write_queue.run(unit)
     return jsonify({"message": "reminder updated"})
 
 
 # Delete a reminder for a person
 @bp.route('/persons/<int:perkey>/reminders/<int:remkey>', methods=['DELETE'])
 def delete_person_reminder(perkey, remkey):
-    rp = RemPer.query.filter_by(perkey=perkey, remkey=remkey).first_or_404()
-    rem = rp.reminder
-
-    # remove junction first
-    db.session.delete(rp)
-    db.session.delete(rem)
-    db.session.commit()
+    def unit():
+        rp = RemPer.query.filter_by(perkey=perkey, remkey=remkey).first_or_404()
+        rem = rp.reminder
+        # remove junction first
+        db.session.delete(rp)
+        db.session.delete(rem)
+
+    write_queue.run(unit)
     return jsonify({"message": "reminder deleted"})
 
 
@@ -268,17 +888,15 @@ def delete_person_reminder(perkey, remkey):
 
 # List notes for a specific person
 @bp.route('/persons/<int:perkey>/notes', methods=['GET'])
+@cached("Person", "NotedPerson", "Notes")
+@read_only
 def list_person_notes(perkey):
-    p = Person.query.get_or_404(perkey)
-    notes = [
-        {
-            "id": np.notekey,
-            "title": np.note.title,
-            "content": np.note.content
-        }
-        for np in p.noted_person_entries
-    ]
-    return jsonify(notes)
+    Person.query.get_or_404(perkey)
+    rows = db.session.execute(
+        ser.NOTE_SUMMARY.query().join(NotedPerson, NotedPerson.notekey == Notes.notekey)
+        .where(NotedPerson.perkey == perkey)
+    )
+    return jsonify(ser.NOTE_SUMMARY.rows(rows))
 
 
 # Add a note to a person
@@ -286,61 +904,81 @@ def list_person_notes(perkey):
 
 @bp.route('/persons/<int:perkey>/notes', methods=['POST'])
 def add_person_note(perkey):
-    Person.query.get_or_404(perkey)  # ensure person exists
     data = request.json or {}
-    note = Notes(title=data.get("title", ""), content=data.get("content", ""))
-    db.session.add(note)
-    db.session.flush()  # assign note.notekey
 
     # Accept an array of person keys; default to [perkey]
     person_keys = data.get("personKeys")
     if not person_keys:
         person_keys = [perkey]
+    person_keys = set(int(k) for k in person_keys)
 
-    # Create NotedPerson junction for each unique person
-    for pk in set(int(k) for k in person_keys):
-        Person.query.get_or_404(pk)  # validate person exists
-        db.session.add(NotedPerson(perkey=pk, notekey=note.notekey))
+    def unit():
+        Person.query.get_or_404(perkey)  # ensure person exists
+        # one NotedPerson junction for each unique person (validated with one IN query)
+        missing = batch.missing_keys(Person, "perkey", person_keys)
+        if missing:
+            return {"error": f"persons not found: {sorted(missing)}"}, 404
+        note = Notes(title=data.get("title", ""), content=data.get("content", ""))
+        db.session.add(note)
+        db.session.flush()  # assign note.notekey
+        db.session.add_all([NotedPerson(perkey=pk, notekey=note.notekey) for pk in person_keys])
+        return {"id": note.notekey}, 201
 
-    db.session.commit()
-    return jsonify({"id": note.notekey}), 201
+    body, status = write_queue.run(unit)
+    return jsonify(body), status
 
 
 # Update a note for a person
 @bp.route('/persons/<int:perkey>/notes/<int:notekey>', methods=['PUT'])
 def update_person_note(perkey, notekey):
-    # ensure the note belongs to this person
-    np = NotedPerson.query.filter_by(perkey=perkey, notekey=notekey).first_or_404()
-    note = np.note
-
     data = request.json or {}
-    note.title = data.get("title", note.title)
-    note.content = data.get("content", note.content)
 
-    db.session.commit()
+    def unit():
+        # ensure the note belongs to this person
+        np = NotedPerson.query.filter_by(perkey=perkey, notekey=notekey).first_or_404()
+        note = np.note
+        note.title = data.get("title", note.title)
+        note.content = data.get("content", note.content)
+
+    write_queue.run(unit)
     return jsonify({"message": "note updated"})
 
 
 # Delete a note for a person
 @bp.route('/persons/<int:perkey>/notes/<int:notekey>', methods=['DELETE'])
 def delete_person_note(perkey, notekey):
-    np = NotedPerson.query.filter_by(perkey=perkey, notekey=notekey).first_or_404()
-    note = np.note
-
-    # remove junction first
-    db.session.delete(np)
-    db.session.delete(note)
-    db.session.commit()
+    def unit():
+        np = NotedPerson.query.filter_by(perkey=perkey, notekey=notekey).first_or_404()
+        note = np.note
+        # remove junction first
+        db.session.delete(np)
+        db.session.delete(note)
+
+    write_queue.run(unit)
     return jsonify({"message": "note deleted"})
 
 # List relationships for a person
 @bp.route('/persons/<int:perkey>/relationships', methods=['GET'])
+@cached("Person", "Relationships", "RelationshipType")
+@read_only
 def list_person_relationships(perkey):
-    p = Person.query.get_or_404(perkey)
-    relationships = []
+    Person.query.get_or_404(perkey)
+
+    # one joined query instead of lazy-loading person1/person2/rel_type per edge
+    rels = (
+        Relationships.query
+        .filter(or_(Relationships.perkey1 == perkey, Relationships.perkey2 == perkey))
+        .options(
+            joinedload(Relationships.person1),
+            joinedload(Relationships.person2),
+            joinedload(Relationships.rel_type),
+        )
+        .all()
+    )
 
-    for rel in p.rels_as_first + p.rels_as_second:
-        other = rel.person2 if rel.person1.perkey == p.perkey else rel.person1
+    relationships = []
+    for rel in rels:
+        other = rel.person2 if rel.perkey1 == perkey else rel.person1
         relationships.append({
             "relTypeKey": rel.relTypeKey,
             "type": rel.rel_type.name,
@@ -354,51 +992,114 @@ def list_person_relationships(perkey):
     return jsonify(relationships)
 
 
+MAX_GRAPH_DEPTH = 6
+
+# k-hop neighborhood of :root, each person tagged with its shortest hop count.
+# Relationships are stored once (perkey1 < perkey2) so each step follows the
+# edge from whichever side matches.
+NEIGHBORHOOD_SQL = """
+WITH RECURSIVE hop(perkey, depth) AS (
+    SELECT :root, 0
+    UNION
+    SELECT CASE WHEN r.perkey1 = hop.perkey THEN r.perkey2 ELSE r.perkey1 END,
+           hop.depth + 1
+    FROM hop
+    JOIN Relationships r ON r.perkey1 = hop.perkey OR r.perkey2 = hop.perkey
+    WHERE hop.depth < :depth
+)
+SELECT p.perkey, p.firstName, p.lastName, MIN(hop.depth) AS depth
+FROM hop
+JOIN Person p ON p.perkey = hop.perkey
+GROUP BY p.perkey
+ORDER BY depth, p.perkey
+"""
+
+
+# Relationship graph around a person, up to `depth` hops away
+@bp.route('/persons/<int:perkey>/graph', methods=['GET'])
+@cached("Person", "Relationships", "RelationshipType")
+@read_only
+def person_graph(perkey):
+    Person.query.get_or_404(perkey)
+
+    try:
+        depth = int(request.args.get("depth", 1))
+    except ValueError:
+        return jsonify({"error": "depth must be an integer"}), 400
+    if depth < 0 or depth > MAX_GRAPH_DEPTH:
+        return jsonify({"error": f"depth must be between 0 and {MAX_GRAPH_DEPTH}"}), 400
+
+    rows = db.session.execute(text(NEIGHBORHOOD_SQL), {"root": perkey, "depth": depth}).all()
+    nodes = [
+        {"perkey": r.perkey, "firstName": r.firstName, "lastName": r.lastName, "depth": r.depth}
+        for r in rows
+    ]
+
+    # edges between people inside the neighborhood
+    keys = [n["perkey"] for n in nodes]
+    edges = []
+    if len(keys) > 1:
+        edge_rows = (
+            db.session.query(
+                Relationships.perkey1,
+                Relationships.perkey2,
+                Relationships.relTypeKey,
+                RelationshipType.name,
+            )
+            .join(RelationshipType, RelationshipType.relTypeKey == Relationships.relTypeKey)
+            .filter(Relationships.perkey1.in_(keys), Relationships.perkey2.in_(keys))
+            .all()
+        )
+        edges = [
+            {"perkey1": e.perkey1, "perkey2": e.perkey2, "relTypeKey": e.relTypeKey, "type": e.name}
+            for e in edge_rows
+        ]
+
+    return jsonify({"root": perkey, "depth": depth, "nodes": nodes, "edges": edges})
+
+
 # List relationship types (for dropdown)
 @bp.route('/relationship_types', methods=['GET'])
+@cached("RelationshipType")
+@read_only
 def list_relationship_types():
-    types = RelationshipType.query.all()
-    return jsonify([
-        {
-            "relTypeKey": t.relTypeKey,
-            "name": t.name,
-            "description": t.description
-        } for t in types
-    ])
+    rows = db.session.execute(ser.RELATIONSHIP_TYPE.query())
+    return jsonify(ser.RELATIONSHIP_TYPE.rows(rows))
 
 
 # Add a relationship
 @bp.route('/persons/<int:perkey>/relationships', methods=['POST'])
 def add_relationship(perkey):
-    p1 = Person.query.get_or_404(perkey)
     data = request.json or {}
-
     p2key = data.get("perkey2")
     relTypeKey = data.get("relTypeKey")
-    if not p2key or not relTypeKey:
-        return jsonify({"error": "perkey2 and relTypeKey required"}), 400
 
-    p2 = Person.query.get_or_404(p2key)
+    def unit():
+        p1 = Person.query.get_or_404(perkey)
+        if not p2key or not relTypeKey:
+            return {"error": "perkey2 and relTypeKey required"}, 400
+        p2 = Person.query.get_or_404(p2key)
 
-    # Ensure perkey1 < perkey2 for CheckConstraint
-    perkey1, perkey2 = sorted([p1.perkey, p2.perkey])
+        # Ensure perkey1 < perkey2 for CheckConstraint
+        perkey1, perkey2 = sorted([p1.perkey, p2.perkey])
+        db.session.add(Relationships(perkey1=perkey1, perkey2=perkey2, relTypeKey=relTypeKey))
+        return {"message": "relationship added"}, 201
 
-    rel = Relationships(perkey1=perkey1, perkey2=perkey2, relTypeKey=relTypeKey)
-    db.session.add(rel)
-    db.session.commit()
-    return jsonify({"message": "relationship added"}), 201
+    body, status = write_queue.run(unit)
+    return jsonify(body), status
 # Update relationship type
 @bp.route('/persons/<int:perkey>/relationships/<int:other_perkey>', methods=['PUT'])
 def update_relationship(perkey, other_perkey):
     # order keys to satisfy CheckConstraint
     perkey1, perkey2 = sorted([perkey, other_perkey])
-    rel = Relationships.query.filter_by(perkey1=perkey1, perkey2=perkey2).first_or_404()
-
     data = request.json or {}
-    if "relTypeKey" in data:
-        rel.relTypeKey = data["relTypeKey"]
 
-    db.session.commit()
+    def unit():
+        rel = Relationships.query.filter_by(perkey1=perkey1, perkey2=perkey2).first_or_404()
+        if "relTypeKey" in data:
+            rel.relTypeKey = data["relTypeKey"]
+
+    write_queue.run(unit)
     return jsonify({"message": "relationship updated"})
 
 
@@ -406,33 +1107,263 @@ def update_relationship(perkey, other_perkey):
 @bp.route('/persons/<int:perkey>/relationships/<int:other_perkey>', methods=['DELETE'])
 def delete_relationship(perkey, other_perkey):
     perkey1, perkey2 = sorted([perkey, other_perkey])
-    rel = Relationships.query.filter_by(perkey1=perkey1, perkey2=perkey2).first_or_404()
 
-    db.session.delete(rel)
-    db.session.commit()
+    def unit():
+        db.session.delete(Relationships.query.filter_by(perkey1=perkey1, perkey2=perkey2).first_or_404())
+
+    write_queue.run(unit)
     return jsonify({"message": "relationship deleted"})
 
 
 # Get one person-specific note
 @bp.route('/persons/<int:perkey>/notes/<int:notekey>', methods=['GET'])
+@cached("NotedPerson", "Notes")
+@read_only
 def get_person_note(perkey, notekey):
-    np = NotedPerson.query.filter_by(perkey=perkey, notekey=notekey).first_or_404()
-    note = np.note
-    return jsonify({
-        "id": note.notekey,
-        "title": note.title,
-        "content": note.content
-    })
+    row = db.session.execute(
+        ser.NOTE_SUMMARY.query().join(NotedPerson, NotedPerson.notekey == Notes.notekey)
+        .where(NotedPerson.perkey == perkey, NotedPerson.notekey == notekey)
+    ).first()
+    if row is None:
+        abort(404)
+    return jsonify(ser.NOTE_SUMMARY.row(row))
 
 # Get one person-specific reminder
 @bp.route('/persons/<int:perkey>/reminders/<int:remkey>', methods=['GET'])
+@cached("remPer", "Reminders")
+@read_only
 def get_person_reminder(perkey, remkey):
-    rp = RemPer.query.filter_by(perkey=perkey, remkey=remkey).first_or_404()
-    r = rp.reminder
-    return jsonify({
-        "id": r.remkey,
-        "label": r.title,
-        "description": r.description,
-        "due_date": r.dueDate,
-        "completed": r.completed
-    })
+    row = db.session.execute(
+        ser.REMINDER.query().join(RemPer, RemPer.remkey == Reminders.remkey)
+        .where(RemPer.perkey == perkey, RemPer.remkey == remkey)
+    ).first()
+    if row is None:
+        abort(404)
+    return jsonify(ser.REMINDER.row(row))
+
+
+# =================================================
+# GRAPH API
+# =================================================
+# Whole-graph queries over Relationships, answered from the in-memory
+# adjacency index in graph.py. People are given by perkey; one that isn't in
+# the graph is a 404.
+GRAPH_TABLES = ("Person", "Relationships")
+DEFAULT_GRAPH_LIMIT = 20
+MAX_GRAPH_LIMIT = 1000
+
+
+def graph_people(*names):
+    """The perkeys in query args `names`; aborts 404 for people not in the graph."""
+    keys = []
+    for name in names:
+        value = request.args.get(name)
+        if value in (None, ""):
+            raise ValueError(f"{name} (a perkey) required")
+        try:
+            keys.append(int(value))
+        except ValueError:
+            raise ValueError(f"{name} must be an integer")
+    graph = get_graph()
+    for perkey in keys:
+        if perkey not in graph:
+            abort(404)
+    return keys
+
+
+def graph_limit(default=DEFAULT_GRAPH_LIMIT):
+    try:
+        limit = int(request.args.get("limit", default))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit < 1 or limit > MAX_GRAPH_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_GRAPH_LIMIT}")
+    return limit
+
+
+def person_refs(perkeys):
+    """{perkey, firstName, lastName} of each of `perkeys`, in that order."""
+    if not perkeys:
+        return []
+    rows = db.session.execute(
+        select(Person.perkey, Person.firstName, Person.lastName).where(Person.perkey.in_(perkeys))
+    )
+    by_key = {r.perkey: {"perkey": r.perkey, "firstName": r.firstName, "lastName": r.lastName} for r in rows}
+    return [by_key[k] for k in perkeys if k in by_key]
+
+
+# Shortest chain of relationships between two people.
+#   from, to  - perkeys
+#   max_depth - give up beyond this many hops (default: no limit)
+# length is null, and path empty, when they aren't connected.
+@bp.route('/graph/path', methods=['GET'])
+@cached(*GRAPH_TABLES)
+@read_only
+def graph_path():
+    try:
+        source, target = graph_people("from", "to")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    max_depth = request.args.get("max_depth")
+    try:
+        max_depth = int(max_depth) if max_depth not in (None, "") else None
+    except ValueError:
+        return jsonify({"error": "max_depth must be an integer"}), 400
+    if max_depth is not None and max_depth < 0:
+        return jsonify({"error": "max_depth must be >= 0"}), 400
+
+    path = get_graph().shortest_path(source, target, max_depth)
+    if path is None:
+        return jsonify({"from": source, "to": target, "length": None, "path": [], "edges": []})
+    steps = [tuple(sorted(step)) for step in zip(path, path[1:])]
+    rel_types = dict(
+        ((r.perkey1, r.perkey2), r.relTypeKey)
+        for r in db.session.execute(
+            select(Relationships.perkey1, Relationships.perkey2, Relationships.relTypeKey)
+            .where(tuple_(Relationships.perkey1, Relationships.perkey2).in_(steps))
+        )
+    ) if steps else {}
+    edges = [{"perkey1": a, "perkey2": b, "relTypeKey": rel_types.get((a, b))} for a, b in steps]
+    return jsonify({"from": source, "to": target, "length": len(path) - 1, "path": person_refs(path), "edges": edges})
+
+
+# People related to both a and b (first `limit` by perkey, plus the count)
+@bp.route('/graph/mutual', methods=['GET'])
+@cached(*GRAPH_TABLES)
+@read_only
+def graph_mutual():
+    try:
+        a, b = graph_people("a", "b")
+        limit = graph_limit(100)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    common = get_graph().mutual(a, b)
+    return jsonify({"a": a, "b": b, "count": len(common), "items": person_refs(common[:limit])})
+
+
+# Best connected people: degree and degree / (nodes - 1)
+@bp.route('/graph/centrality', methods=['GET'])
+@cached(*GRAPH_TABLES)
+@read_only
+def graph_centrality():
+    try:
+        limit = graph_limit()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    graph = get_graph()
+    top = graph.top_degree(limit)
+    nodes = graph.stats()["nodes"]
+    refs = {r["perkey"]: r for r in person_refs([k for k, _ in top])}
+    items = [
+        dict(refs[k], degree=d, centrality=round(d / max(nodes - 1, 1), 6))
+        for k, d in top if k in refs
+    ]
+    return jsonify({"nodes": nodes, "items": items})
+
+
+# Number of connected components and the `limit` largest (size and smallest perkey)
+@bp.route('/graph/components', methods=['GET'])
+@cached(*GRAPH_TABLES)
+@read_only
+def graph_components():
+    try:
+        limit = graph_limit()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    count, largest = get_graph().components(limit)
+    return jsonify({"count": count, "largest": [{"size": size, "perkey": k} for size, k in largest]})
+
+
+# The component a person belongs to: its size and the first `limit` members by distance
+@bp.route('/graph/components/<int:perkey>', methods=['GET'])
+@cached(*GRAPH_TABLES)
+@read_only
+def graph_component(perkey):
+    try:
+        limit = graph_limit(100)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    graph = get_graph()
+    if perkey not in graph:
+        abort(404)
+    size, members = graph.component(perkey, limit)
+    return jsonify({"perkey": perkey, "size": size, "members": person_refs(members)})
+
+
+# Size of the index and of its pending overlay
+@bp.route('/graph/stats', methods=['GET'])
+def graph_stats():
+    return jsonify(get_graph().stats())
+
+
+# =================================================
+# CHANGES API
+# =================================================
+# What changed after `since` (a seq from an earlier call), oldest first, one
+# entry per row: its current state or a tombstone (changelog.py). Without
+# `since`, just the current seq: take it before loading the lists to sync.
+@bp.route('/changes', methods=['GET'])
+@cached(*changelog.TABLES)
+@read_only
+def list_changes():
+    try:
+        since, limit = changes_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if since is None:
+        return jsonify({"items": [], "seq": changelog.head(db.session), "more": False})
+    return jsonify(changelog.changes_since(db.session, since, limit))
+
+
+def changes_args(args):
+    """(since or None, limit) for list_changes; raises ValueError."""
+    try:
+        since = args.get("since")
+        since = int(since) if since not in (None, "") else None
+        limit = int(args.get("limit", DEFAULT_PAGE_LIMIT))
+    except ValueError:
+        raise ValueError("since and limit must be integers")
+    if (since is not None and since < 0) or limit < 1:
+        raise ValueError("since must be >= 0 and limit positive")
+    return since, min(limit, MAX_PAGE_LIMIT)
+
+
+# =================================================
+# STREAM API
+# =================================================
+# Server-sent events: ?topics=changes,persons,notes,reminders,reminders.due,
+# person:<perkey> (default: all). Change events carry their seq as the event
+# id, so a reconnect resumes after Last-Event-ID. See stream.py.
+@bp.route('/stream', methods=['GET'])
+def stream_events():
+    try:
+        topics = stream.parse_topics(request.args.get("topics"))
+        last_seq = stream.parse_last_event_id(request.headers.get("Last-Event-ID"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    broker = stream.get_broker()
+    try:
+        sub = broker.subscribe(topics, last_seq)
+    except stream.StreamBusy:
+        return jsonify({"error": "too many open streams"}), 503
+    return Response(stream.sse(broker, sub), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# Open streams and events published
+@bp.route('/stream/stats', methods=['GET'])
+def stream_stats():
+    return jsonify(stream.get_broker().stats())
+
+
+# =================================================
+# METRICS API
+# =================================================
+# Prometheus text exposition of the request/SQL instrumentation (metrics.py).
+# 404 unless METRICS is on.
+@bp.route('/_metrics', methods=['GET'])
+def prometheus_metrics():
+    recorder = metrics.get_metrics()
+    if recorder is None:
+        abort(404)
+    return Response(recorder.render(get_cache()), mimetype="text/plain; version=0.0.4")
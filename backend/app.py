@@ -1,74 +1,211 @@
 # The code snippet is importing necessary modules and packages for setting up a Flask web application
 # with CORS (Cross-Origin Resource Sharing) support, an admin interface, and database management using
 # SQLAlchemy with SQLite. Here is a breakdown of each import statement:
+#
+# create_app() builds the app with a set of features (FEATURES, or the comma
+# separated CRM_FEATURES for the default): "api" is the JSON API with its
+# background services, "admin" the Flask-Admin views. Each feature's modules
+# are imported only when it is enabled, so an API-only worker never loads
+# Flask-Admin, and a script that only needs the database (features=()) gets
+# neither. `app` is the default app, created on first access.
+#
+#   CRM_FEATURES=api uvicorn asgi:app ...   # opt-in, see asgi.py
+#   python bench_startup.py    # what each feature set costs
 from flask import Flask
 from flask_cors import CORS
-from flask_admin import Admin
 from sqlalchemy import event
-from sqlalchemy.engine import Engine
 import sqlite3
 import os
+from db_roles import READER_BIND, set_reader_pragma
+from ORM_models import db
+import migrations
 
-app = Flask(__name__)
-app.secret_key = "secret"
-CORS(app)
+FEATURES = ("api", "admin")
 
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///app.sqlite"
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
-# import ORM models from ORM_models.py
-from ORM_models import db, Photo, Notes, SocialType, RelationshipType, Category, Person, SocialLinks, NotePhoto, NotedPerson, Relationships, Reminders, PerCat, RemPer, RemCat
-db.init_app(app)
-from api import bp as api_bp
+def default_features():
+    """CRM_FEATURES as a tuple; every feature when it isn't set."""
+    return tuple(f.strip() for f in os.environ.get("CRM_FEATURES", ",".join(FEATURES)).split(",") if f.strip())
 
 
-CORS(app, resources={r"/api/*": {"origins": "*"}})
-app.register_blueprint(api_bp)
+def create_app(features=None):
+    """A new app with `features` (default: default_features())."""
+    features = default_features() if features is None else tuple(features)
+    unknown = set(features) - set(FEATURES)
+    if unknown:
+        raise ValueError(f"unknown features: {', '.join(sorted(unknown))}")
+
+    app = Flask(__name__)
+    app.secret_key = "secret"
+    app.config["FEATURES"] = features
+    CORS(app)
+
+    # CRM_DATABASE_URI points the app at another database (bench_api.py uses it)
+    database_uri = os.environ.get("CRM_DATABASE_URI", "sqlite:///app.sqlite")
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_uri
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+
+    # opt-in request instrumentation served at /api/_metrics (metrics.py);
+    # CRM_PROFILE=1 also allows per-request cProfile dumps ("X-Profile: 1")
+    app.config["METRICS"] = os.environ.get("CRM_METRICS") == "1"
+    app.config["METRICS_PROFILE"] = os.environ.get("CRM_PROFILE") == "1"
+
+    # per-process state; see asgi.py for running several worker processes
+    app.config["RESPONSE_CACHE"] = os.environ.get("CRM_RESPONSE_CACHE", "1") != "0"
+
+    # API writes go through one writer thread that group-commits them
+    # (write_queue.py); CRM_WRITE_QUEUE=0 commits in the request thread instead
+    app.config["WRITE_QUEUE"] = os.environ.get("CRM_WRITE_QUEUE", "1") != "0"
+    app.config["WRITE_QUEUE_MAX_BATCH"] = 64
+
+    # SQLite performance profile, applied to every new connection (see set_sqlite_pragma)
+    app.config["SQLITE_PRAGMAS"] = {
+        "journal_mode": "WAL",          # readers don't block on the writer
+        "synchronous": "NORMAL",        # safe with WAL, fsync only at checkpoints
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64000,           # negative = KiB, so ~64 MB page cache
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,           # ms to wait for a lock before "database is locked"
+    }
+
+    # connection pools sized for a threaded server: a small writer pool (SQLite
+    # only allows one writer at a time) and a larger read-only pool for GETs
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_size": 5,
+        "max_overflow": 10,
+        "pool_timeout": 30,
+        "connect_args": {"check_same_thread": False},
+    }
+    app.config["SQLALCHEMY_BINDS"] = {
+        READER_BIND: {
+            "url": database_uri,
+            "pool_size": 16,
+            "max_overflow": 16,
+            "pool_timeout": 30,
+            "connect_args": {"check_same_thread": False},
+        },
+    }
+
+    db.init_app(app)
+
+    # ensures foreign keys are enforced for the app's database connections,
+    # and applies the SQLITE_PRAGMAS performance profile
+    def set_sqlite_pragma(dbapi_connection, connection_record):
+        if isinstance(dbapi_connection, sqlite3.Connection):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA foreign_keys = ON;")
+            for name, value in app.config.get("SQLITE_PRAGMAS", {}).items():
+                cursor.execute(f"PRAGMA {name} = {value};")
+            cursor.close()
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, "connect", set_sqlite_pragma)
+        # connections of the reader engine are query_only
+        event.listen(db.engines[READER_BIND], "connect", set_reader_pragma)
+
+    if "api" in features:
+        init_api(app)
+    if "admin" in features:
+        init_admin(app)
+
+    import serializers
+    import metrics
+    # orjson for jsonify() when it is installed (serializers.py)
+    serializers.init_app(app)
+    # after serializers: it wraps the JSON provider to time encoding
+    metrics.init_app(app)
+    return app
+
+
+def init_api(app):
+    """The /api blueprint and the services behind it."""
+    from api import bp as api_bp
+    import scheduler
+    import response_cache
+    import write_queue
+    import graph
+    import stream
+
+    CORS(app, resources={r"/api/*": {"origins": "*"}})
+    app.register_blueprint(api_bp)
+
+    with app.app_context():
+        # reminder notifications: "log" and/or "webhook" (REMINDER_WEBHOOK_URL);
+        # CRM_REMINDER_SINKS is a comma separated override, empty for none
+        sinks = os.environ.get("CRM_REMINDER_SINKS", "log")
+        app.config.setdefault("REMINDER_SINKS", [s.strip() for s in sinks.split(",") if s.strip()])
+        scheduler.init_app(app, db.engines[READER_BIND])
+        # /api/graph/*: relationship graph index, built on first use (graph.py)
+        graph.init_app(app, db.engines[READER_BIND])
+        # /api/stream: server-sent events fed from ChangeLog and the scheduler (stream.py)
+        stream.init_app(app, db.engines[READER_BIND])
+        # ETags + write-invalidated body cache for the JSON GETs (response_cache.py)
+        response_cache.init_app(app, db.metadata)
+        write_queue.init_app(app, db)
+
+
+# model -> view class (views.py) of the admin pages, in menu order
+ADMIN_VIEWS = (
+    ("Photo", "PhotoView"),
+    ("Notes", "NotesView"),
+    ("SocialType", "SocialTypeView"),
+    ("RelationshipType", "RelationshipTypeView"),
+    ("Category", "CategoryView"),
+    ("Person", "PersonView"),
+    ("SocialLinks", "SocialLinksView"),
+    ("NotePhoto", "NotePhotoView"),
+    ("NotedPerson", "NotedPersonView"),
+    ("Relationships", "RelationshipsView"),
+    ("Reminders", "RemindersView"),
+    ("PerCat", "PerCatView"),
+    ("RemPer", "RemPerView"),
+    ("RemCat", "RemCatView"),
+)
+
+
+def init_admin(app):
+    """Flask-Admin at /admin, one ModelView per table."""
+    from flask_admin import Admin
+    import ORM_models
+    import views
+
+    admin = Admin(app)
+    for model, view in ADMIN_VIEWS:
+        admin.add_view(getattr(views, view)(getattr(ORM_models, model), db.session))
+    return admin
 
-# ensures foreign keys are enforced for ALL database connections
-@event.listens_for(Engine, "connect")
-def set_sqlite_pragma(dbapi_connection, connection_record):
-    if isinstance(dbapi_connection, sqlite3.Connection):
-        cursor = dbapi_connection.cursor()
-        cursor.execute("PRAGMA foreign_keys = ON;")
-        cursor.close()
 
 def create_database():
-    path = os.path.join(os.path.dirname(__file__), "..", "Phase 2 - schema + queries", "create_schema.sql")
-    
-    with open(path, "r", encoding="utf-8") as f:
-        schema_sql = f.read()
+    """Create the app's database from the schema template (migrations.py)."""
+    migrations.create_database(db.engine.url.database)
 
+# brings an existing database up to the latest schema version
+def migrate_database():
     conn = db.engine.raw_connection()
     try:
-        conn.executescript(schema_sql)
-        conn.commit()
+        applied = migrations.run_migrations(conn)
     finally:
         conn.close()
+    if applied:
+        print(f"applied migrations: {applied}")
+
+
+def __getattr__(name):
+    # `from app import app`: the default app, built on first use
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# import views from views.py
-from views import PhotoView, NotesView, SocialTypeView, RelationshipTypeView, RelationshipTypeView, CategoryView, PersonView, SocialLinksView, NotePhotoView, NotedPersonView, RelationshipsView, RemindersView, PerCatView, RemPerView, RemCatView
-
-admin = Admin(app)
-admin.add_view(PhotoView(Photo, db.session))
-admin.add_view(NotesView(Notes, db.session))
-admin.add_view(SocialTypeView(SocialType, db.session))
-admin.add_view(RelationshipTypeView(RelationshipType, db.session))
-admin.add_view(CategoryView(Category, db.session))
-admin.add_view(PersonView(Person, db.session))
-admin.add_view(SocialLinksView(SocialLinks, db.session))
-admin.add_view(NotePhotoView(NotePhoto, db.session))
-admin.add_view(NotedPersonView(NotedPerson, db.session))
-admin.add_view(RelationshipsView(Relationships, db.session))
-admin.add_view(RemindersView(Reminders, db.session))
-admin.add_view(PerCatView(PerCat, db.session))
-admin.add_view(RemPerView(RemPer, db.session))
-admin.add_view(RemCatView(RemCat, db.session))
 
 if __name__ == "__main__":
+    app = create_app()
     with app.app_context():
-        if not os.path.exists("instance/app.sqlite"):
+        if not os.path.exists(db.engine.url.database):
             print("creating new database...")
             create_database()
+        else:
+            migrate_database()
 
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
@@ -0,0 +1,406 @@
+# ASGI entry point for the API -- opt-in; app.py on a threaded WSGI server
+# stays the default deployment.
+#
+#   uvicorn asgi:app --host 0.0.0.0 --port 8000 --workers 4
+#   hypercorn asgi:app --bind 0.0.0.0:8000 --workers 4
+#
+# What it buys is open connections that hold no thread, for many
+# /api/stream clients (bench_stream.py). For ordinary traffic it is not
+# faster: on bench_api.py's mixed load (10k rows, one CPU) it served
+# 154-158 req/s against WSGI's 170-182, with p95 latency about 195 ms
+# against 95, as the Flask requests pay for the bridge and the async reads
+# for aiosqlite's thread hop.
+#
+# The read-heavy GETs below run as async handlers on an aiosqlite engine
+# opened read-only like the reader bind, so a request waiting on SQLite
+# doesn't hold a thread and many can be in flight on one event loop. They
+# build the same statements and payloads as api.py (keyset_query,
+# person_search_args, person_full and the serializers) and go through the
+# same response cache, so ETags and cached bodies are shared with the WSGI
+# side. /api/stream (stream.py) is served here too, one coroutine per open
+# stream instead of a worker thread. Anything else -- writes, uploads,
+# export, the scheduler endpoints, and every error response -- is handed to
+# the Flask app through asgiref's WsgiToAsgi, which runs it on a worker
+# thread exactly as before (wsgi_bridge below).
+#
+# Needs: aiosqlite, asgiref and an ASGI server (requirements.txt). The
+# metrics.py instrumentation only sees the requests Flask serves. WSGI_THREADS
+# (default 32) bounds the Flask requests running at once.
+#
+# Several workers are several processes, each with its own response cache
+# and reminder scheduler. Run them with the in-process state that can't be
+# shared turned off, and notifications coming from one separate process:
+#
+#   CRM_RESPONSE_CACHE=0 CRM_REMINDER_SINKS= uvicorn asgi:app --workers 4 ...
+#   python app.py   # or any single process with the default sinks
+#
+# (the workers' /reminders/upcoming and /due then lag writes made in other
+# workers by up to REMINDER_SCHEDULER_RESYNC seconds). Workers that don't
+# serve /admin start faster with CRM_FEATURES=api (app.py); the "api"
+# feature is required here.
+import asyncio
+import contextvars
+import re
+from urllib.parse import parse_qsl
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_etags
+
+try:
+    from asgiref.sync import ThreadSensitiveContext
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:  # pragma: no cover - optional dependency
+    WsgiToAsgi = None
+
+from app import create_app
+from db_roles import READER_BIND, set_reader_pragma
+from ORM_models import db, Person, Notes, Reminders, RelationshipType, NotedPerson, RemPer
+import api
+import changelog
+import person_search
+import serializers as ser
+import stream
+from response_cache import request_tables
+
+
+class Route:
+    def __init__(self, pattern, tables, handler, include=None):
+        self.pattern = re.compile("^" + pattern + "$")
+        self.tables = tables
+        self.handler = handler
+        self.include = include   # ?include= part -> extra tables, as in @cached
+
+
+# -------------------------------------------------
+# Async handlers: return the payload, or None to let Flask answer
+# -------------------------------------------------
+async def list_persons(session, args):
+    try:
+        serializer, stmt, limit, summary = api.person_list_query(args)
+    except ValueError:
+        return None
+    return api.person_list_result(serializer, (await session.execute(stmt)).all(), limit, summary)
+
+
+async def search_persons(session, args):
+    try:
+        criteria, limit, offset = api.person_search_args(args)
+    except ValueError:
+        return None
+    rows = await session.run_sync(person_search.search, limit=limit + 1, offset=offset, **criteria)
+    return api.person_search_result(rows, limit, offset)
+
+
+async def get_person(session, args, perkey):
+    return await _one(session, ser.PERSON, ser.PERSON.query().where(Person.perkey == perkey))
+
+
+async def get_person_full(session, args, perkey):
+    try:
+        parts = api.person_parts(args.get("include"))
+    except ValueError:
+        return None
+    # the aggregate walks loaded relationships; run_sync gives it a sync session
+    return await session.run_sync(api.person_full, perkey, parts)
+
+
+async def list_notes(session, args):
+    return await _keyset(session, ser.NOTE, "notekey", args)
+
+
+async def get_note(session, args, id):
+    return await _one(session, ser.NOTE, ser.NOTE.query().where(Notes.notekey == id))
+
+
+async def list_reminders(session, args):
+    return await _keyset(session, ser.REMINDER, "remkey", args)
+
+
+async def list_person_notes(session, args, perkey):
+    if not await _person_exists(session, perkey):
+        return None
+    rows = await session.execute(
+        ser.NOTE_SUMMARY.query().join(NotedPerson, NotedPerson.notekey == Notes.notekey)
+        .where(NotedPerson.perkey == perkey)
+    )
+    return ser.NOTE_SUMMARY.rows(rows)
+
+
+async def list_person_reminders(session, args, perkey):
+    if not await _person_exists(session, perkey):
+        return None
+    rows = await session.execute(
+        ser.REMINDER.query().join(RemPer, RemPer.remkey == Reminders.remkey).where(RemPer.perkey == perkey)
+    )
+    return ser.REMINDER.rows(rows)
+
+
+async def get_person_note(session, args, perkey, notekey):
+    return await _one(session, ser.NOTE_SUMMARY, (
+        ser.NOTE_SUMMARY.query().join(NotedPerson, NotedPerson.notekey == Notes.notekey)
+        .where(NotedPerson.perkey == perkey, NotedPerson.notekey == notekey)
+    ))
+
+
+async def get_person_reminder(session, args, perkey, remkey):
+    return await _one(session, ser.REMINDER, (
+        ser.REMINDER.query().join(RemPer, RemPer.remkey == Reminders.remkey)
+        .where(RemPer.perkey == perkey, RemPer.remkey == remkey)
+    ))
+
+
+async def list_relationship_types(session, args):
+    return ser.RELATIONSHIP_TYPE.rows(await session.execute(ser.RELATIONSHIP_TYPE.query()))
+
+
+async def list_changes(session, args):
+    try:
+        since, limit = api.changes_args(args)
+    except ValueError:
+        return None
+    if since is None:
+        return {"items": [], "seq": await session.run_sync(changelog.head), "more": False}
+    return await session.run_sync(changelog.changes_since, since, limit)
+
+
+async def _keyset(session, serializer, pk_name, args):
+    try:
+        serializer, stmt, limit = api.keyset_query(serializer, pk_name, args)
+    except ValueError:
+        return None
+    return api.keyset_result(serializer, (await session.execute(stmt)).all(), limit)
+
+
+async def _one(session, serializer, stmt):
+    row = (await session.execute(stmt)).first()
+    return None if row is None else serializer.row(row)
+
+
+async def _person_exists(session, perkey):
+    return (await session.execute(select(Person.perkey).where(Person.perkey == perkey))).first() is not None
+
+
+# same tables as the @cached decorators in api.py
+ROUTES = [
+    Route(r"/api/persons", ("Person",), list_persons, api.PERSON_LIST_INCLUDES),
+    Route(r"/api/persons/search", ("Person", "Relationships", "RelationshipType"), search_persons),
+    Route(r"/api/persons/(?P<perkey>\d+)", ("Person",), get_person),
+    Route(r"/api/persons/(?P<perkey>\d+)/full", tuple(api.PERSON_FULL_TABLES), get_person_full),
+    Route(r"/api/notes", ("Notes",), list_notes),
+    Route(r"/api/notes/(?P<id>\d+)", ("Notes",), get_note),
+    Route(r"/api/reminders", ("Reminders",), list_reminders),
+    Route(r"/api/persons/(?P<perkey>\d+)/notes", ("Person", "NotedPerson", "Notes"), list_person_notes),
+    Route(r"/api/persons/(?P<perkey>\d+)/reminders", ("Person", "remPer", "Reminders"), list_person_reminders),
+    Route(r"/api/persons/(?P<perkey>\d+)/notes/(?P<notekey>\d+)", ("NotedPerson", "Notes"), get_person_note),
+    Route(r"/api/persons/(?P<perkey>\d+)/reminders/(?P<remkey>\d+)", ("remPer", "Reminders"), get_person_reminder),
+    Route(r"/api/relationship_types", ("RelationshipType",), list_relationship_types),
+    Route(r"/api/changes", changelog.TABLES, list_changes),
+]
+
+
+# -------------------------------------------------
+# The ASGI application
+# -------------------------------------------------
+def wsgi_bridge(wsgi_app, threads):
+    """asgiref's WsgiToAsgi, each call on a thread of its own, at most
+    `threads` at once. Unwrapped it runs every WSGI call on one shared
+    thread, which would serialize the Flask side; ThreadSensitiveContext
+    gives each request its own executor instead."""
+    bridge = WsgiToAsgi(_closing(wsgi_app))
+    slots = asyncio.Semaphore(threads)
+
+    async def run(scope, receive, send):
+        async with ThreadSensitiveContext():
+            await bridge(scope, receive, send)
+
+    async def call(scope, receive, send):
+        async with slots:
+            # in an empty context: sync_to_async hands the worker's context
+            # back to the caller, and a keep-alive connection's next request
+            # would inherit the finished call's executor
+            await contextvars.Context().run(asyncio.ensure_future, run(scope, receive, send))
+
+    return call
+
+
+def _closing(wsgi_app):
+    """`wsgi_app` with its response closed once the bridge is done with it
+    (WsgiToAsgi iterates the response but never calls close())."""
+    def app(environ, start_response):
+        result = wsgi_app(environ, start_response)
+        try:
+            yield from result
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+    return app
+
+
+class App:
+    def __init__(self, flask_app):
+        if WsgiToAsgi is None:
+            raise RuntimeError("asgi.py needs asgiref: pip install asgiref")
+        if "api" not in flask_app.config["FEATURES"]:
+            raise RuntimeError("asgi.py serves the API: CRM_FEATURES has to include \"api\"")
+        self.flask_app = flask_app
+        self.wsgi = wsgi_bridge(flask_app, flask_app.config.get("WSGI_THREADS", 32))
+        self.engine = None
+        self.sessions = None
+
+    def start(self):
+        if self.engine is not None:
+            return
+        with self.flask_app.app_context():
+            url = db.engines[READER_BIND].url.set(drivername="sqlite+aiosqlite")
+        options = self.flask_app.config["SQLALCHEMY_BINDS"][READER_BIND]
+        self.engine = create_async_engine(
+            url,
+            pool_size=options.get("pool_size", 16),
+            max_overflow=options.get("max_overflow", 16),
+            pool_timeout=options.get("pool_timeout", 30),
+        )
+        event.listen(self.engine.sync_engine, "connect", self._connect)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        # Flask starts it on its first request, which may never come here
+        self.flask_app.extensions["reminder_scheduler"].start()
+
+    def _connect(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in self.flask_app.config.get("SQLITE_PRAGMAS", {}).items():
+            if name != "journal_mode":  # a database setting; the writer owns it
+                cursor.execute(f"PRAGMA {name} = {value};")
+        cursor.close()
+        set_reader_pragma(dbapi_connection, connection_record)
+
+    async def stop(self):
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
+        self.flask_app.extensions["reminder_scheduler"].stop()
+        self.flask_app.extensions["event_broker"].stop()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] == "http" and scope["method"] == "GET":
+            if scope["path"] == "/api/stream" and await self._stream(scope, receive, send):
+                return
+            for route in ROUTES:
+                m = route.pattern.match(scope["path"])
+                if m is not None:
+                    if await self._serve(route, m, scope, send):
+                        return
+                    break
+        await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.stop()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _serve(self, route, match, scope, send):
+        """Answer from the cache or the handler; False hands the request to Flask."""
+        self.start()
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        query = scope["query_string"].decode("latin-1")
+        cache = self.flask_app.extensions.get("response_cache")
+
+        args = MultiDict(parse_qsl(query, keep_blank_values=True))
+        tables = request_tables(route.tables, route.include, args)
+        body = etag = None
+        if cache is not None:
+            versions = cache.versions(tables)
+            etag = cache.etag(versions)
+            if parse_etags(headers.get("if-none-match")).contains_weak(etag):
+                await self._respond(send, 304, None, etag, headers)
+                return True
+            key = scope["path"] + "?" + query   # Flask's request.full_path
+            entry = cache.get(key, versions)
+            if entry is not None:
+                body = entry[2]
+
+        if body is None:
+            params = {name: int(value) for name, value in match.groupdict().items()}
+            async with self.sessions() as session:
+                payload = await route.handler(session, args, **params)
+            if payload is None:
+                return False
+            body = (self.flask_app.json.dumps(payload) + "\n").encode()
+            if cache is not None:
+                cache.put(key, tables, versions, etag, body)
+
+        await self._respond(send, 200, body, etag, headers)
+        return True
+
+    async def _stream(self, scope, receive, send):
+        """Server-sent events on the event loop (stream.py); False hands the
+        request to Flask, which answers the errors."""
+        self.start()
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        args = MultiDict(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True))
+        broker = self.flask_app.extensions["event_broker"]
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        try:
+            topics = stream.parse_topics(args.get("topics"))
+            sub = broker.subscribe(topics, stream.parse_last_event_id(headers.get("last-event-id")),
+                                   on_ready=lambda: loop.call_soon_threadsafe(ready.set))
+        except (ValueError, stream.StreamBusy):
+            return False
+        disconnected = asyncio.ensure_future(self._disconnect(receive))
+        try:
+            response_headers = [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache"),
+                                (b"x-accel-buffering", b"no")]
+            if "origin" in headers:
+                response_headers.append((b"access-control-allow-origin", b"*"))
+            await send({"type": "http.response.start", "status": 200, "headers": response_headers})
+            await send({"type": "http.response.body", "body": broker.hello(sub), "more_body": True})
+            while not disconnected.done():
+                waiter = asyncio.ensure_future(ready.wait())
+                await asyncio.wait({waiter, disconnected}, timeout=broker.heartbeat,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                if disconnected.done():
+                    break
+                ready.clear()
+                body = sub.take() or stream.HEARTBEAT
+                await send({"type": "http.response.body", "body": body, "more_body": True})
+        except OSError:
+            pass   # the connection went away mid-send
+        finally:
+            disconnected.cancel()
+            broker.unsubscribe(sub)
+        return True
+
+    @staticmethod
+    async def _disconnect(receive):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    async def _respond(self, send, status, body, etag, request_headers):
+        headers = []
+        if body is not None:
+            headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        if etag is not None:
+            headers += [(b"etag", f'W/"{etag}"'.encode()), (b"cache-control", b"no-cache")]
+        if "origin" in request_headers:  # what flask-cors answers for /api/*
+            headers.append((b"access-control-allow-origin", b"*"))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body or b""})
+
+
+
+def __getattr__(name):
+    # `asgi:app`: built on first access, so importing App doesn't build an app
+    if name == "app":
+        globals()["app"] = App(create_app())
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,56 @@
+# Builds thumbnails for every photo already in the blob store.
+#
+#   python backfill_thumbnails.py [--workers N]
+#
+# Each distinct content hash is rendered once, in parallel across worker
+# processes; hashes whose thumbnails are all cached are skipped.
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from app import create_app
+from ORM_models import db, Photo
+from thumbnails import get_pipeline, render_thumbnails
+
+
+def backfill(workers=None):
+    pipeline = get_pipeline()
+    if not pipeline.enabled:
+        print("Pillow is not installed; nothing to do")
+        return 0
+
+    digests = [
+        d for (d,) in db.session.query(Photo.contentHash).filter(Photo.contentHash.isnot(None)).distinct()
+        if not pipeline.is_complete(d)
+    ]
+    print(f"{len(digests)} photos need thumbnails")
+
+    started = time.perf_counter()
+    done = failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(render_thumbnails, pipeline.store.path(d), d, pipeline.cache_root): d
+            for d in digests
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+                done += 1
+            except Exception as e:
+                failed += 1
+                print(f"failed {futures[future]}: {e}")
+            if (done + failed) % 100 == 0:
+                print(f"{done + failed}/{len(digests)}...")
+
+    elapsed = time.perf_counter() - started
+    print(f"done: {done} rendered, {failed} failed in {elapsed:.1f}s")
+    return done
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build cached thumbnails for existing photos.")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    with create_app(features=()).app_context():
+        backfill(args.workers)
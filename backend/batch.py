@@ -0,0 +1,310 @@
+# Batch create/update/delete for persons, notes, reminders and their
+# junction rows, applied in one transaction.
+#
+# Request body for POST /api/batch:
+#
+#   {"atomic": false,
+#    "operations": [
+#      {"op": "create", "entity": "person", "ref": "p1", "data": {"firstName": "Ada", "lastName": "L"}},
+#      {"op": "create", "entity": "note", "ref": "n1", "data": {"title": "Met Ada"}},
+#      {"op": "create", "entity": "notedPerson", "data": {"perkey": "$p1", "notekey": "$n1"}},
+#      {"op": "update", "entity": "reminder", "id": 7, "data": {"completed": true}},
+#      {"op": "delete", "entity": "perCat", "data": {"perkey": 3, "catkey": 1}}
+#    ]}
+#
+# "$name" values refer to the key of an item created earlier in the batch with
+# "ref": "name". Every referenced key is checked with one IN query per table
+# before anything is written. Invalid items get an error result; with
+# "atomic": true any invalid item rejects the whole batch.
+#
+# Items are applied in dependency order, not list order: entity creates,
+# entity updates, junction creates, junction deletes, entity deletes.
+from sqlalchemy import delete, func, insert, select, tuple_, update
+
+from ORM_models import db, Person, Notes, Reminders, Category, Photo, NotedPerson, RemPer, PerCat
+
+MAX_OPERATIONS = 5000
+
+# entity -> (model, primary key, {api field: column})
+ENTITIES = {
+    "person": (Person, "perkey", {
+        "firstName": "firstName", "lastName": "lastName", "birthday": "birthday",
+        "location": "location", "photokey": "photokey",
+    }),
+    "note": (Notes, "notekey", {"title": "title", "content": "content"}),
+    "reminder": (Reminders, "remkey", {
+        "label": "title", "description": "description", "due_date": "dueDate", "completed": "completed",
+    }),
+}
+
+# junction -> (model, {column: entity it references})
+JUNCTIONS = {
+    "notedPerson": (NotedPerson, {"perkey": "person", "notekey": "note"}),
+    "remPer": (RemPer, {"remkey": "reminder", "perkey": "person"}),
+    "perCat": (PerCat, {"perkey": "person", "catkey": "category"}),
+}
+
+# lookup tables that can be referenced but not edited through the batch
+REFERENCED = {
+    "category": (Category, "catkey"),
+    "photo": (Photo, "photokey"),
+}
+
+# required fields on create (the NOT NULL columns)
+REQUIRED = {
+    "person": ["firstName", "lastName"],
+    "note": ["title"],
+    "reminder": ["label"],
+}
+
+
+class BatchError(ValueError):
+    pass
+
+
+def missing_keys(model, pk_name, keys):
+    """The subset of `keys` with no row in `model` (one IN query)."""
+    keys = set(keys)
+    if not keys:
+        return set()
+    pk = getattr(model, pk_name)
+    found = set(db.session.scalars(select(pk).where(pk.in_(keys))))
+    return keys - found
+
+
+def _table_for(entity):
+    if entity in ENTITIES:
+        return ENTITIES[entity][0], ENTITIES[entity][1]
+    return REFERENCED[entity]
+
+
+def _is_ref(value):
+    return isinstance(value, str) and value.startswith("$")
+
+
+def _parse(index, item, refs):
+    """Validate the shape of one operation; returns a normalized dict."""
+    if not isinstance(item, dict):
+        raise BatchError("operation must be an object")
+    op = item.get("op")
+    entity = item.get("entity")
+    data = item.get("data") or {}
+    if op not in ("create", "update", "delete"):
+        raise BatchError("op must be create, update or delete")
+    if not isinstance(data, dict):
+        raise BatchError("data must be an object")
+
+    if entity in ENTITIES:
+        _model, _pk, fields = ENTITIES[entity]
+        unknown = [f for f in data if f not in fields]
+        if unknown:
+            raise BatchError("unknown fields: " + ", ".join(unknown))
+        if data.get("photokey") is not None:
+            try:
+                data = dict(data, photokey=int(data["photokey"]))
+            except (TypeError, ValueError):
+                raise BatchError("photokey must be an integer")
+        parsed = {"index": index, "op": op, "entity": entity, "data": data}
+        if op == "create":
+            missing = [f for f in REQUIRED[entity] if f not in data]
+            if missing:
+                raise BatchError("missing fields: " + ", ".join(missing))
+            ref = item.get("ref")
+            if ref is not None:
+                if ref in refs:
+                    raise BatchError(f"duplicate ref {ref!r}")
+                refs[ref] = (entity, index)
+            parsed["ref"] = ref
+        else:
+            try:
+                parsed["id"] = int(item.get("id"))
+            except (TypeError, ValueError):
+                raise BatchError("id required")
+            if op == "update" and not data:
+                raise BatchError("nothing to update")
+        return parsed
+
+    if entity in JUNCTIONS:
+        if op == "update":
+            raise BatchError("junction rows can only be created or deleted")
+        _model, columns = JUNCTIONS[entity]
+        key = {}
+        for col, target in columns.items():
+            value = data.get(col)
+            if _is_ref(value):
+                ref_entity = refs.get(value[1:], (None,))[0]
+                if ref_entity != target:
+                    raise BatchError(f"{col}: {value} is not a {target} created earlier in the batch")
+            else:
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
+                    raise BatchError(f"{col} required")
+            key[col] = value
+        return {"index": index, "op": op, "entity": entity, "key": key}
+
+    raise BatchError("unknown entity: " + str(entity))
+
+
+def _check_references(parsed, results):
+    """Mark items whose existing keys are missing. One IN query per table."""
+    wanted = {}  # entity -> set of keys that must exist
+
+    def need(entity, key):
+        wanted.setdefault(entity, set()).add(key)
+
+    for item in parsed:
+        if item["entity"] in ENTITIES:
+            if item["op"] != "create":
+                need(item["entity"], item["id"])
+            photokey = item["data"].get("photokey")
+            if item["entity"] == "person" and photokey is not None:
+                need("photo", photokey)
+        else:
+            columns = JUNCTIONS[item["entity"]][1]
+            for col, value in item["key"].items():
+                if not _is_ref(value):
+                    need(columns[col], value)
+
+    missing = {}
+    for entity, keys in wanted.items():
+        model, pk_name = _table_for(entity)
+        missing[entity] = missing_keys(model, pk_name, keys)
+
+    ok = []
+    for item in parsed:
+        problems = []
+        if item["entity"] in ENTITIES:
+            if item["op"] != "create" and item["id"] in missing.get(item["entity"], ()):
+                problems.append(f"{item['entity']} {item['id']} not found")
+            photokey = item["data"].get("photokey")
+            if photokey is not None and photokey in missing.get("photo", ()):
+                problems.append(f"photo {photokey} not found")
+        else:
+            columns = JUNCTIONS[item["entity"]][1]
+            for col, value in item["key"].items():
+                if not _is_ref(value) and value in missing.get(columns[col], ()):
+                    problems.append(f"{columns[col]} {value} not found")
+        if problems:
+            results[item["index"]] = {"index": item["index"], "status": "error", "error": "; ".join(problems)}
+        else:
+            ok.append(item)
+    return ok
+
+
+def _columns(entity, data):
+    fields = ENTITIES[entity][2]
+    return {fields[k]: v for k, v in data.items()}
+
+
+def apply_batch(operations, atomic=False):
+    """Validate and apply `operations`; returns (results, applied). The caller commits."""
+    if not isinstance(operations, list) or not operations:
+        raise BatchError("operations must be a non-empty list")
+    if len(operations) > MAX_OPERATIONS:
+        raise BatchError(f"at most {MAX_OPERATIONS} operations per batch")
+
+    results = [None] * len(operations)
+    refs = {}
+    parsed = []
+    for index, item in enumerate(operations):
+        try:
+            parsed.append(_parse(index, item, refs))
+        except BatchError as e:
+            results[index] = {"index": index, "status": "error", "error": str(e)}
+
+    parsed = _check_references(parsed, results)
+
+    # a junction pointing at a ref whose create failed can't be applied either
+    failed_refs = {ref for ref, (_entity, index) in refs.items() if results[index] is not None}
+    for item in list(parsed):
+        if "key" in item and any(_is_ref(v) and v[1:] in failed_refs for v in item["key"].values()):
+            results[item["index"]] = {"index": item["index"], "status": "error", "error": "referenced create failed"}
+            parsed.remove(item)
+
+    if atomic and any(r is not None for r in results):
+        return results, False
+
+    keys = {}  # ref -> created key
+    phases = {name: [] for name in ("create", "update", "link", "unlink", "delete")}
+    for item in parsed:
+        if item["entity"] in ENTITIES:
+            phases[item["op"]].append(item)
+        else:
+            phases["link" if item["op"] == "create" else "unlink"].append(item)
+
+    # 1. entity creates: one multi-row INSERT ... RETURNING per entity
+    for entity, (model, pk_name, _fields) in ENTITIES.items():
+        items = [i for i in phases["create"] if i["entity"] == entity]
+        if not items:
+            continue
+        rows = [_columns(entity, i["data"]) for i in items]
+        new_keys = db.session.scalars(
+            insert(model).returning(getattr(model, pk_name), sort_by_parameter_order=True),
+            rows,
+        ).all()
+        for item, key in zip(items, new_keys):
+            if item["ref"] is not None:
+                keys[item["ref"]] = key
+            results[item["index"]] = {"index": item["index"], "status": "created", "id": key}
+
+    # 2. entity updates: executemany UPDATE by primary key
+    now = db.session.scalar(select(func.current_timestamp()))
+    for entity, (model, pk_name, _fields) in ENTITIES.items():
+        items = [i for i in phases["update"] if i["entity"] == entity]
+        if not items:
+            continue
+        rows = []
+        for i in items:
+            row = _columns(entity, i["data"])
+            row[pk_name] = i["id"]
+            if entity == "note":
+                row["lastModified"] = now
+            rows.append(row)
+        db.session.execute(update(model), rows)
+        for i in items:
+            results[i["index"]] = {"index": i["index"], "status": "updated", "id": i["id"]}
+
+    # 3./4. junction rows
+    for entity, (model, columns) in JUNCTIONS.items():
+        cols = list(columns)
+        for phase in ("link", "unlink"):
+            items = [i for i in phases[phase] if i["entity"] == entity]
+            if not items:
+                continue
+            pairs = [
+                tuple(keys[v[1:]] if _is_ref(v) else v for v in (i["key"][c] for c in cols))
+                for i in items
+            ]
+            target = tuple_(*[getattr(model, c) for c in cols])
+            existing = {
+                tuple(row)
+                for row in db.session.execute(select(*[getattr(model, c) for c in cols]).where(target.in_(pairs)))
+            }
+
+            if phase == "link":
+                new = list(dict.fromkeys(p for p in pairs if p not in existing))
+                if new:
+                    db.session.execute(insert(model), [dict(zip(cols, p)) for p in new])
+                for i, p in zip(items, pairs):
+                    status = "exists" if p in existing else "created"
+                    results[i["index"]] = {"index": i["index"], "status": status, "key": dict(zip(cols, p))}
+            else:
+                gone = [p for p in pairs if p in existing]
+                if gone:
+                    db.session.execute(delete(model).where(target.in_(gone)))
+                for i, p in zip(items, pairs):
+                    status = "deleted" if p in existing else "not_found"
+                    results[i["index"]] = {"index": i["index"], "status": status, "key": dict(zip(cols, p))}
+
+    # 5. entity deletes (cascades take the junction rows with them)
+    for entity, (model, pk_name, _fields) in ENTITIES.items():
+        items = [i for i in phases["delete"] if i["entity"] == entity]
+        if not items:
+            continue
+        pk = getattr(model, pk_name)
+        db.session.execute(delete(model).where(pk.in_([i["id"] for i in items])))
+        for i in items:
+            results[i["index"]] = {"index": i["index"], "status": "deleted", "id": i["id"]}
+
+    return results, True
@@ -0,0 +1,86 @@
+# Benchmark: the Flask-Admin list pages (views.py) on synthetic data.
+#
+#   python bench_admin.py [--rows 1000000] [--runs 10] [--page 10000]
+#
+# Uses the cached dataset of bench_api.py (instance/bench/), migrated on a
+# scratch copy. For each admin view, the median of `--runs` requests of:
+#   first  - the first list page
+#   next   - page --page through the "next" link of page --page - 1 (keyset)
+#   jump   - page --page requested directly (OFFSET)
+#   form   - the create form
+# and `count`, a COUNT(*) of the table: what every list page used to run.
+# Tables with fewer pages are paged to their last page.
+import argparse
+import datetime
+import os
+import re
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from bench_api import dataset, load_app
+from migrations import run_migrations
+
+
+def timed(fn, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def get(client, url):
+    response = client.get(url)
+    assert response.status_code == 200, (url, response.status_code)
+    return response.get_data(as_text=True)
+
+
+def main(rows, runs, page, seed, base_date):
+    source, photos = dataset(rows, seed, base_date)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.sqlite")
+        shutil.copyfile(source, db_path)
+        conn = sqlite3.connect(db_path)
+        run_migrations(conn)   # datasets cached before TableStats existed
+        app = load_app(db_path, photos, features=("admin",))
+        client = app.test_client()
+        admin = app.extensions["admin"][0]
+
+        print(f"{'view':18} {'rows':>9} {'page':>6} {'first':>9} {'next':>9} {'jump':>9} {'form':>9} {'count':>9}")
+        for view in admin._views:
+            if not hasattr(view, "model"):
+                continue
+            table = view.model.__tablename__
+            n = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+            base = f"/admin/{view.endpoint}/"
+            p = max(0, min(page, (n - 1) // view.page_size))
+            first_ms = timed(lambda: get(client, base), runs)
+            jump_ms = timed(lambda: get(client, f"{base}?page={p}"), runs)
+            next_ms = None
+            if p > 0:
+                links = re.findall(rf'href="([^"]*page={p}&amp;after=[^"]*)"', get(client, f"{base}?page={p - 1}"))
+                if links:
+                    url = links[0].replace("&amp;", "&")
+                    next_ms = timed(lambda: get(client, url), runs)
+            form_ms = timed(lambda: get(client, f"{base}new/"), runs)
+            count_ms = timed(lambda: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone(), runs)
+            next_col = f"{next_ms:>7.1f}ms" if next_ms is not None else f"{'-':>9}"
+            print(f"{view.endpoint:18} {n:>9} {p:>6} {first_ms:>7.1f}ms {next_col} {jump_ms:>7.1f}ms "
+                  f"{form_ms:>7.1f}ms {count_ms:>7.1f}ms")
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the admin list pages.")
+    parser.add_argument("--rows", type=int, default=1000000, help="dataset size (see synth_data.py)")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--page", type=int, default=10000, help="the deep page to time")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--base-date", type=datetime.date.fromisoformat,
+                        help="dataset base date (default: today)")
+    args = parser.parse_args()
+    main(args.rows, args.runs, args.page, args.seed, args.base_date or datetime.date.today())
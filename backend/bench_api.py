@@ -0,0 +1,555 @@
+# Benchmark harness for the JSON API on synthetic data (synth_data.py).
+#
+#   python bench_api.py [--rows 100000] [--runs 50] [--threads 8] [--duration 10] [--server wsgi|asgi]
+#                       [--save BASELINE.json] [--baseline BASELINE.json] [--threshold 1.25]
+#                       [--no-load] [--no-sql] [--no-response-cache] [--no-write-queue] [--metrics]
+#
+# Three phases against a scratch copy of a cached dataset (instance/bench/):
+#   routes - every api.* route through the Flask test client, `--runs` requests
+#            each, reads first and writes after; p50/p95/p99 latency and req/s
+#   load   - the app behind a threaded werkzeug server (or asgi.py on uvicorn
+#            with --server asgi) and `--threads` client threads sending a
+#            mix of the load-safe cases for `--duration` s
+#   sql    - the SELECTs of SQL_queries.sql, median of `--runs` executions
+# plus the process's peak RSS. --save writes the results as JSON; --baseline
+# compares p95 latencies and load throughput against such a file and exits 1
+# when anything got slower than --threshold times the baseline.
+#
+# Routes without a case below are reported (and fail --baseline runs), so a new
+# endpoint has to be added here to be covered.
+import argparse
+import datetime
+import http.client
+import io
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+from check_query_plans import split_statements
+from migrations import run_migrations
+import synth_data
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "bench")
+QUERIES_PATH = os.path.join(os.path.dirname(__file__), "..", "Phase 2 - schema + queries", "SQL_queries.sql")
+
+NOISE_MS = 1.0            # p95 differences below this are never a regression
+SAMPLE_SIZE = 2000        # keys drawn from the dataset for path parameters
+
+# the '?' parameters of the SQL_queries.sql SELECTs, as a query for the row
+# of values, so they name data that exists in the dataset
+SQL_PARAMS = {
+    "Q3": "SELECT firstName, lastName FROM Person JOIN NotedPerson USING (perkey) LIMIT 1",
+    "Q9": "SELECT 5, 'Merced%', 'Friend', 'Friend'",
+    "Q18": "SELECT 'Friend'",
+    "Q24": "SELECT perkey FROM remPer LIMIT 1",
+    "Q27": "SELECT 'Soccer Player'",
+    "Q30": "SELECT 'Soccer Player'",
+}
+
+# rule + method identify the route; build(keys, i) -> (path, client kwargs)
+Case = namedtuple("Case", "rule method build load runs", defaults=(True, None))
+
+
+def _json(path, body):
+    return path, {"json": body}
+
+
+def _import_csv(keys, i):
+    csv = "firstName,lastName,location,categories\n" + "".join(
+        f"Bench{i}_{n},Import,\"Merced, CA\",Work\n" for n in range(20)
+    )
+    return "/api/import?format=csv", {
+        "data": {"file": (io.BytesIO(csv.encode()), "contacts.csv")},
+        "content_type": "multipart/form-data",
+    }
+
+
+def _batch(keys, i):
+    return _json("/api/batch", {"operations": [
+        {"op": "create", "entity": "person", "ref": "p", "data": {"firstName": "Batch", "lastName": str(i)}},
+        {"op": "create", "entity": "note", "ref": "n", "data": {"title": "batch note"}},
+        {"op": "create", "entity": "notedPerson", "data": {"perkey": "$p", "notekey": "$n"}},
+        {"op": "update", "entity": "reminder", "id": keys.pick("remkey", i), "data": {"completed": True}},
+    ]})
+
+
+def _relate(keys, i):
+    perkey1, perkey2 = keys.take("unrelated")
+    return _json(f"/api/persons/{perkey1}/relationships", {"perkey2": perkey2, "relTypeKey": 1})
+
+
+READ_CASES = [
+    Case("/api/persons", "GET", lambda k, i: ("/api/persons?limit=50", {})),
+    Case("/api/persons/search", "GET", lambda k, i: (
+        f"/api/persons/search?birthMonth={i % 12 + 1}&relType=Friend&location=S", {})),
+    Case("/api/persons/<int:perkey>", "GET", lambda k, i: (f"/api/persons/{k.pick('perkey', i)}", {})),
+    Case("/api/persons/<int:perkey>/full", "GET", lambda k, i: (f"/api/persons/{k.pick('perkey', i)}/full", {})),
+    Case("/api/search", "GET", lambda k, i: (f"/api/search?q={synth_data.WORDS[i % len(synth_data.WORDS)]}", {})),
+    Case("/api/export", "GET", lambda k, i: ("/api/export?format=ndjson", {}), load=False, runs=3),
+    Case("/api/photos/<int:photokey>", "GET", lambda k, i: (f"/api/photos/{k.pick('photokey', i)}", {})),
+    Case("/api/notes", "GET", lambda k, i: ("/api/notes?limit=50", {})),
+    Case("/api/notes/<int:id>", "GET", lambda k, i: (f"/api/notes/{k.pick('notekey', i)}", {})),
+    Case("/api/reminders", "GET", lambda k, i: ("/api/reminders?limit=50", {})),
+    Case("/api/reminders/upcoming", "GET", lambda k, i: ("/api/reminders/upcoming?limit=50", {})),
+    Case("/api/reminders/due", "GET", lambda k, i: ("/api/reminders/due?window=7d&limit=50", {})),
+    Case("/api/persons/<int:perkey>/reminders", "GET", lambda k, i: (f"/api/persons/{k.pick('perkey', i)}/reminders", {})),
+    Case("/api/persons/<int:perkey>/notes", "GET", lambda k, i: (f"/api/persons/{k.pick('perkey', i)}/notes", {})),
+    # the hubs: the largest relationship lists in the graph
+    Case("/api/persons/<int:perkey>/relationships", "GET", lambda k, i: (
+        f"/api/persons/{k.pick('hub', i)}/relationships", {})),
+    Case("/api/persons/<int:perkey>/graph", "GET", lambda k, i: (f"/api/persons/{k.pick('perkey', i)}/graph?depth=2", {})),
+    Case("/api/relationship_types", "GET", lambda k, i: ("/api/relationship_types", {})),
+    # the in-memory graph index (graph.py); the first request builds it
+    Case("/api/graph/path", "GET", lambda k, i: (
+        f"/api/graph/path?from={k.pick('perkey', i)}&to={k.pick('perkey', i + 7)}", {})),
+    Case("/api/graph/mutual", "GET", lambda k, i: (f"/api/graph/mutual?a={k.pick('hub', i)}&b={k.pick('hub', i + 1)}", {})),
+    Case("/api/graph/centrality", "GET", lambda k, i: ("/api/graph/centrality?limit=20", {})),
+    Case("/api/graph/components", "GET", lambda k, i: ("/api/graph/components?limit=20", {})),
+    Case("/api/graph/components/<int:perkey>", "GET", lambda k, i: (
+        f"/api/graph/components/{k.pick('perkey', i)}?limit=100", {})),
+    Case("/api/graph/stats", "GET", lambda k, i: ("/api/graph/stats", {})),
+    # the change feed (changelog.py); reads run before the writes, so from 0
+    Case("/api/changes", "GET", lambda k, i: ("/api/changes?since=0&limit=100", {})),
+    Case("/api/stream/stats", "GET", lambda k, i: ("/api/stream/stats", {})),
+    Case("/api/persons/<int:perkey>/notes/<int:notekey>", "GET", lambda k, i: (
+        "/api/persons/{}/notes/{}".format(*k.pick("noted", i)), {})),
+    Case("/api/persons/<int:perkey>/reminders/<int:remkey>", "GET", lambda k, i: (
+        "/api/persons/{}/reminders/{}".format(*k.pick("remper", i)), {})),
+]
+
+# only answers with --metrics; not reported as uncovered without it
+METRICS_CASE = Case("/api/_metrics", "GET", lambda k, i: ("/api/_metrics", {}), load=False)
+
+# endless responses, measured by bench_stream.py instead
+STREAM_ROUTES = {("/api/stream", "GET")}
+
+# creates and updates first, then deletes (relationships before the people)
+WRITE_CASES = [
+    Case("/api/persons", "POST", lambda k, i: _json("/api/persons", {
+        "firstName": "Bench", "lastName": str(i), "location": "Merced, CA"})),
+    Case("/api/persons/<int:perkey>", "PUT", lambda k, i: _json(
+        f"/api/persons/{k.pick('perkey', i)}", {"location": "Fresno, CA"})),
+    Case("/api/notes", "POST", lambda k, i: _json("/api/notes", {"title": f"bench {i}", "content": "coffee"})),
+    Case("/api/notes/<int:id>", "PUT", lambda k, i: _json(f"/api/notes/{k.pick('notekey', i)}", {"content": "lunch"})),
+    Case("/api/reminders", "POST", lambda k, i: _json("/api/reminders", {"label": f"bench {i}", "due_date": "2030-01-01"})),
+    Case("/api/reminders/<int:id>", "PUT", lambda k, i: _json(f"/api/reminders/{k.pick('remkey', i)}", {"completed": True})),
+    Case("/api/persons/<int:perkey>/reminders", "POST", lambda k, i: _json(
+        f"/api/persons/{k.pick('perkey', i)}/reminders", {"label": "call", "due_date": "2030-01-01"})),
+    Case("/api/persons/<int:perkey>/reminders/<int:remkey>", "PUT", lambda k, i: _json(
+        "/api/persons/{}/reminders/{}".format(*k.pick("remper", i)), {"completed": True})),
+    Case("/api/persons/<int:perkey>/notes", "POST", lambda k, i: _json(
+        f"/api/persons/{k.pick('perkey', i)}/notes", {"title": "met", "content": "coffee"})),
+    Case("/api/persons/<int:perkey>/notes/<int:notekey>", "PUT", lambda k, i: _json(
+        "/api/persons/{}/notes/{}".format(*k.pick("noted", i)), {"content": "dinner"})),
+    Case("/api/persons/<int:perkey>/relationships", "POST", _relate),
+    Case("/api/persons/<int:perkey>/relationships/<int:other_perkey>", "PUT", lambda k, i: _json(
+        "/api/persons/{}/relationships/{}".format(*k.pick("rel", i)), {"relTypeKey": 2})),
+    Case("/api/photos", "POST", lambda k, i: ("/api/photos", {
+        "data": synth_data.tiny_png(i % 256, 0, 0), "content_type": "image/png"})),
+    Case("/api/batch", "POST", _batch),
+    Case("/api/import", "POST", _import_csv, load=False, runs=5),
+    Case("/api/persons/<int:perkey>/notes/<int:notekey>", "DELETE", lambda k, i: (
+        "/api/persons/{}/notes/{}".format(*k.take("noted")), {})),
+    Case("/api/persons/<int:perkey>/reminders/<int:remkey>", "DELETE", lambda k, i: (
+        "/api/persons/{}/reminders/{}".format(*k.take("remper")), {})),
+    Case("/api/notes/<int:id>", "DELETE", lambda k, i: (f"/api/notes/{k.take('notekey')}", {})),
+    Case("/api/reminders/<int:id>", "DELETE", lambda k, i: (f"/api/reminders/{k.take('remkey')}", {})),
+    Case("/api/persons/<int:perkey>/relationships/<int:other_perkey>", "DELETE", lambda k, i: (
+        "/api/persons/{}/relationships/{}".format(*k.take("rel")), {})),
+    Case("/api/photos/<int:photokey>", "DELETE", lambda k, i: (f"/api/photos/{k.take('photokey')}", {})),
+    Case("/api/persons/<int:perkey>", "DELETE", lambda k, i: (f"/api/persons/{k.take('perkey')}", {})),
+]
+
+
+class Keys:
+    """Keys sampled from the dataset. pick() cycles through a sample; take()
+    hands out each key once, for deletes (the hubs are never deleted)."""
+
+    QUERIES = {
+        "perkey": "SELECT perkey FROM Person",
+        "notekey": "SELECT notekey FROM Notes",
+        "remkey": "SELECT remkey FROM Reminders",
+        "photokey": "SELECT photokey FROM Photo",
+        "noted": "SELECT perkey, notekey FROM NotedPerson",
+        "remper": "SELECT perkey, remkey FROM remPer",
+        "rel": "SELECT perkey1, perkey2 FROM Relationships",
+    }
+
+    def __init__(self, path, seed):
+        rng = random.Random(seed)
+        conn = sqlite3.connect(path)
+        try:
+            self.samples = {}
+            for name, sql in self.QUERIES.items():
+                rows = [row if len(row) > 1 else row[0] for row in conn.execute(sql)]
+                self.samples[name] = rng.sample(rows, min(len(rows), SAMPLE_SIZE))
+            self.samples["hub"] = [row[0] for row in conn.execute(
+                "SELECT p, count(*) FROM (SELECT perkey1 AS p FROM Relationships "
+                "UNION ALL SELECT perkey2 FROM Relationships) GROUP BY p ORDER BY 2 DESC LIMIT 10"
+            )]
+            # pairs of sampled people that aren't related yet, for new relationships
+            people = self.samples["perkey"]
+            self.samples["unrelated"] = [
+                pair for pair in ((min(a, b), max(a, b)) for a, b in zip(people[::2], people[1::2]))
+                if pair[0] != pair[1] and conn.execute(
+                    "SELECT 1 FROM Relationships WHERE perkey1 = ? AND perkey2 = ?", pair).fetchone() is None
+            ]
+            hubs = set(self.samples["hub"])
+            self.samples["perkey"] = [k for k in self.samples["perkey"] if k not in hubs]
+        finally:
+            conn.close()
+        self._lock = threading.Lock()
+
+    def pick(self, name, i):
+        sample = self.samples[name]
+        return sample[i % len(sample)]
+
+    def take(self, name):
+        # off the end of the sample, so later pick()s don't hit deleted keys
+        with self._lock:
+            sample = self.samples[name]
+            return sample.pop() if len(sample) > 1 else sample[0]
+
+
+# -------------------------------------------------
+# Datasets and the app
+# -------------------------------------------------
+def dataset(rows, seed, base_date):
+    """Path and photo store of the cached dataset, generated on first use."""
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    name = f"synth-{rows}-s{seed}-{base_date.isoformat()}"
+    path = os.path.join(BENCH_DIR, name + ".sqlite")
+    photos = os.path.join(BENCH_DIR, name + "-photos")
+    if not os.path.exists(path):
+        print(f"generating {name} ...", file=sys.stderr)
+        tmp = path + ".tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        synth_data.generate(tmp, rows, seed, base_date, photos)
+        os.replace(tmp, path)
+    return path, photos
+
+
+def load_app(db_path, photos, response_cache=True, metrics=False, write_queue=True, features=("api",)):
+    # create_app() reads these from the environment
+    os.environ["CRM_DATABASE_URI"] = "sqlite:///" + os.path.abspath(db_path)
+    if not write_queue:
+        os.environ["CRM_WRITE_QUEUE"] = "0"
+    if metrics:
+        os.environ["CRM_METRICS"] = "1"
+    from app import create_app
+    app = create_app(features)
+    app.config["PHOTO_STORE_PATH"] = photos
+    if not response_cache:
+        app.extensions.pop("response_cache", None)
+    for name in ("reminders", "werkzeug"):  # no per-request or per-reminder lines
+        logging.getLogger(name).setLevel(logging.WARNING)
+    return app
+
+
+def api_routes(app):
+    return {
+        (rule.rule, method)
+        for rule in app.url_map.iter_rules()
+        if rule.endpoint.startswith("api.")
+        for method in rule.methods - {"HEAD", "OPTIONS"}
+    }
+
+
+# -------------------------------------------------
+# Measurements
+# -------------------------------------------------
+def percentiles(times_ms):
+    times = sorted(times_ms)
+
+    def at(q):
+        return round(times[min(len(times) - 1, int(q * len(times)))], 3)
+
+    return {"p50": at(0.50), "p95": at(0.95), "p99": at(0.99)}
+
+
+def run_routes(app, keys, runs, cases):
+    results = {}
+    client = app.test_client()
+    for case in cases:
+        n = min(runs, case.runs or runs)
+        times = []
+        statuses = {}
+        started = time.perf_counter()
+        for i in range(n):
+            path, kwargs = case.build(keys, i)
+            t0 = time.perf_counter()
+            response = client.open(path, method=case.method, **kwargs)
+            response.get_data()  # drain streamed bodies
+            times.append((time.perf_counter() - t0) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            response.close()
+        elapsed = time.perf_counter() - started
+        results[f"{case.method} {case.rule}"] = dict(
+            percentiles(times), rps=round(n / elapsed, 1), n=n,
+            errors=sum(c for s, c in statuses.items() if s >= 400),
+        )
+    return results
+
+
+def _send(conn, method, path, kwargs):
+    headers = {}
+    body = None
+    if "json" in kwargs:
+        body = json.dumps(kwargs["json"]).encode()
+        headers["Content-Type"] = "application/json"
+    elif "data" in kwargs:
+        body = kwargs["data"]
+        headers["Content-Type"] = kwargs["content_type"]
+    conn.request(method, path, body=body, headers=headers)
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+
+def serve_wsgi(app):
+    """The Flask app on werkzeug's threaded server; returns (port, stop)."""
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_port, server.shutdown
+
+
+def serve_asgi(app):
+    """asgi.py on one uvicorn worker; returns (port, stop)."""
+    import socket
+    import uvicorn
+    import asgi
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(asgi.App(app), host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+    return port, stop
+
+
+SERVERS = {"wsgi": serve_wsgi, "asgi": serve_asgi}
+
+
+def run_load(app, keys, threads, duration, write_share, server="wsgi"):
+    port, stop = SERVERS[server](app)
+
+    reads = [c for c in READ_CASES if c.load]
+    writes = [c for c in WRITE_CASES if c.load and c.method != "DELETE"]
+    deadline = time.perf_counter() + duration
+    samples = []      # (case key, ms, status), appended per thread then merged
+    lock = threading.Lock()
+
+    def client(n):
+        rng = random.Random(n)
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        mine = []
+        i = n * 1000003
+        while time.perf_counter() < deadline:
+            case = rng.choice(writes if rng.random() < write_share else reads)
+            path, kwargs = case.build(keys, i)
+            i += 1
+            t0 = time.perf_counter()
+            try:
+                status = _send(conn, case.method, path, kwargs)
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                status = 599
+            mine.append((f"{case.method} {case.rule}", (time.perf_counter() - t0) * 1000, status))
+        conn.close()
+        with lock:
+            samples.extend(mine)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=client, args=(n,)) for n in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+    stop()
+
+    by_route = {}
+    for key, ms, status in samples:
+        by_route.setdefault(key, []).append((ms, status))
+    return {
+        "server": server,
+        "threads": threads,
+        "seconds": round(elapsed, 2),
+        "requests": len(samples),
+        "rps": round(len(samples) / elapsed, 1),
+        "errors": sum(1 for _, _, s in samples if s >= 400),
+        "latency": percentiles([ms for _, ms, _ in samples]) if samples else {},
+        "routes": {
+            key: dict(percentiles([ms for ms, _ in values]), n=len(values))
+            for key, values in sorted(by_route.items())
+        },
+    }
+
+
+def run_sql(db_path, runs):
+    with open(QUERIES_PATH, "r", encoding="utf-8") as f:
+        statements = [(label, sql) for label, sql in split_statements(f.read()) if sql.upper().startswith("SELECT")]
+    conn = sqlite3.connect(db_path)
+    results = {}
+    try:
+        for label, sql in statements:
+            params = conn.execute(SQL_PARAMS[label]).fetchone() if label in SQL_PARAMS else ()
+            times = []
+            try:
+                for _ in range(runs):
+                    t0 = time.perf_counter()
+                    rows = conn.execute(sql, params).fetchall()
+                    times.append((time.perf_counter() - t0) * 1000)
+            except sqlite3.Error as e:
+                results[label] = {"error": str(e)}
+                continue
+            results[label] = {"median": round(statistics.median(times), 3), "rows": len(rows)}
+    finally:
+        conn.close()
+    return results
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KiB on Linux, bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# -------------------------------------------------
+# Baselines
+# -------------------------------------------------
+def compare(result, baseline, threshold):
+    """Human-readable regressions of `result` against `baseline`."""
+    regressions = []
+    for phase in ("routes",):
+        for key, old in baseline.get(phase, {}).items():
+            new = result.get(phase, {}).get(key)
+            if new is None or "p95" not in old:
+                continue
+            if new["p95"] > old["p95"] * threshold and new["p95"] - old["p95"] > NOISE_MS:
+                regressions.append(f"{key}: p95 {old['p95']}ms -> {new['p95']}ms")
+    old_load, new_load = baseline.get("load"), result.get("load")
+    if old_load and new_load:
+        if new_load["rps"] * threshold < old_load["rps"]:
+            regressions.append(f"load: {old_load['rps']} -> {new_load['rps']} req/s")
+        old_p95, new_p95 = old_load["latency"].get("p95"), new_load["latency"].get("p95")
+        if old_p95 and new_p95 and new_p95 > old_p95 * threshold and new_p95 - old_p95 > NOISE_MS:
+            regressions.append(f"load: p95 {old_p95}ms -> {new_p95}ms")
+    for label, old in baseline.get("sql", {}).items():
+        new = result.get("sql", {}).get(label, {})
+        if "median" in old and "median" in new and new["median"] > old["median"] * threshold \
+                and new["median"] - old["median"] > NOISE_MS:
+            regressions.append(f"sql {label}: {old['median']}ms -> {new['median']}ms")
+    if result["dataset"] != baseline.get("dataset"):
+        regressions.insert(0, "warning: baseline was recorded on a different dataset")
+    return regressions
+
+
+def print_routes(results):
+    print(f"{'route':66} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>8} {'err':>4}")
+    for key, r in results.items():
+        print(f"{key:66} {r['p50']:>8.2f} {r['p95']:>8.2f} {r['p99']:>8.2f} {r['rps']:>8.1f} {r['errors']:>4}")
+
+
+def main(args):
+    base_date = args.base_date or datetime.date.today()
+    source, photos = dataset(args.rows, args.seed, base_date)
+    with tempfile.TemporaryDirectory() as tmp:
+        # writes go to a scratch copy; the cached dataset stays pristine
+        db_path = os.path.join(tmp, "bench.sqlite")
+        shutil.copyfile(source, db_path)
+        run_migrations(sqlite3.connect(db_path))   # datasets cached before the latest migrations
+        shutil.copytree(photos, os.path.join(tmp, "photos"))
+        app = load_app(db_path, os.path.join(tmp, "photos"), not args.no_response_cache, args.metrics,
+                       not args.no_write_queue)
+        keys = Keys(db_path, args.seed)
+
+        # the metrics case goes last so its output covers the run
+        cases = READ_CASES + WRITE_CASES + ([METRICS_CASE] if args.metrics else [])
+        covered = {(c.rule, c.method) for c in cases + [METRICS_CASE]} | STREAM_ROUTES
+        uncovered = sorted(api_routes(app) - covered)
+        for rule, method in uncovered:
+            print(f"warning: no benchmark case for {method} {rule}", file=sys.stderr)
+
+        result = {
+            "dataset": {"rows": args.rows, "seed": args.seed},
+            "recorded": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "responseCache": not args.no_response_cache,
+            "metrics": args.metrics,
+            "writeQueue": not args.no_write_queue,
+            "uncovered": [f"{m} {r}" for r, m in uncovered],
+        }
+        if not args.no_sql:
+            result["sql"] = run_sql(db_path, args.runs)
+        result["routes"] = run_routes(app, keys, args.runs, cases)
+        print_routes(result["routes"])
+        if not args.no_load:
+            result["load"] = run_load(app, keys, args.threads, args.duration, args.write_share, args.server)
+            load = result["load"]
+            print(f"\nload ({load['server']}): {load['threads']} threads, {load['requests']} requests in {load['seconds']}s, "
+                  f"{load['rps']} req/s, {load['errors']} errors, latency {load['latency']}")
+        if "sql" in result:
+            print()
+            for label, r in result["sql"].items():
+                print(f"{label:5} " + (f"{r['median']:>9.2f}ms {r['rows']:>8} rows" if "median" in r else r["error"]))
+        result["peakRssMB"] = peak_rss_mb()
+        print(f"\npeak RSS {result['peakRssMB']} MB")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+            f.write("\n")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        regressions += [f"uncovered route: {route}" for route in result["uncovered"]]
+        for line in regressions:
+            print("REGRESSION " + line if not line.startswith("warning") else line)
+        if any(not line.startswith("warning") for line in regressions):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every API route on synthetic data.")
+    parser.add_argument("--rows", type=int, default=100000, help="dataset size (see synth_data.py)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--base-date", type=datetime.date.fromisoformat, help="dataset base date (default: today)")
+    parser.add_argument("--runs", type=int, default=50, help="requests per route / executions per query")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load")
+    parser.add_argument("--server", choices=sorted(SERVERS), default="wsgi",
+                        help="load phase server: werkzeug threads or asgi.py on uvicorn")
+    parser.add_argument("--write-share", type=float, default=0.1, help="fraction of load requests that write")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this JSON file; exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    parser.add_argument("--no-load", action="store_true")
+    parser.add_argument("--no-sql", action="store_true")
+    parser.add_argument("--no-response-cache", action="store_true")
+    parser.add_argument("--no-write-queue", action="store_true", help="commit writes in the request threads")
+    parser.add_argument("--metrics", action="store_true", help="run with the metrics.py instrumentation on")
+    sys.exit(main(parser.parse_args()))
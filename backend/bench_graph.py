@@ -0,0 +1,173 @@
+# Benchmark: the graph.py index vs SQL and plain Python on a synthetic
+# relationship graph of `--people` people with ~2 relationships each
+# (preferential attachment, see synth_data.relationships).
+#
+#   python bench_graph.py [--people 500000] [--runs 20] [--sql-depth 3]
+#
+# Builds a database holding only people and relationships, then times:
+#   build      - loading the CSR index from the database
+#   path       - shortest path between random pairs, and between pairs two
+#                hops apart against the recursive CTE of /persons/<perkey>/graph
+#                walking --sql-depth hops
+#   mutual     - common neighbours of random pairs vs an INTERSECT query
+#   centrality - top 20 by degree vs GROUP BY over both edge columns
+#   components - the union-find (first call, then cached) vs a BFS over a
+#                dict of sets built from the table
+# Prints the median of each in ms.
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+
+from bulk_import import BulkImporter
+from graph import GraphIndex, GraphSource
+from migrations import create_database
+import synth_data
+
+PATH_SQL = """
+WITH RECURSIVE hop(perkey, depth) AS (
+    SELECT :root, 0
+    UNION
+    SELECT CASE WHEN r.perkey1 = hop.perkey THEN r.perkey2 ELSE r.perkey1 END,
+           hop.depth + 1
+    FROM hop
+    JOIN Relationships r ON r.perkey1 = hop.perkey OR r.perkey2 = hop.perkey
+    WHERE hop.depth < :depth
+)
+SELECT MIN(depth) FROM hop WHERE perkey = :target
+"""
+
+MUTUAL_SQL = """
+SELECT perkey2 FROM Relationships WHERE perkey1 = :a UNION SELECT perkey1 FROM Relationships WHERE perkey2 = :a
+INTERSECT
+SELECT perkey2 FROM Relationships WHERE perkey1 = :b UNION SELECT perkey1 FROM Relationships WHERE perkey2 = :b
+"""
+
+DEGREE_SQL = """
+SELECT perkey, COUNT(*) AS degree FROM (
+    SELECT perkey1 AS perkey FROM Relationships UNION ALL SELECT perkey2 FROM Relationships
+) GROUP BY perkey ORDER BY degree DESC, perkey LIMIT 20
+"""
+
+
+def build(path, n, seed=1):
+    create_database(path)
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = WAL")
+    importer = BulkImporter(conn)
+    importer.insert_rows("RelationshipType", ["relTypeKey", "name", "description"],
+                         [(i, name, desc) for i, (name, desc) in enumerate(synth_data.REL_TYPES, 1)])
+    importer.insert_rows("Person", ["perkey", "photokey", "firstName", "lastName", "birthday", "location"],
+                         synth_data.people(n, 0, seed), False)
+    importer.insert_rows("Relationships", ["relTypeKey", "perkey1", "perkey2"],
+                         synth_data.relationships(n, seed), False)
+    conn.execute("ANALYZE")
+    edges = conn.execute("SELECT COUNT(*) FROM Relationships").fetchone()[0]
+    conn.close()
+    return edges
+
+
+def timed(fn, runs):
+    times = []
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), result
+
+
+def python_components(conn):
+    adjacency = {k: set() for (k,) in conn.execute("SELECT perkey FROM Person")}
+    for a, b in conn.execute("SELECT perkey1, perkey2 FROM Relationships"):
+        adjacency[a].add(b)
+        adjacency[b].add(a)
+    seen = set()
+    count = 0
+    for start in adjacency:
+        if start in seen:
+            continue
+        count += 1
+        seen.add(start)
+        queue = [start]
+        for node in queue:
+            for other in adjacency[node]:
+                if other not in seen:
+                    seen.add(other)
+                    queue.append(other)
+    return count
+
+
+def row(name, index_ms, other_ms, note=""):
+    other = f"{other_ms:>10.2f}ms" if other_ms is not None else f"{'-':>12}"
+    print(f"{name:12} {index_ms:>10.2f}ms {other} {note}")
+
+
+def main(people, runs, sql_depth, seed):
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "graph.sqlite")
+        started = time.perf_counter()
+        edges = build(path, people, seed)
+        print(f"{people} people, {edges} relationships (generated in {time.perf_counter() - started:.1f}s)")
+
+        engine = create_engine(f"sqlite:///{path}")
+        graph = GraphIndex(GraphSource(engine))
+        build_ms, _ = timed(lambda: (graph.mark_stale(), graph.stats()), 1)
+        conn = sqlite3.connect(path)
+        print(f"{'':12} {'index':>12} {'sql/python':>12}")
+        row("build", build_ms, None)
+
+        pairs = [(rng.randint(1, people), rng.randint(1, people)) for _ in range(runs)]
+        path_ms = [timed(lambda: graph.shortest_path(a, b), 1)[0] for a, b in pairs]
+        lengths = [len(graph.shortest_path(a, b)) - 1 for a, b in pairs]
+        # random pairs are too far apart for the CTE: time both on pairs two hops apart
+        near = []
+        while len(near) < max(3, runs // 4):
+            a = rng.randint(1, people)
+            b = rng.choice(graph.neighbours(rng.choice(graph.neighbours(a) or [a])) or [a])
+            if len(graph.shortest_path(a, b)) - 1 == 2:
+                near.append((a, b))
+        near_ms = statistics.median(timed(lambda: graph.shortest_path(a, b), 1)[0] for a, b in near)
+        sql_ms = statistics.median(
+            timed(lambda: conn.execute(PATH_SQL, {"root": a, "target": b, "depth": sql_depth}).fetchone(), 1)[0]
+            for a, b in near
+        )
+        row("path", statistics.median(path_ms), None, f"random pairs, {min(lengths)}-{max(lengths)} hops")
+        row("path 2 hops", near_ms, sql_ms, f"SQL: recursive CTE to depth {sql_depth}")
+
+        hubs = [k for k, _ in graph.top_degree(runs)]
+        mutual_pairs = list(zip(hubs, hubs[1:] + hubs[:1])) + pairs
+        index_ms = statistics.median(timed(lambda: graph.mutual(a, b), 1)[0] for a, b in mutual_pairs)
+        sql_ms = statistics.median(timed(lambda: conn.execute(MUTUAL_SQL, {"a": a, "b": b}).fetchall(), 1)[0]
+                                   for a, b in mutual_pairs)
+        row("mutual", index_ms, sql_ms, "hub pairs and random pairs")
+
+        graph.version += 1  # drop the cached ranking
+        first_ms, _ = timed(lambda: graph.top_degree(20), 1)
+        index_ms, _ = timed(lambda: graph.top_degree(20), runs)
+        sql_ms, _ = timed(lambda: conn.execute(DEGREE_SQL).fetchall(), max(1, runs // 10))
+        row("centrality", index_ms, sql_ms, f"first call {first_ms:.1f}ms")
+
+        first_ms, (count, _) = timed(lambda: graph.components(20), 1)
+        index_ms, _ = timed(lambda: graph.components(20), runs)
+        python_ms, python_count = timed(lambda: python_components(conn), 1)
+        assert python_count == count, (python_count, count)
+        row("components", index_ms, python_ms, f"{count} components; first call {first_ms:.1f}ms")
+        conn.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the relationship graph index.")
+    parser.add_argument("--people", type=int, default=500000)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--sql-depth", type=int, default=3, help="depth of the SQL path query")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    main(args.people, args.runs, args.sql_depth, args.seed)
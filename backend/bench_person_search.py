@@ -0,0 +1,116 @@
+# Benchmark: original Q9 vs person_search.search at growing table sizes.
+#
+#   python bench_person_search.py [--sizes 1000 10000 100000] [--runs 20]
+#
+# Each size gets a scratch database (create_schema.sql + migrations) filled
+# with random people, birthdays, locations and ~3 relationships per person.
+# Prints the median time per query in milliseconds.
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from migrations import create_database
+import person_search
+
+REL_TYPES = ["Friend", "Classmate", "Coworker", "Family", "Project Partner"]
+
+# Q9 as it was: OR join, strftime() and infix LIKE, every criterion optional
+ORIGINAL_Q9 = """
+SELECT DISTINCT p.perkey, p.firstName, p.lastName, p.birthday, p.location
+FROM Person p
+LEFT JOIN Relationships r  ON r.perkey1 = p.perkey OR r.perkey2 = p.perkey
+LEFT JOIN RelationshipType rt ON rt.relTypeKey = r.relTypeKey
+WHERE (:month IS NULL OR strftime('%m', p.birthday) = printf('%02d', :month))
+  AND (:relType IS NULL OR rt.name = :relType)
+  AND (:location IS NULL OR p.location LIKE :location)
+ORDER BY p.lastName, p.firstName
+LIMIT :limit
+"""
+
+SCENARIOS = [
+    ("month", dict(birth_month=7)),
+    ("month+day", dict(birth_month=7, birth_day=14)),
+    ("location", dict(location="City01")),
+    ("location, narrow", dict(location="City019")),
+    ("location, broad", dict(location="City1")),
+    ("relType", dict(rel_type="Family")),
+    ("relType+location", dict(rel_type="Friend", location="City01")),
+    ("month+relType+location", dict(birth_month=7, rel_type="Friend", location="City1")),
+]
+
+
+def build(path, n, seed=1):
+    rng = random.Random(seed)
+    create_database(path)
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO RelationshipType (relTypeKey, name) VALUES (?, ?)",
+                     list(enumerate(REL_TYPES, 1)))
+    conn.executemany(
+        "INSERT INTO Person (perkey, firstName, lastName, birthday, location) VALUES (?, ?, ?, ?, ?)",
+        (
+            (i, f"First{rng.randrange(5000)}", f"Last{rng.randrange(20000)}",
+             f"{rng.randint(1950, 2005)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+             f"City{rng.randrange(200):03d}, ST")
+            for i in range(1, n + 1)
+        ),
+    )
+    edges = {}
+    for _ in range(n * 3 // 2):
+        a, b = rng.randint(1, n), rng.randint(1, n)
+        if a != b:
+            edges[(min(a, b), max(a, b))] = rng.randint(1, len(REL_TYPES))
+    conn.executemany("INSERT INTO Relationships (perkey1, perkey2, relTypeKey) VALUES (?, ?, ?)",
+                     [(a, b, t) for (a, b), t in edges.items()])
+    conn.commit()
+    conn.execute("ANALYZE")
+    return conn
+
+
+def median_ms(conn, sql, params, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def search_ms(conn, criteria, limit, runs):
+    """Median of the new search, the name walk included (as the API runs it)."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        person_search.search(conn, limit=limit, **criteria)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main(sizes, runs, limit=50):
+    print(f"{'rows':>9}  {'scenario':24} {'original Q9':>12} {'new':>10}")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = build(os.path.join(tmp, "bench.sqlite"), n)
+            for name, criteria in SCENARIOS:
+                new = search_ms(conn, criteria, limit, runs)
+                old_params = {
+                    "month": criteria.get("birth_month"),
+                    "relType": criteria.get("rel_type"),
+                    "location": f"%{criteria['location']}%" if "location" in criteria else None,
+                    "limit": limit,
+                }
+                # the original can't filter by day; it is timed on the month alone
+                old = median_ms(conn, ORIGINAL_Q9, old_params, max(1, runs // 5))
+                print(f"{n:>9}  {name:24} {old:>10.2f}ms {new:>8.3f}ms")
+            conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Q9 rewrite.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+    main(args.sizes, args.runs)
@@ -0,0 +1,127 @@
+# Benchmark: the old model_to_dict / per-handler dict path vs the compiled
+# serializers in serializers.py, on one list of `--rows` notes and people.
+#
+#   python bench_serializers.py [--rows 100000] [--runs 5]
+#
+# "old" loads ORM objects and builds each dict with getattr per column, then
+# encodes with the stdlib json module the way Flask's default provider does.
+# "new" selects row tuples, zips them with the precomputed names and encodes
+# with orjson (when installed). Prints the median of each stage in ms.
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from migrations import create_database
+from ORM_models import Person, Notes
+import serializers
+
+
+def build(path, n, seed=1):
+    rng = random.Random(seed)
+    create_database(path)
+    conn = sqlite3.connect(path)
+    # nothing here searches; without the FTS triggers the load is linear
+    conn.executescript("DROP TRIGGER person_fts_ai; DROP TRIGGER notes_fts_ai;")
+    conn.executemany(
+        "INSERT INTO Person (perkey, firstName, lastName, birthday, location) VALUES (?, ?, ?, ?, ?)",
+        ((i, f"First{rng.randrange(5000)}", f"Last{rng.randrange(20000)}",
+          f"{rng.randint(1950, 2005)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}", "Merced, CA")
+         for i in range(1, n + 1)),
+    )
+    conn.executemany(
+        "INSERT INTO Notes (notekey, title, content) VALUES (?, ?, ?)",
+        ((i, f"Note {i}", "lorem ipsum dolor sit amet " * rng.randint(1, 8)) for i in range(1, n + 1)),
+    )
+    conn.commit()
+    conn.close()
+
+
+# --- the old path, as api.py had it ---
+
+def old_model_to_dict(obj):
+    result = {}
+    for col in obj.__table__.columns:
+        if col.computed is not None:
+            continue
+        result[col.name] = getattr(obj, col.name)
+    return result
+
+
+def old_notes(session):
+    notes = session.scalars(select(Notes).order_by(Notes.notekey)).all()
+    return [
+        {name: getattr(n, attr) for name, attr in serializers.NOTE_FIELDS.items()}
+        for n in notes
+    ]
+
+
+def old_persons(session):
+    return [old_model_to_dict(p) for p in session.scalars(select(Person).order_by(Person.perkey))]
+
+
+def old_encode(obj):
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=True) + "\n"
+
+
+# --- the new path ---
+
+def new_notes(session):
+    ser = serializers.NOTE
+    return ser.rows(session.execute(ser.query().order_by(Notes.notekey)))
+
+
+def new_persons(session):
+    ser = serializers.PERSON
+    return ser.rows(session.execute(ser.query().order_by(Person.perkey)))
+
+
+def new_encode(obj):
+    if serializers.orjson is None:
+        return old_encode(obj)
+    return serializers.orjson.dumps(
+        obj, option=serializers.orjson.OPT_SORT_KEYS | serializers.orjson.OPT_APPEND_NEWLINE
+    )
+
+
+def timed(fn, runs):
+    times = []
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), result
+
+
+def main(rows, runs):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.sqlite")
+        build(path, rows)
+        engine = create_engine(f"sqlite:///{path}")
+        print(f"{rows} rows, orjson {'on' if serializers.orjson else 'not installed'}")
+        print(f"{'list':8} {'path':4} {'query+dicts':>12} {'encode':>9} {'total':>9}")
+        for name, old, new in (("notes", old_notes, new_notes), ("persons", old_persons, new_persons)):
+            for label, load, encode in (("old", old, old_encode), ("new", new, new_encode)):
+                def run_load():
+                    with Session(engine) as session:
+                        return load(session)
+                load_ms, items = timed(run_load, runs)
+                encode_ms, _ = timed(lambda: encode({"items": items, "next_after": None}), runs)
+                print(f"{name:8} {label:4} {load_ms:>10.1f}ms {encode_ms:>7.1f}ms {load_ms + encode_ms:>7.1f}ms")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the JSON serialization paths.")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    main(args.rows, args.runs)
@@ -0,0 +1,99 @@
+# Benchmark: process startup with each app.py feature set, and creating a
+# new database from DDL vs the schema template (migrations.create_database).
+#
+#   python bench_startup.py [--runs 10]
+#
+# Every startup run is a fresh interpreter, so module imports are cold:
+#   import     - `import app` alone (create_app is only defined)
+#   <features> - import plus create_app(features); "asgi" is an asgi.py
+#                worker, `asgi:app` with CRM_FEATURES=api
+# each with the median wall time of the whole process, the time spent in
+# the import and create_app, and the process's peak RSS.
+#   database   - create_schema.sql plus every migration vs a copy of the
+#                template, median of `--runs` new files
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import migrations
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# startup case -> (CRM_FEATURES, code timed in the child)
+CASES = {
+    "import": ("", "import app"),
+    "db only": ("", "import app; app.create_app(features=())"),
+    "api": ("", "import app; app.create_app(features=('api',))"),
+    "admin": ("", "import app; app.create_app(features=('admin',))"),
+    "api+admin": ("", "import app; app.create_app(features=('api', 'admin'))"),
+    "asgi": ("api", "import asgi; asgi.app"),
+}
+
+CHILD = """
+import json, resource, sys, time
+started = time.perf_counter()
+exec(sys.argv[1])
+print(json.dumps({"ms": (time.perf_counter() - started) * 1000,
+                  "rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+
+def startup(features, code, db_uri):
+    env = dict(os.environ, CRM_DATABASE_URI=db_uri, CRM_REMINDER_SINKS="")
+    if features:
+        env["CRM_FEATURES"] = features
+    started = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", CHILD, code], cwd=HERE, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    result["wall"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def from_ddl(path):
+    conn = sqlite3.connect(path)
+    try:
+        with open(migrations.SCHEMA_PATH, "r", encoding="utf-8") as f:
+            conn.executescript(f.read())
+        conn.execute("PRAGMA user_version = 0")
+        migrations.run_migrations(conn)
+    finally:
+        conn.close()
+
+
+def timed(fn, paths):
+    times = []
+    for path in paths:
+        started = time.perf_counter()
+        fn(path)
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+
+def main(runs):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_uri = "sqlite:///" + os.path.join(tmp, "startup.sqlite")
+        startup("", "import app", db_uri)   # compile the .pyc files first
+        print(f"{'startup':12} {'process':>10} {'in-process':>11} {'rss':>9}")
+        for name, (features, code) in CASES.items():
+            results = [startup(features, code, db_uri) for _ in range(runs)]
+            print(f"{name:12} {statistics.median(r['wall'] for r in results):>8.0f}ms "
+                  f"{statistics.median(r['ms'] for r in results):>9.0f}ms "
+                  f"{max(r['rss'] for r in results):>7.1f}MB")
+
+        migrations.create_database(os.path.join(tmp, "warm.sqlite"))   # the template, if not built yet
+        ddl = timed(from_ddl, [os.path.join(tmp, f"ddl-{i}.sqlite") for i in range(runs)])
+        copy = timed(migrations.create_database, [os.path.join(tmp, f"copy-{i}.sqlite") for i in range(runs)])
+        print(f"\ndatabase     DDL + migrations {ddl:.1f}ms, template copy {copy:.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark app startup and database creation.")
+    parser.add_argument("--runs", type=int, default=10)
+    main(parser.parse_args().runs)
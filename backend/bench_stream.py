@@ -0,0 +1,139 @@
+# Benchmark: many idle /api/stream clients on asgi.py (stream.py).
+#
+#   python bench_stream.py [--rows 10000] [--clients 1000] [--idle 10] [--port 8765]
+#
+# Starts asgi.py on uvicorn in a child process against a scratch copy of a
+# cached bench_api.py dataset, opens `--clients` event streams (half on
+# "persons", half on the "person:<perkey>" topic of the person edited below)
+# and reports:
+#   rss     - the server's resident memory before and with the streams open
+#   idle    - CPU the server used over `--idle` s with every stream idle
+#   fan-out - time from a PUT /api/persons/<perkey> until the last stream
+#             got its change event
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from bench_api import dataset
+from migrations import run_migrations
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def cpu_seconds(pid):
+    fields = open(f"/proc/{pid}/stat").read().split()
+    return (int(fields[13]) + int(fields[14])) / os.sysconf("SC_CLK_TCK")
+
+
+def rss_mb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def get_json(port, path):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}") as resp:
+        return json.load(resp)
+
+
+def start_server(db_path, port):
+    env = dict(os.environ, CRM_DATABASE_URI="sqlite:///" + db_path, CRM_REMINDER_SINKS="")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "asgi:app", "--port", str(port), "--log-level", "warning",
+         "--limit-concurrency", "100000", "--backlog", "4096"],
+        cwd=HERE, env=env,
+    )
+    for _ in range(100):
+        try:
+            get_json(port, "/api/stream/stats")
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise SystemExit("server did not start")
+
+
+async def client(port, topics, received):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET /api/stream?topics={topics} HTTP/1.1\r\nHost: bench\r\n"
+                 "Accept: text/event-stream\r\n\r\n".encode())
+    await writer.drain()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            if line.startswith(b"event: change"):
+                received.append(time.perf_counter())
+                return
+    finally:
+        writer.close()
+
+
+async def run(server, port, clients, idle, perkey):
+    loop = asyncio.get_running_loop()
+    received = []
+    before = rss_mb(server.pid)
+    tasks = [asyncio.ensure_future(client(port, "persons" if i % 2 else f"person:{perkey}", received))
+             for i in range(clients)]
+    for _ in range(300):
+        stats = await loop.run_in_executor(None, get_json, port, "/api/stream/stats")
+        if stats["subscribers"] >= clients:
+            break
+        await asyncio.sleep(0.1)
+    print(f"streams    {stats['subscribers']}/{clients} open")
+    print(f"rss        {before:.1f} MB -> {rss_mb(server.pid):.1f} MB")
+
+    started = cpu_seconds(server.pid)
+    await asyncio.sleep(idle)
+    print(f"idle       {cpu_seconds(server.pid) - started:.2f}s CPU over {idle:g}s")
+
+    request = urllib.request.Request(f"http://127.0.0.1:{port}/api/persons/{perkey}", method="PUT",
+                                     data=json.dumps({"location": "bench"}).encode(),
+                                     headers={"Content-Type": "application/json"})
+    sent = time.perf_counter()
+    await loop.run_in_executor(None, lambda: urllib.request.urlopen(request).read())
+    await asyncio.wait(tasks, timeout=10)
+    if received:
+        print(f"fan-out    {len(received)}/{clients} streams in {(max(received) - sent) * 1000:.0f}ms")
+    else:
+        print("fan-out    no stream got the change")
+    for task in tasks:
+        task.cancel()
+
+
+def main(args):
+    source, _ = dataset(args.rows, args.seed, args.base_date or datetime.date.today())
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.sqlite")
+        shutil.copyfile(source, db_path)
+        run_migrations(sqlite3.connect(db_path))
+        perkey = sqlite3.connect(db_path).execute("SELECT MIN(perkey) FROM Person").fetchone()[0]
+        server = start_server(db_path, args.port)
+        try:
+            asyncio.run(run(server, args.port, args.clients, args.idle, perkey))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark idle /api/stream clients on asgi.py.")
+    parser.add_argument("--rows", type=int, default=10000, help="dataset size (see synth_data.py)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--base-date", type=datetime.date.fromisoformat, help="dataset base date (default: today)")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--idle", type=float, default=10.0, help="seconds with every stream idle")
+    parser.add_argument("--port", type=int, default=8765)
+    main(parser.parse_args())
@@ -0,0 +1,184 @@
+# Content-addressed blob store for photo bytes.
+#
+# Each blob lives at <root>/<aa>/<bb>/<sha256> where aa/bb are the first two
+# byte pairs of its hash, so identical images are stored once no matter how
+# many Photo rows point at them. Writes go to a temp file first and are
+# renamed into place, so a reader never sees a half-written blob.
+#
+# A blob is unlinked with the last Photo row pointing at it. The API does
+# both ends on the writer (write_queue.py): a delete that removes the last
+# row release()s the blob, which is unlinked once that transaction commits,
+# and an upload stages its bytes outside the writer but claim()s and
+# place()s them in the unit that inserts its row. Whichever runs second
+# sees the other's row or blob, so a Photo row never outlives its file.
+# (With WRITE_QUEUE off, an upload can still commit between a delete's
+# commit and its unlink.)
+import base64
+import hashlib
+import io
+import os
+import tempfile
+
+from flask import current_app
+from sqlalchemy import event
+
+from db_roles import RoutingSession
+
+CHUNK_SIZE = 64 * 1024
+
+# magic bytes -> mimetype, for uploads that don't say what they are
+_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+]
+
+
+def sniff_mimetype(head):
+    for magic, mimetype in _SIGNATURES:
+        if head.startswith(magic):
+            return mimetype
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+class BlobStore:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def put(self, data):
+        """Store `data` (bytes) and return (sha256 hex digest, size)."""
+        digest = hashlib.sha256(data).hexdigest()
+        if not self.exists(digest):
+            self._write(digest, data)
+        return digest, len(data)
+
+    def put_stream(self, stream):
+        """Store a file-like object chunk by chunk; returns (digest, size)."""
+        digest, size, tmp = self.stage_stream(stream)
+        self.place(tmp, digest)
+        return digest, size
+
+    def stage(self, data):
+        """Write `data` to a temp file in the store; returns (digest, size,
+        temp path) for place() or discard()."""
+        return self.stage_stream(io.BytesIO(data))
+
+    def stage_stream(self, stream):
+        h = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    h.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            self.discard(tmp)
+            raise
+        return h.hexdigest(), size, tmp
+
+    def place(self, tmp, digest):
+        """Move a staged file in as `digest`, or drop it if that blob exists."""
+        if self.exists(digest):
+            os.remove(tmp)
+        else:
+            self._place(tmp, digest)
+
+    def discard(self, tmp):
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+
+    def delete(self, digest):
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+    def _write(self, digest, data):
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".upload-")
+        with os.fdopen(fd, "wb") as out:
+            out.write(data)
+        self._place(tmp, digest)
+
+    def _place(self, tmp, digest):
+        dest = self.path(digest)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(tmp, dest)
+
+
+_stores = {}
+
+
+def get_store():
+    """The BlobStore configured by PHOTO_STORE_PATH for the current app."""
+    root = current_app.config.get("PHOTO_STORE_PATH") or os.path.join(current_app.instance_path, "photos")
+    if root not in _stores:
+        _stores[root] = BlobStore(root)
+    return _stores[root]
+
+
+# -------------------------------------------------
+# Session hooks: unlink released blobs once the transaction commits
+# -------------------------------------------------
+def _released(session):
+    return session.info.setdefault("released_blobs", {})
+
+
+def release(session, store, digest):
+    """The transaction on `session` deleted the last Photo row for `digest`."""
+    _released(session)[digest] = store
+
+
+def claim(session, digest):
+    """The transaction on `session` inserted a Photo row for `digest`."""
+    _released(session).pop(digest, None)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _unlink_released(session):
+    if session.in_nested_transaction():  # a SAVEPOINT (write_queue.py), not the commit
+        return
+    for digest, store in session.info.pop("released_blobs", {}).items():
+        store.delete(digest)
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _keep_released(session):
+    if not session.in_nested_transaction():
+        session.info.pop("released_blobs", None)
+
+
+def decode_legacy_imagedata(value):
+    """Bytes for an old inline Photo.imagedata value.
+
+    The column held data: URLs or bare base64; anything else is kept as its
+    UTF-8 text. Some rows held a file path instead: those are never opened
+    here, since a request could name any file on the server
+    (migrate_photos.py reads them from a configured photo root).
+    """
+    if value.startswith("data:") and "," in value:
+        header, payload = value.split(",", 1)
+        if header.endswith(";base64"):
+            return base64.b64decode(payload)
+        return payload.encode("utf-8")
+    try:
+        return base64.b64decode(value, validate=True)
+    except ValueError:
+        return value.encode("utf-8")
@@ -0,0 +1,524 @@
+# Bulk loader for the CRM database.
+#
+#   python bulk_import.py "../Phase 2 - schema + queries/data"   (every .tbl file)
+#   python bulk_import.py person.tbl [--table Person]
+#   python bulk_import.py contacts.csv
+#   python bulk_import.py contacts.vcf
+#
+# Files are streamed, rows are inserted with executemany in batches (one
+# transaction per batch), and parent tables are loaded before the tables that
+# reference them. Foreign keys are checked in memory against the parent keys
+# already in the database, so one bad row is skipped and counted instead of
+# failing its whole batch. POST /api/import in api.py uses the same engine.
+#
+# The per-row FTS insert triggers dominate load time, so for Notes, Person and
+# Reminders each batch drops the insert trigger, inserts, indexes the batch
+# with one INSERT ... SELECT into the FTS table, and recreates the trigger --
+# all inside the batch's transaction, so no other writer ever sees the table
+# without its trigger. The row count triggers (TableStats, migrations.py) get
+# the same treatment: one UPDATE adds the batch's size. So do the PersonSummary
+# insert triggers: one statement recomputes the columns of the people the
+# batch touched. And the change log triggers: the batch's rows are logged
+# with one INSERT ... SELECT.
+#
+# Photo .tbl rows carry the image inline (imagedata): each one is decoded and
+# put in the blob store, and the row gets its contentHash, mimeType and
+# byteSize with imagedata left NULL, like migrate_photos.py leaves old rows.
+import argparse
+import csv
+import io
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from blobstore import decode_legacy_imagedata, sniff_mimetype
+from migrations import CHANGE_KEYS, SUMMARY_BATCH, change_key
+from search import FTS_SOURCES
+
+BATCH_SIZE = 10000
+
+# load order: parents before children (same as load_data.sql)
+TABLE_ORDER = [
+    "Photo", "Notes", "SocialType", "RelationshipType", "Category", "Person", "Reminders",
+    "SocialLinks", "NotePhoto", "NotedPerson", "Relationships", "perCat", "remPer", "remCat",
+]
+
+# .tbl column layout per table; None marks a column of the Phase 2 data files
+# that the final schema no longer has
+TBL_COLUMNS = {
+    "Photo": ["photokey", "imagedata", None],
+    "Notes": ["notekey", "title", "content", "dateCreated", "lastModified"],
+    "SocialType": ["socialkey", "platformName", "platformURL"],
+    "RelationshipType": ["relTypeKey", "name", "description"],
+    "Category": ["catkey", "name", "description"],
+    "Person": ["perkey", "photokey", "firstName", "lastName", "birthday", "location"],
+    "Reminders": ["remkey", "title", "description", "dueDate", "completed", None],
+    "SocialLinks": ["socialkey", "perkey", "handle", "profileURL"],
+    "NotePhoto": ["notekey", "photokey"],
+    "NotedPerson": ["perkey", "notekey"],
+    "Relationships": ["relTypeKey", "perkey1", "perkey2", None],
+    "perCat": ["perkey", "catkey"],
+    "remPer": ["remkey", "perkey"],
+    "remCat": ["remkey", "catkey"],
+}
+
+# what the imagedata column of Photo.tbl becomes
+PHOTO_COLUMNS = ["photokey", "contentHash", "mimeType", "byteSize"]
+
+# column -> (parent table, parent key) for the in-memory foreign key check
+FOREIGN_KEYS = {
+    "Person": {"photokey": ("Photo", "photokey")},
+    "SocialLinks": {"socialkey": ("SocialType", "socialkey"), "perkey": ("Person", "perkey")},
+    "NotePhoto": {"notekey": ("Notes", "notekey"), "photokey": ("Photo", "photokey")},
+    "NotedPerson": {"perkey": ("Person", "perkey"), "notekey": ("Notes", "notekey")},
+    "Relationships": {
+        "relTypeKey": ("RelationshipType", "relTypeKey"),
+        "perkey1": ("Person", "perkey"),
+        "perkey2": ("Person", "perkey"),
+    },
+    "perCat": {"perkey": ("Person", "perkey"), "catkey": ("Category", "catkey")},
+    "remPer": {"remkey": ("Reminders", "remkey"), "perkey": ("Person", "perkey")},
+    "remCat": {"remkey": ("Reminders", "remkey"), "catkey": ("Category", "catkey")},
+}
+
+PRIMARY_KEYS = {
+    "Photo": "photokey", "Notes": "notekey", "SocialType": "socialkey",
+    "RelationshipType": "relTypeKey", "Category": "catkey", "Person": "perkey",
+    "Reminders": "remkey",
+}
+
+# contact file column names -> Person column
+CONTACT_ALIASES = {
+    "firstname": "firstName", "first_name": "firstName", "first name": "firstName", "given name": "firstName",
+    "lastname": "lastName", "last_name": "lastName", "last name": "lastName", "family name": "lastName",
+    "birthday": "birthday", "bday": "birthday", "birthdate": "birthday",
+    "location": "location", "city": "location", "address": "location",
+    "categories": "categories", "category": "categories", "groups": "categories",
+}
+
+# columns of an export.py CSV that are not contact data
+IGNORED_CONTACT_COLUMNS = {"perkey", "photokey", "notes", "reminders", "relationships"}
+
+
+class ImportStats:
+    def __init__(self):
+        self.rows = {}
+        self.skipped = {}
+        self.started = time.perf_counter()
+
+    def add(self, table, inserted, skipped=0):
+        self.rows[table] = self.rows.get(table, 0) + inserted
+        if skipped:
+            self.skipped[table] = self.skipped.get(table, 0) + skipped
+
+    def as_dict(self):
+        elapsed = time.perf_counter() - self.started
+        total = sum(self.rows.values())
+        return {
+            "rows": self.rows,
+            "skipped": self.skipped,
+            "total": total,
+            "seconds": round(elapsed, 3),
+            "rowsPerSecond": round(total / elapsed) if elapsed > 0 else None,
+        }
+
+
+class BulkImporter:
+    """Loads rows through one raw sqlite3 connection (db.engine.raw_connection()).
+
+    `store` is the BlobStore that Photo.tbl images go to.
+    """
+
+    def __init__(self, conn, batch_size=BATCH_SIZE, store=None):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.store = store
+        self.stats = ImportStats()
+        self._keys = {}
+        self._triggers = {}
+
+    @contextmanager
+    def transaction(self):
+        # explicit BEGIN so the trigger DDL below is part of the transaction
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN")
+        try:
+            yield
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    # ---- in-memory key sets -------------------------------------------
+
+    def keys(self, table):
+        """Primary keys currently in `table` (loaded once, kept up to date)."""
+        if table not in self._keys:
+            pk = PRIMARY_KEYS[table]
+            self._keys[table] = {k for (k,) in self.conn.execute(f'SELECT {pk} FROM "{table}"')}
+        return self._keys[table]
+
+    def next_key(self, table):
+        keys = self.keys(table)
+        return max(keys) + 1 if keys else 1
+
+    def name_map(self, table, name_col):
+        pk = PRIMARY_KEYS[table]
+        return {name: k for k, name in self.conn.execute(f'SELECT {pk}, {name_col} FROM "{table}"')}
+
+    # ---- low level batched insert -------------------------------------
+
+    def insert_rows(self, table, columns, rows, check_keys=True):
+        """executemany `rows` (tuples in `columns` order) in batches.
+
+        check_keys=False skips the in-memory foreign key check, for callers
+        whose rows are consistent by construction (synth_data.py).
+        """
+        sql = 'INSERT INTO "{}" ({}) VALUES ({})'.format(
+            table, ", ".join(columns), ", ".join("?" for _ in columns)
+        )
+        fks = [(columns.index(col), parent) for col, parent in FOREIGN_KEYS.get(table, {}).items() if col in columns]
+        if not check_keys:
+            fks = []
+        pk = PRIMARY_KEYS.get(table)
+        pk_index = columns.index(pk) if pk in columns else None
+
+        batch = []
+        for row in rows:
+            if any(row[i] is not None and int(row[i]) not in self.keys(parent[0]) for i, parent in fks):
+                self.stats.add(table, 0, skipped=1)
+                continue
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                self._flush(table, sql, batch, pk_index, columns)
+                batch = []
+        if batch:
+            self._flush(table, sql, batch, pk_index, columns)
+
+    def _executemany(self, table, sql, rows, keys, columns):
+        """executemany inside the open transaction, indexing FTS, counting
+        rows (TableStats), updating PersonSummary and logging the new rows
+        (ChangeLog) once per batch instead of per row."""
+        fts = FTS_SOURCES.get(table)
+        fts_trigger = self._trigger(f"{fts[0]}_ai") if fts else None
+        count_trigger = self._trigger(f"{table.lower()}_count_ai")
+        summary = SUMMARY_BATCH.get(table)
+        summary_trigger = self._trigger(f"{table.lower()}_summary_ai") if summary else None
+        change_columns = CHANGE_KEYS.get(table, [None])
+        change_trigger = self._trigger(f"{table.lower()}_changes_ai") if set(change_columns) <= set(columns) else None
+        triggers = [t for t in (fts_trigger, count_trigger, summary_trigger, change_trigger) if t is not None]
+        for trigger in triggers:
+            self.conn.execute(f"DROP TRIGGER {trigger[0]}")
+        self.conn.executemany(sql, rows)
+        if fts_trigger is not None:
+            fts_table, pk, fts_columns = fts
+            cols = ", ".join(fts_columns)
+            self.conn.execute(
+                f'INSERT INTO {fts_table} (rowid, {cols}) SELECT {pk}, {cols} FROM "{table}" '
+                f"WHERE {pk} IN (SELECT value FROM json_each(?))",
+                (json.dumps(keys),),
+            )
+        if count_trigger is not None:
+            self.conn.execute(
+                "UPDATE TableStats SET rowCount = rowCount + ? WHERE tableName = ?", (len(rows), table)
+            )
+        if summary_trigger is not None:
+            person_columns, statement = summary
+            positions = [columns.index(c) for c in person_columns]
+            perkeys = sorted({int(row[i]) for row in rows for i in positions})
+            self.conn.execute(statement, (json.dumps(perkeys),))
+        if change_trigger is not None:
+            positions = [columns.index(c) for c in change_columns]
+            row_keys = json.dumps([change_key(row[i] for i in positions) for row in rows])
+            self.conn.execute(
+                "DELETE FROM ChangeLog WHERE tableName = ? AND rowKey IN (SELECT value FROM json_each(?))",
+                (table, row_keys),
+            )
+            self.conn.execute(
+                "INSERT INTO ChangeLog (tableName, rowKey, op) SELECT ?, value, 'upsert' FROM json_each(?)",
+                (table, row_keys),
+            )
+        for trigger in triggers:
+            self.conn.execute(trigger[1])
+
+    def _trigger(self, name):
+        """(name, CREATE TRIGGER statement), or None when there is no such trigger."""
+        if name not in self._triggers:
+            row = self.conn.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,)
+            ).fetchone()
+            self._triggers[name] = tuple(row) if row else None
+        return self._triggers[name]
+
+    def _flush(self, table, sql, batch, pk_index, columns):
+        keys = [int(row[pk_index]) for row in batch] if pk_index is not None else None
+        with self.transaction():  # one transaction per batch
+            self._executemany(table, sql, batch, keys, columns)
+        if pk_index is not None and table in self._keys:
+            self._keys[table].update(int(row[pk_index]) for row in batch)
+        self.stats.add(table, len(batch))
+
+    # ---- .tbl files ---------------------------------------------------
+
+    def load_tbl(self, stream, table):
+        layout = TBL_COLUMNS[table]
+        keep = [i for i, col in enumerate(layout) if col is not None]
+        columns = [layout[i] for i in keep]
+
+        def rows():
+            for line in stream:
+                line = line.rstrip("\r\n")
+                if not line:
+                    continue
+                fields = line.split("|")
+                fields += [""] * (len(layout) - len(fields))
+                yield tuple(fields[i] if fields[i] != "" else None for i in keep)
+
+        if table == "Photo":
+            self.insert_rows(table, PHOTO_COLUMNS, self._photo_rows(rows()))
+        else:
+            self.insert_rows(table, columns, rows())
+
+    def _photo_rows(self, rows):
+        """(photokey, imagedata) rows -> PHOTO_COLUMNS rows, the images put in the store."""
+        if self.store is None:
+            raise ValueError("Photo rows need a blob store")
+        for photokey, imagedata in rows:
+            if imagedata is None:
+                yield (photokey, None, None, None)
+                continue
+            data = decode_legacy_imagedata(imagedata)
+            digest, size = self.store.put(data)
+            yield (photokey, digest, sniff_mimetype(data[:16]), size)
+
+    def load_tbl_dir(self, path):
+        """Every <table>.tbl in `path`, in dependency order."""
+        files = {f[:-4].lower(): os.path.join(path, f) for f in os.listdir(path) if f.endswith(".tbl")}
+        for table in TABLE_ORDER:
+            file_path = files.get(table.lower())
+            if file_path:
+                with open(file_path, "r", encoding="utf-8", newline="") as f:
+                    self.load_tbl(f, table)
+
+    # ---- contacts (CSV / vCard) ---------------------------------------
+
+    def load_contacts(self, contacts):
+        """Insert contact dicts as Person rows plus their SocialLinks and perCat rows.
+
+        A contact is {firstName, lastName, birthday, location,
+        socials: {platformName: handle}, categories: [name, ...]}.
+        Unknown social platforms and categories are created on the way.
+        """
+        categories = self.name_map("Category", "name")
+        platforms = self.name_map("SocialType", "platformName")
+        perkey = self.next_key("Person")
+
+        batch = []
+        for contact in contacts:
+            batch.append((perkey, contact))
+            perkey += 1
+            if len(batch) >= self.batch_size:
+                self._flush_contacts(batch, categories, platforms)
+                batch = []
+        if batch:
+            self._flush_contacts(batch, categories, platforms)
+
+    def _flush_contacts(self, batch, categories, platforms):
+        people, links, per_cats = [], [], []
+        new_categories, new_platforms = [], []
+
+        for perkey, c in batch:
+            people.append((perkey, c.get("firstName") or "", c.get("lastName") or "",
+                           c.get("birthday"), c.get("location")))
+            for platform, handle in c.get("socials", {}).items():
+                if platform not in platforms:
+                    platforms[platform] = self.next_key("SocialType") + len(new_platforms)
+                    new_platforms.append((platforms[platform], platform))
+                links.append((platforms[platform], perkey, handle))
+            for name in dict.fromkeys(c.get("categories", [])):
+                if name not in categories:
+                    categories[name] = self.next_key("Category") + len(new_categories)
+                    new_categories.append((categories[name], name))
+                per_cats.append((perkey, categories[name]))
+
+        # parents first, all in one transaction
+        with self.transaction():
+            self.conn.executemany('INSERT INTO "SocialType" (socialkey, platformName) VALUES (?, ?)', new_platforms)
+            self.conn.executemany('INSERT INTO "Category" (catkey, name) VALUES (?, ?)', new_categories)
+            self._executemany(
+                "Person",
+                'INSERT INTO "Person" (perkey, firstName, lastName, birthday, location) VALUES (?, ?, ?, ?, ?)',
+                people,
+                [row[0] for row in people],
+                ["perkey", "firstName", "lastName", "birthday", "location"],
+            )
+            self.conn.executemany('INSERT INTO "SocialLinks" (socialkey, perkey, handle) VALUES (?, ?, ?)', links)
+            self._executemany("perCat", 'INSERT INTO "perCat" (perkey, catkey) VALUES (?, ?)', per_cats, None,
+                              ["perkey", "catkey"])
+
+        self.keys("SocialType").update(k for k, _ in new_platforms)
+        self.keys("Category").update(k for k, _ in new_categories)
+        self.keys("Person").update(row[0] for row in people)
+        for table, n in (("SocialType", len(new_platforms)), ("Category", len(new_categories)),
+                         ("Person", len(people)), ("SocialLinks", len(links)), ("perCat", len(per_cats))):
+            if n:
+                self.stats.add(table, n)
+
+
+# ---- contact parsers ----------------------------------------------------
+
+def read_csv_contacts(stream):
+    """Contacts from a CSV with a header row.
+
+    Person columns are matched by name (see CONTACT_ALIASES); "categories" is
+    split on ';'; any other non-empty column becomes a social link whose
+    platform is the column name (e.g. Email, LinkedIn).
+    """
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        return
+    fields = [CONTACT_ALIASES.get(h.strip().lower(), h.strip()) for h in header]
+    for values in reader:
+        contact = {"socials": {}, "categories": []}
+        for field, value in zip(fields, values):
+            value = value.strip()
+            if not value or field in IGNORED_CONTACT_COLUMNS:
+                continue
+            if field == "categories":
+                contact["categories"] = [v.strip() for v in value.split(";") if v.strip()]
+            elif field in ("firstName", "lastName", "birthday", "location"):
+                contact[field] = value
+            else:
+                contact["socials"][field] = value
+        yield contact
+
+
+def _unfold(stream):
+    """vCard logical lines (continuation lines start with a space or tab)."""
+    current = None
+    for line in stream:
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current is not None:
+        yield current
+
+
+def _vcard_unescape(value):
+    return value.replace("\\n", "\n").replace("\\,", ",").replace("\\;", ";").replace("\\\\", "\\")
+
+
+def read_vcards(stream):
+    """Contacts from a vCard (2.1/3.0/4.0) file."""
+    contact = None
+    for line in _unfold(stream):
+        if ":" not in line:
+            continue
+        key, value = line.split(":", 1)
+        name = key.split(";", 1)[0].split(".")[-1].upper()
+
+        if name == "BEGIN":
+            contact = {"socials": {}, "categories": []}
+        elif contact is None:
+            continue
+        elif name == "END":
+            if "firstName" not in contact and "fn" in contact:
+                first, _, last = contact["fn"].partition(" ")
+                contact.setdefault("firstName", first)
+                contact.setdefault("lastName", last)
+            contact.pop("fn", None)
+            yield contact
+            contact = None
+        elif name == "N":
+            parts = value.split(";")
+            contact["lastName"] = _vcard_unescape(parts[0])
+            if len(parts) > 1:
+                contact["firstName"] = _vcard_unescape(parts[1])
+        elif name == "FN":
+            contact["fn"] = _vcard_unescape(value)
+        elif name == "BDAY":
+            contact["birthday"] = value
+        elif name == "ADR":
+            # PO box;extended;street;locality;region;postal code;country
+            parts = [_vcard_unescape(p) for p in value.split(";")]
+            place = [p for p in parts[3:5] if p]
+            if place:
+                contact["location"] = ", ".join(place)
+        elif name == "EMAIL":
+            contact["socials"].setdefault("Email", value)
+        elif name == "TEL":
+            contact["socials"].setdefault("Phone", value)
+        elif name == "URL":
+            contact["socials"].setdefault("Website", value)
+        elif name == "CATEGORIES":
+            contact["categories"] += [_vcard_unescape(c).strip() for c in value.split(",") if c.strip()]
+
+
+def detect_format(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return {".tbl": "tbl", ".csv": "csv", ".vcf": "vcard", ".vcard": "vcard"}.get(ext)
+
+
+def table_for_file(filename):
+    stem = os.path.splitext(os.path.basename(filename))[0].lower()
+    for table in TABLE_ORDER:
+        if table.lower() == stem:
+            return table
+    return None
+
+
+def import_stream(importer, stream, fmt, table=None):
+    """Load one text stream in the given format ('tbl', 'csv' or 'vcard')."""
+    if fmt == "tbl":
+        if table not in TBL_COLUMNS:
+            raise ValueError(f"unknown table: {table}")
+        importer.load_tbl(stream, table)
+    elif fmt == "csv":
+        importer.load_contacts(read_csv_contacts(stream))
+    elif fmt == "vcard":
+        importer.load_contacts(read_vcards(stream))
+    else:
+        raise ValueError(f"unknown format: {fmt}")
+
+
+def text_stream(binary):
+    return io.TextIOWrapper(binary, encoding="utf-8-sig", newline="")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk load .tbl, CSV or vCard files into the CRM database.")
+    parser.add_argument("path", help="a file, or a directory of <table>.tbl files")
+    parser.add_argument("--format", choices=["tbl", "csv", "vcard"], help="default: from the file extension")
+    parser.add_argument("--table", help="target table for a single .tbl file (default: from the file name)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    from app import create_app, migrate_database
+    from blobstore import get_store
+    from ORM_models import db
+
+    with create_app(features=()).app_context():
+        migrate_database()
+        conn = db.engine.raw_connection()
+        try:
+            importer = BulkImporter(conn, args.batch_size, get_store())
+            if os.path.isdir(args.path):
+                importer.load_tbl_dir(args.path)
+            else:
+                fmt = args.format or detect_format(args.path)
+                with open(args.path, "r", encoding="utf-8-sig", newline="") as f:
+                    import_stream(importer, f, fmt, args.table or table_for_file(args.path))
+        finally:
+            conn.close()
+
+    result = importer.stats.as_dict()
+    for table, n in result["rows"].items():
+        skipped = result["skipped"].get(table)
+        print(f"{table:18} {n:>10}" + (f"  ({skipped} skipped)" if skipped else ""))
+    print(f"{result['total']} rows in {result['seconds']}s ({result['rowsPerSecond']} rows/sec)")
@@ -0,0 +1,85 @@
+# Change feed for incremental client sync (GET /api/changes).
+#
+# Triggers (migration 8, migrations.py) log every insert, update and delete
+# of the CRM tables in ChangeLog -- including ON DELETE CASCADE / SET NULL
+# changes, admin edits and imports, which session events wouldn't see. The
+# log holds one entry per row, its latest change: a write replaces the row's
+# entry with a new one, so reading everything after a sequence number already
+# gives each changed row once, and seq only ever grows.
+#
+# A client takes `seq` from a first call without `since` before it loads its
+# lists, then asks for what came after it. Entries are the row's current
+# state ("upsert") or a tombstone ("delete"); a row changed again while a
+# page was being read can arrive a second time later, so applying an entry
+# must be idempotent. Photo rows leave out the legacy inline image.
+import json
+
+from sqlalchemy import text, tuple_
+
+from migrations import CHANGE_KEYS
+from ORM_models import (Category, NotedPerson, NotePhoto, Notes, PerCat, Person, Photo, RelationshipType,
+                        Relationships, RemCat, Reminders, RemPer, SocialLinks, SocialType)
+import serializers as ser
+
+MODELS = {
+    model.__tablename__: model
+    for model in (Photo, Notes, SocialType, RelationshipType, Category, Person, Reminders, SocialLinks,
+                  NotePhoto, NotedPerson, Relationships, PerCat, RemPer, RemCat)
+}
+TABLES = tuple(MODELS)
+
+SERIALIZERS = {table: ser.for_model(model) for table, model in MODELS.items()}
+SERIALIZERS["Photo"] = ser.Serializer(
+    Photo, {k: v for k, v in ser.table_fields(Photo).items() if k != "imagedata"}
+)
+
+
+def head(session):
+    """The sequence number of the latest change (0 for none)."""
+    return session.execute(text("SELECT COALESCE(MAX(seq), 0) FROM ChangeLog")).scalar()
+
+
+def changes_since(session, since, limit):
+    """Up to `limit` entries after `since`, oldest first, with the rows they
+    name; "seq" is the `since` of the next call."""
+    entries = session.execute(
+        text("SELECT seq, tableName, rowKey, op FROM ChangeLog WHERE seq > :since ORDER BY seq LIMIT :n"),
+        {"since": since, "n": limit + 1},
+    ).all()
+    more = len(entries) > limit
+    entries = entries[:limit]
+
+    keys = {}   # table -> key tuples of the upserted rows
+    for _, table, row_key, op in entries:
+        if op == "upsert":
+            keys.setdefault(table, []).append(tuple(json.loads(row_key)))
+    rows = {table: _rows(session, table, table_keys) for table, table_keys in keys.items()}
+
+    items = []
+    for seq, table, row_key, op in entries:
+        key = tuple(json.loads(row_key))
+        row = rows[table].get(key) if op == "upsert" else None
+        if row is None:
+            op = "delete"   # deleted after the entry was read; its tombstone follows
+        items.append({
+            "seq": seq,
+            "table": table,
+            "key": dict(zip(CHANGE_KEYS[table], key)),
+            "op": op,
+            "row": row,
+        })
+    return {"items": items, "seq": entries[-1][0] if entries else since, "more": more}
+
+
+def _rows(session, table, keys):
+    """key tuple -> serialized row, for the rows of `table` still there."""
+    model = MODELS[table]
+    serializer = SERIALIZERS[table]
+    columns = [getattr(model, c) for c in CHANGE_KEYS[table]]
+    if len(columns) == 1:
+        where = columns[0].in_([k[0] for k in keys])
+    else:
+        where = tuple_(*columns).in_(keys)
+    result = session.execute(serializer.query(*columns).where(where))
+    n = len(serializer.names)
+    return {tuple(r[n:]): serializer.row(r) for r in result}
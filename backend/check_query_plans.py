@@ -0,0 +1,152 @@
+# Runs EXPLAIN QUERY PLAN on every statement in SQL_queries.sql against a
+# scratch database built from create_schema.sql + migrations.py, and fails
+# if any of them falls back to a full table scan or can't be planned.
+#
+#   python check_query_plans.py            (exit status 1 on a failure)
+#   python check_query_plans.py -v         (print every plan)
+#
+# Each statement is planned with the sample parameters in SAMPLE_PARAMS:
+# SQLite plans with the bound values, and e.g. a prefix LIKE only becomes an
+# index range when its pattern is known.
+import os
+import re
+import sqlite3
+import sys
+
+from migrations import run_migrations
+
+SQL_DIR = os.path.join(os.path.dirname(__file__), "..", "Phase 2 - schema + queries")
+SCHEMA_PATH = os.path.join(SQL_DIR, "create_schema.sql")
+QUERIES_PATH = os.path.join(SQL_DIR, "SQL_queries.sql")
+
+# queries that are allowed to scan, with the reason
+KNOWN_SCANS = {
+    "Q8": "returns the whole contact list; ix_person_name supplies the order",
+}
+
+# statements that can't be planned against the final schema, with the reason
+KNOWN_ERRORS = {
+    "Optional helper": "Photo.filePath/caption are from a Phase 2 draft, not create_schema.sql",
+    "Q15": "Relationships.startDate is from a Phase 2 draft, not create_schema.sql",
+    "Q18": "Relationships.startDate is from a Phase 2 draft, not create_schema.sql",
+    "Q20": "Reminders.lastContactDate is from a Phase 2 draft, not create_schema.sql",
+}
+
+# representative values for each statement's '?' parameters, by label (in
+# the order of its "-- Params:" comment)
+SAMPLE_PARAMS = {
+    "Q1": ("Dinner plans", "Talked about the trip"),
+    "Q2": (1, 1),
+    "Optional helper": ("photos/1.jpg", "At the beach"),
+    "Q3": ("Julia", "Rossi"),
+    "Q4": ("Follow up next week", 1),
+    "Q5": (1,),
+    "Q6": (None, "Julia", "Rossi", "1996-12-28", "Merced, CA"),
+    "Q7": ("Julia", "Rossi", "1996-12-28", "Merced, CA", 1, 1),
+    "Q9": (7, "Merced%", "Friend", "Friend"),
+    "Q10": (1,),
+    "Q11": ("Instagram", "https://instagram.com"),
+    "Q12": ("Instagram",),
+    "Q13": (1, 1, "@julia", "https://instagram.com/julia"),
+    "Q14": ("@julia", "https://instagram.com/julia", 1, 1),
+    "Q15": (1, 1, 2, 1, 2, 1, 2, 2, 1, "2024-01-01"),
+    "Q16": ("Friend", "Someone you know well"),
+    "Q17": (2, 1, 2, 1, 2, 1, 2, 2, 1),
+    "Q18": ("Friend",),
+    "Q19": ("Friend",),
+    "Q20": ("Dinner", "With Michael", "2026-11-15 17:00:00", None),
+    "Helper": (1, 1),
+    "Q24": (1,),
+    "Q25": ("2026-11-15 17:00:00", 1),
+    "Q26": ("Soccer Player", "Plays soccer"),
+    "Q27": ("Soccer Player",),
+    "Q28": (1,),
+    "Q29": ("Soccer Player",),
+    "Q30": ("Soccer Player",),
+}
+
+LABEL_RE = re.compile(r"^--\s*(Q\d+|Helper|Optional helper)\b", re.MULTILINE)
+
+
+def build_database():
+    conn = sqlite3.connect(":memory:")
+    with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
+        conn.executescript(f.read())
+    run_migrations(conn)
+    return conn
+
+
+def strip_comments(sql):
+    return "\n".join(line for line in sql.splitlines() if not line.strip().startswith("--"))
+
+
+def split_statements(text):
+    """Yield (label, sql) for each statement, labelled by the last '-- Qn' header seen."""
+    label = None
+    buf = ""
+    for line in text.splitlines(keepends=True):
+        m = LABEL_RE.match(line)
+        if m:
+            label = m.group(1)
+        buf += line
+        if sqlite3.complete_statement(buf):
+            sql = strip_comments(buf).strip()
+            buf = ""
+            if sql and not sql.upper().startswith("PRAGMA"):
+                yield label, sql
+
+
+def full_scans(plan):
+    """Plan rows that walk a whole table (directly or through an index)."""
+    scans = []
+    for _id, _parent, _unused, detail in plan:
+        if detail.startswith("SCAN ") and "CONSTANT ROW" not in detail:
+            scans.append(detail)
+    return scans
+
+
+def main(verbose=False):
+    conn = build_database()
+    with open(QUERIES_PATH, "r", encoding="utf-8") as f:
+        statements = list(split_statements(f.read()))
+
+    failures = 0
+    for label, sql in statements:
+        params = SAMPLE_PARAMS.get(label, ()) if "?" in sql else ()
+        if len(params) != sql.count("?"):
+            print(f"FAIL  {label}: {sql.count('?')} parameters, {len(params)} in SAMPLE_PARAMS")
+            failures += 1
+            continue
+        try:
+            plan = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        except sqlite3.Error as e:
+            if label in KNOWN_ERRORS:
+                print(f"KNOWN {label}: {e} ({KNOWN_ERRORS[label]})")
+            else:
+                print(f"FAIL  {label}: {e}")
+                failures += 1
+            continue
+
+        scans = full_scans(plan)
+        if scans and label in KNOWN_SCANS:
+            status = "KNOWN"
+        elif scans:
+            status = "FAIL"
+            failures += 1
+        else:
+            status = "ok"
+
+        print(f"{status:5} {label}: {' | '.join(scans) if scans else sql.splitlines()[0]}")
+        if verbose:
+            for row in plan:
+                print(f"        {row[3]}")
+
+    conn.close()
+    if failures:
+        print(f"{failures} statement(s) fall back to a full table scan or can't be planned")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(verbose="-v" in sys.argv[1:]))
@@ -0,0 +1,50 @@
+# Read/write connection roles.
+#
+# The default engine is the writer. A second engine, registered under the
+# READER_BIND key in SQLALCHEMY_BINDS, opens its connections with
+# PRAGMA query_only so they can never take the write lock. Handlers wrapped in
+# @read_only send every statement of the request to that engine; with WAL
+# enabled those reads no longer wait behind writers.
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from flask_sqlalchemy.session import Session
+
+READER_BIND = "reader"
+
+_role = ContextVar("db_role", default="writer")
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _role.get() == "reader":
+            engine = self._db.engines.get(READER_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@contextmanager
+def reading():
+    """Route the session to the read-only engine inside the block."""
+    token = _role.set("reader")
+    try:
+        yield
+    finally:
+        _role.reset(token)
+
+
+def read_only(view):
+    """Run a view against the read-only engine."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with reading():
+            return view(*args, **kwargs)
+    return wrapper
+
+
+def set_reader_pragma(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only = ON;")
+    cursor.close()
@@ -0,0 +1,134 @@
+# Streaming export of the whole CRM, one record per person.
+#
+# People are read with yield_per (the driver cursor is consumed a batch at a
+# time) and their social links, categories, notes, reminders and relationships
+# are loaded per batch with selectinload, so memory stays flat however large
+# the database is. The generators yield text/bytes chunks for a streamed
+# response; gzip_chunks() compresses on the fly.
+import csv
+import io
+import json
+import zlib
+
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload
+
+from ORM_models import db, Person, SocialType, SocialLinks, PerCat, NotedPerson, RemPer, Relationships
+
+YIELD_PER = 500
+CHUNK_SIZE = 64 * 1024
+
+PERSON_COLUMNS = ["perkey", "photokey", "firstName", "lastName", "birthday", "location"]
+
+
+def iter_people():
+    stmt = (
+        select(Person)
+        .options(
+            selectinload(Person.social_links).joinedload(SocialLinks.social_type),
+            selectinload(Person.per_cats).joinedload(PerCat.category),
+            selectinload(Person.noted_person_entries).joinedload(NotedPerson.note),
+            selectinload(Person.rem_pers).joinedload(RemPer.reminder),
+            selectinload(Person.rels_as_first).joinedload(Relationships.rel_type),
+            selectinload(Person.rels_as_second).joinedload(Relationships.rel_type),
+        )
+        .order_by(Person.perkey)
+        .execution_options(yield_per=YIELD_PER)
+    )
+    for p in db.session.scalars(stmt):
+        yield person_record(p)
+
+
+def person_record(p):
+    record = {col: getattr(p, col) for col in PERSON_COLUMNS}
+    record["socialLinks"] = [
+        {"platform": link.social_type.platformName, "handle": link.handle, "profileURL": link.profileURL}
+        for link in p.social_links
+    ]
+    record["categories"] = [pc.category.name for pc in p.per_cats]
+    record["notes"] = [
+        {
+            "id": np.note.notekey,
+            "title": np.note.title,
+            "content": np.note.content,
+            "created_at": np.note.dateCreated,
+            "updated_at": np.note.lastModified,
+        }
+        for np in p.noted_person_entries
+    ]
+    record["reminders"] = [
+        {
+            "id": rp.reminder.remkey,
+            "label": rp.reminder.title,
+            "description": rp.reminder.description,
+            "due_date": rp.reminder.dueDate,
+            "completed": rp.reminder.completed,
+        }
+        for rp in p.rem_pers
+    ]
+    record["relationships"] = [
+        {"perkey": rel.perkey2, "relTypeKey": rel.relTypeKey, "type": rel.rel_type.name}
+        for rel in p.rels_as_first
+    ] + [
+        {"perkey": rel.perkey1, "relTypeKey": rel.relTypeKey, "type": rel.rel_type.name}
+        for rel in p.rels_as_second
+    ]
+    return record
+
+
+def _buffered(pieces):
+    """Join small strings into ~CHUNK_SIZE chunks."""
+    buf = []
+    size = 0
+    for piece in pieces:
+        buf.append(piece)
+        size += len(piece)
+        if size >= CHUNK_SIZE:
+            yield "".join(buf)
+            buf = []
+            size = 0
+    if buf:
+        yield "".join(buf)
+
+
+def ndjson_chunks():
+    return _buffered(json.dumps(r, separators=(",", ":")) + "\n" for r in iter_people())
+
+
+def csv_chunks():
+    """One row per person. Social links get a column per platform and
+    categories are ';' separated, which is what bulk_import.py reads back;
+    notes, reminders and relationships are JSON cells."""
+    platforms = [name for (name,) in db.session.query(SocialType.platformName).order_by(SocialType.socialkey)]
+    header = PERSON_COLUMNS + platforms + ["categories", "notes", "reminders", "relationships"]
+
+    def rows():
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(header)
+        for r in iter_people():
+            handles = {link["platform"]: link["handle"] for link in r["socialLinks"]}
+            writer.writerow(
+                [r[col] for col in PERSON_COLUMNS]
+                + [handles.get(name, "") for name in platforms]
+                + [
+                    ";".join(r["categories"]),
+                    json.dumps(r["notes"]),
+                    json.dumps(r["reminders"]),
+                    json.dumps(r["relationships"]),
+                ]
+            )
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+
+    return _buffered(rows())
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,477 @@
+# In-memory relationship graph for the /api/graph/* endpoints.
+#
+# Every person is a node, numbered densely in perkey order; Relationships
+# rows are undirected edges (the relationship type doesn't matter to any of
+# the queries and isn't kept). The adjacency is kept in CSR form -- two flat
+# arrays: offsets[i]:offsets[i+1] is the slice of targets holding node i's
+# neighbours -- 8 bytes per edge instead of a dict or list per person. It is
+# built on first use from one scan of Person and merged index scans of
+# Relationships on the reader engine.
+#
+# Committed ORM writes are folded in incrementally: the touched pairs and
+# persons are re-read after the commit and the difference goes to a small
+# overlay (edges added since the build, base edges removed since). Bulk
+# statements on Relationships and raw imports mark the index stale, and once
+# the overlay reaches `compact_ratio` of the base edges it is rebuilt, both on
+# next use. Like the scheduler it lives in the process: with several workers
+# set GRAPH_RESYNC to rebuild every so many seconds.
+#
+# On top: bidirectional BFS for shortest paths, neighbour set intersection
+# for mutual connections, a union-find kept up to date on edge inserts for
+# connected components, and per-node degree counts for degree centrality.
+import heapq
+import threading
+import time
+from array import array
+from collections import Counter
+from itertools import accumulate
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, text
+
+from db_roles import RoutingSession
+
+DEFAULT_COMPACT_RATIO = 0.1
+LOAD_CHUNK = 50000   # perkeys per relationship query
+
+
+class GraphSource:
+    """Reads people and relationships with its own engine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def load(self, chunk=LOAD_CHUNK):
+        """Perkeys in order, then both directions of every relationship as
+        (perkeys, neighbours) pairs of int lists, sorted by perkey, for
+        `chunk` perkeys at a time."""
+        # group_concat: a million-row scan costs far less as a few big
+        # strings than as Python tuples
+        conn = self.engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN")   # one snapshot for all the statements
+            (keys,), = cursor.execute("SELECT group_concat(perkey) FROM (SELECT perkey FROM Person ORDER BY perkey)")
+            keys = [int(k) for k in keys.split(",")] if keys else []
+            yield keys
+            if not keys:
+                return
+            for lo in range(keys[0], keys[-1] + 1, chunk):
+                # a merge of the (perkey1, perkey2) and (perkey2, perkey1)
+                # indexes over one range, no sort
+                (sources, neighbours), = cursor.execute(
+                    "SELECT group_concat(p), group_concat(n) FROM ("
+                    " SELECT perkey1 AS p, perkey2 AS n FROM Relationships WHERE perkey1 >= :lo AND perkey1 < :hi"
+                    " UNION ALL"
+                    " SELECT perkey2, perkey1 FROM Relationships WHERE perkey2 >= :lo AND perkey2 < :hi"
+                    " ORDER BY 1)",
+                    {"lo": lo, "hi": lo + chunk},
+                )
+                if sources:
+                    yield map(int, sources.split(",")), map(int, neighbours.split(","))
+            cursor.close()
+        finally:
+            conn.rollback()
+            conn.close()
+
+    def perkeys(self):
+        with self.engine.connect() as conn:
+            return {k for (k,) in conn.execute(text("SELECT perkey FROM Person"))}
+
+    def existing(self, perkeys):
+        with self.engine.connect() as conn:
+            return {k for (k,) in conn.execute(text(
+                f"SELECT perkey FROM Person WHERE perkey IN ({','.join('%d' % k for k in perkeys)})"
+            ))}
+
+    def relationships(self, pairs):
+        """The (perkey1, perkey2) pairs that exist."""
+        sql = text(
+            "SELECT perkey1, perkey2 FROM Relationships "
+            f"WHERE (perkey1, perkey2) IN (VALUES {','.join('(%d, %d)' % pair for pair in pairs)})"
+        )
+        with self.engine.connect() as conn:
+            return {(p1, p2) for p1, p2 in conn.execute(sql)}
+
+
+class GraphIndex:
+    def __init__(self, source, compact_ratio=DEFAULT_COMPACT_RATIO, resync=None, clock=time.monotonic):
+        self.source = source
+        self.compact_ratio = compact_ratio
+        self.resync = resync
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._stale = True
+        self._built_at = None
+        self.build_seconds = None
+
+    # --- building ---
+
+    def _build(self):
+        started = time.perf_counter()
+        load = self.source.load()
+        keys = array("q", next(load))             # node -> perkey
+        index = dict(zip(keys, range(len(keys))))
+        n = len(keys)
+
+        # the rows come sorted by node, so targets fill in order and offsets
+        # are the running sum of each node's row count
+        counts = Counter()
+        targets = array("i")
+        for sources, neighbours in load:
+            counts.update(sources)
+            targets.extend(map(index.__getitem__, neighbours))
+        degree = array("l", [counts[k] for k in keys])
+        offsets = array("q", accumulate(degree, initial=0))
+
+        self._keys = keys
+        self._index = index
+        self._offsets = offsets
+        self._targets = targets
+        self._base_nodes = n
+        self._base_edges = len(targets) // 2
+        self._degree = degree
+        self._added = {}          # node -> {neighbours}, edges added since the build
+        self._added_edges = 0
+        self._removed = set()     # (i, j), i < j: base edges removed since the build
+        self._edges = len(targets) // 2
+        self._parent = None       # union-find, built on first component query
+        self._top = None          # (version, cap, first `cap` nodes by degree) for centrality
+        self._summary = None      # (version, cap, count, the `cap` largest components)
+        self.version = 0
+        self._stale = False
+        self._built_at = self._clock()
+        self.build_seconds = time.perf_counter() - started
+
+    def _fresh(self):
+        if not self._stale and self.resync and self._clock() - self._built_at >= self.resync:
+            self._stale = True
+        if self._stale:
+            self._build()
+
+    def mark_stale(self):
+        with self._lock:
+            self._stale = True
+
+    # --- adjacency ---
+
+    def _neighbours(self, i):
+        """Neighbour nodes of node i (an array slice when there is no overlay to apply)."""
+        if i < self._base_nodes:
+            base = self._targets[self._offsets[i]:self._offsets[i + 1]]
+            if self._removed:
+                base = [j for j in base if (min(i, j), max(i, j)) not in self._removed]
+        else:
+            base = ()
+        extra = self._added.get(i)
+        if extra:
+            return list(base) + list(extra)
+        return base
+
+    def _has_edge(self, i, j):
+        extra = self._added.get(i)
+        if extra and j in extra:
+            return True
+        if i >= self._base_nodes or (min(i, j), max(i, j)) in self._removed:
+            return False
+        return j in self._targets[self._offsets[i]:self._offsets[i + 1]]
+
+    def _add_edge(self, i, j):
+        self._added.setdefault(i, set()).add(j)
+        self._added.setdefault(j, set()).add(i)
+        self._added_edges += 1
+        self._degree[i] += 1
+        self._degree[j] += 1
+        self._edges += 1
+        if self._parent is not None:
+            self._union(i, j)
+
+    def _remove_edge(self, i, j):
+        extra = self._added.get(i)
+        if extra and j in extra:
+            extra.discard(j)
+            self._added[j].discard(i)
+            self._added_edges -= 1
+        else:
+            self._removed.add((min(i, j), max(i, j)))
+        self._degree[i] -= 1
+        self._degree[j] -= 1
+        self._edges -= 1
+        self._parent = None   # a split can't be undone in a union-find
+
+    def _add_node(self, perkey):
+        i = len(self._keys)
+        self._keys.append(perkey)
+        self._index[perkey] = i
+        self._degree.append(0)
+        if self._parent is not None:
+            self._parent.append(i)
+            self._size.append(1)
+            self._components += 1
+        return i
+
+    def _drop_node(self, perkey):
+        i = self._index.pop(perkey)
+        for j in list(self._neighbours(i)):
+            self._remove_edge(i, j)
+        self._parent = None
+
+    # --- incremental updates ---
+
+    def apply(self, pairs=(), persons=(), all_persons=False):
+        """Fold committed changes in: the (perkey1, perkey2) `pairs` and the
+        `persons` are re-read; all_persons re-reads the whole node set."""
+        with self._lock:
+            if self._stale:
+                return
+            if all_persons:
+                existing = self.source.perkeys()
+                persons = existing.symmetric_difference(self._index)
+            else:
+                existing = self.source.existing(persons) if persons else set()
+            present = self.source.relationships(set(pairs)) if pairs else set()
+
+            for perkey in persons:
+                if perkey in existing and perkey not in self._index:
+                    self._add_node(perkey)
+            for (p1, p2) in pairs:
+                i, j = self._index.get(p1), self._index.get(p2)
+                if i is None or j is None:
+                    continue   # an endpoint was deleted; its edges go with it below
+                exists = (p1, p2) in present
+                if exists and not self._has_edge(i, j):
+                    self._add_edge(i, j)
+                elif not exists and self._has_edge(i, j):
+                    self._remove_edge(i, j)
+            for perkey in persons:
+                if perkey not in existing and perkey in self._index:
+                    self._drop_node(perkey)
+
+            self.version += 1
+            if self._added_edges + len(self._removed) > self.compact_ratio * max(self._base_edges, 1000):
+                self._stale = True
+
+    # --- queries (all take and return perkeys) ---
+
+    def __contains__(self, perkey):
+        with self._lock:
+            self._fresh()
+            return perkey in self._index
+
+    def shortest_path(self, source, target, max_depth=None):
+        """Perkeys from source to target along one shortest path, or None."""
+        with self._lock:
+            self._fresh()
+            s, t = self._index[source], self._index[target]
+            if s == t:
+                return [source]
+            # bidirectional BFS, always expanding the smaller frontier
+            parents = ({s: None}, {t: None})
+            frontiers = ([s], [t])
+            depth = 0
+            while frontiers[0] and frontiers[1] and (max_depth is None or depth < max_depth):
+                side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+                mine, other = parents[side], parents[1 - side]
+                nxt = []
+                meet = None
+                for i in frontiers[side]:
+                    for j in self._neighbours(i):
+                        if j not in mine:
+                            mine[j] = i
+                            if j in other:
+                                meet = j
+                                break
+                            nxt.append(j)
+                    if meet is not None:
+                        break
+                depth += 1
+                if meet is not None:
+                    return self._join(parents, meet)
+                frontiers = (nxt, frontiers[1]) if side == 0 else (frontiers[0], nxt)
+            return None
+
+    def _join(self, parents, meet):
+        path = []
+        node = meet
+        while node is not None:
+            path.append(node)
+            node = parents[0][node]
+        path.reverse()
+        node = parents[1][meet]
+        while node is not None:
+            path.append(node)
+            node = parents[1][node]
+        return [self._keys[i] for i in path]
+
+    def neighbours(self, perkey):
+        with self._lock:
+            self._fresh()
+            return [self._keys[j] for j in self._neighbours(self._index[perkey])]
+
+    def mutual(self, a, b):
+        """Perkeys related to both a and b, in perkey order."""
+        with self._lock:
+            self._fresh()
+            i, j = self._index[a], self._index[b]
+            if self._degree[i] > self._degree[j]:
+                i, j = j, i
+            common = set(self._neighbours(j)).intersection(self._neighbours(i))
+            common.discard(i)
+            common.discard(j)
+            return sorted(self._keys[k] for k in common)
+
+    def degree(self, perkey):
+        with self._lock:
+            self._fresh()
+            return self._degree[self._index[perkey]]
+
+    def top_degree(self, limit):
+        """[(perkey, degree)] of the `limit` best connected people."""
+        with self._lock:
+            self._fresh()
+            if self._top is None or self._top[:2] != (self.version, max(limit, self._top[1])):
+                cap = max(limit, 100)
+                self._top = (self.version, cap, heapq.nlargest(
+                    cap, self._index.values(), key=lambda i: (self._degree[i], -self._keys[i])
+                ))
+            return [(self._keys[i], self._degree[i]) for i in self._top[2][:limit]]
+
+    # --- connected components ---
+
+    def _find(self, i):
+        parent = self._parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def _union(self, i, j):
+        a, b = self._find(i), self._find(j)
+        if a == b:
+            return
+        if self._size[a] < self._size[b]:
+            a, b = b, a
+        self._parent[b] = a
+        self._size[a] += self._size[b]
+        self._components -= 1
+
+    def _union_find(self):
+        if self._parent is not None:
+            return
+        n = len(self._keys)
+        self._parent = array("l", range(n))
+        self._size = array("l", [1]) * n
+        self._components = len(self._index)   # dropped nodes don't count
+        for i in self._index.values():
+            for j in self._neighbours(i):
+                if i < j:
+                    self._union(i, j)
+
+    def component(self, perkey, limit):
+        """(size, up to `limit` member perkeys in BFS order) of perkey's component."""
+        with self._lock:
+            self._fresh()
+            self._union_find()
+            start = self._index[perkey]
+            size = self._size[self._find(start)]
+            seen = {start}
+            queue = [start]
+            for i in queue:
+                if len(seen) >= limit:
+                    break
+                for j in self._neighbours(i):
+                    if j not in seen:
+                        seen.add(j)
+                        queue.append(j)
+            return size, [self._keys[i] for i in queue[:limit]]
+
+    def components(self, limit):
+        """(number of components, [(size, smallest perkey)] of the `limit` largest)."""
+        with self._lock:
+            self._fresh()
+            if self._summary is None or self._summary[:2] != (self.version, max(limit, self._summary[1])):
+                cap = max(limit, 100)
+                self._union_find()
+                first = {}
+                for perkey, i in self._index.items():
+                    root = self._find(i)
+                    if root not in first or perkey < first[root]:
+                        first[root] = perkey
+                largest = heapq.nlargest(cap, first.items(), key=lambda item: (self._size[item[0]], -item[1]))
+                self._summary = (self.version, cap, self._components, [(self._size[r], k) for r, k in largest])
+            return self._summary[2], self._summary[3][:limit]
+
+    def stats(self):
+        with self._lock:
+            self._fresh()
+            return {
+                "nodes": len(self._index),
+                "edges": self._edges,
+                "overlay": self._added_edges + len(self._removed),
+                "buildSeconds": round(self.build_seconds, 3),
+            }
+
+
+# -------------------------------------------------
+# Session hooks: fold committed ORM writes into the index
+# -------------------------------------------------
+def _changes(session):
+    return session.info.setdefault("graph_changes", {"pairs": set(), "persons": set(), "all_persons": False,
+                                                     "bulk": False})
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _track_flush(session, flush_context):
+    from ORM_models import Person, Relationships
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Relationships) and (obj in session.new or obj in session.deleted):
+            _changes(session)["pairs"].add((obj.perkey1, obj.perkey2))
+        elif isinstance(obj, Person) and (obj in session.new or obj in session.deleted):
+            _changes(session)["persons"].add(obj.perkey)
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _track_bulk(state):
+    from ORM_models import Person, Relationships
+    if (state.is_insert or state.is_update or state.is_delete) and state.bind_mapper is not None:
+        if state.bind_mapper.class_ is Relationships:
+            _changes(state.session)["bulk"] = True
+        elif state.bind_mapper.class_ is Person and not state.is_update:
+            _changes(state.session)["all_persons"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _apply_changes(session):
+    if session.in_nested_transaction():  # a SAVEPOINT (write_queue.py), not the commit
+        return
+    changes = session.info.pop("graph_changes", None)
+    if not changes or not has_app_context():
+        return
+    graph = current_app.extensions.get("graph_index")
+    if graph is None:
+        return
+    if changes["bulk"]:
+        graph.mark_stale()
+    else:
+        graph.apply(changes["pairs"], changes["persons"], changes["all_persons"])
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _discard_changes(session):
+    if not session.in_nested_transaction():
+        session.info.pop("graph_changes", None)
+
+
+def init_app(app, engine):
+    """Create the app's graph index; it is built on first use."""
+    graph = GraphIndex(
+        GraphSource(engine),
+        compact_ratio=app.config.get("GRAPH_COMPACT_RATIO", DEFAULT_COMPACT_RATIO),
+        resync=app.config.get("GRAPH_RESYNC"),
+    )
+    app.extensions["graph_index"] = graph
+    return graph
+
+
+def get_graph():
+    return current_app.extensions["graph_index"]
@@ -0,0 +1,274 @@
+# Opt-in request instrumentation (METRICS = True, or CRM_METRICS=1).
+#
+# SQLAlchemy cursor events time every statement; Flask request hooks add the
+# statements, SQL time and JSON encoding time of a request to per-endpoint
+# totals when the request context is torn down, or for a streamed body once
+# it has been sent. Statements slower than METRICS_SLOW_QUERY_MS are kept as
+# samples, the most recent SLOW_SAMPLES distinct ones.
+#
+# GET /api/_metrics renders everything in the Prometheus text format. A
+# request count next to a queries-per-request histogram is what shows an
+# N+1: the endpoint's buckets sit at the high end.
+#
+# With METRICS_PROFILE (CRM_PROFILE=1) a request sent with "X-Profile: 1" runs
+# under cProfile; the stats are dumped to METRICS_PROFILE_DIR and the file
+# name is returned in the X-Profile-File header. Keep it off in production.
+import cProfile
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 250)
+SLOW_QUERY_MS = 100
+SLOW_SAMPLES = 50
+BACKGROUND = "<background>"   # statements run outside a request (scheduler, CLI)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f"{name}_sum{{{labels}}} {self.sum:.6f}"
+        yield f"{name}_count{{{labels}}} {cumulative}"
+
+
+class Metrics:
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS):
+        self.slow_query_ms = slow_query_ms
+        self.requests = {}        # (endpoint, method, status) -> count
+        self.durations = {}       # endpoint -> Histogram of seconds
+        self.queries = {}         # endpoint -> Histogram of statements per request
+        self.sql_seconds = {}     # endpoint -> seconds in SQL
+        self.encode_seconds = {}  # endpoint -> seconds encoding JSON
+        self.background = [0, 0.0]
+        self.slow = OrderedDict() # (endpoint, statement) -> (seconds, count)
+        self._lock = threading.Lock()
+
+    def record_request(self, endpoint, method, status, seconds, queries, sql, encode):
+        with self._lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if endpoint not in self.durations:
+                self.durations[endpoint] = Histogram(DURATION_BUCKETS)
+                self.queries[endpoint] = Histogram(QUERY_BUCKETS)
+            self.durations[endpoint].observe(seconds)
+            self.queries[endpoint].observe(queries)
+            self.sql_seconds[endpoint] = self.sql_seconds.get(endpoint, 0.0) + sql
+            self.encode_seconds[endpoint] = self.encode_seconds.get(endpoint, 0.0) + encode
+
+    def record_background(self, seconds):
+        with self._lock:
+            self.background[0] += 1
+            self.background[1] += seconds
+
+    def record_slow(self, endpoint, statement, seconds):
+        statement = " ".join(statement.split())[:200]
+        with self._lock:
+            key = (endpoint, statement)
+            _, count = self.slow.pop(key, (0, 0))
+            self.slow[key] = (seconds, count + 1)
+            while len(self.slow) > SLOW_SAMPLES:
+                self.slow.popitem(last=False)
+
+    def render(self, cache=None):
+        """The Prometheus text exposition of everything recorded."""
+        out = []
+
+        def family(name, kind, help_text):
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            family("crm_http_requests_total", "counter", "Requests by endpoint, method and status.")
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                out.append(f'crm_http_requests_total{{{_labels(endpoint=endpoint, method=method, status=status)}}} {count}')
+            family("crm_http_request_duration_seconds", "histogram", "Request time, including streamed bodies.")
+            for endpoint, hist in sorted(self.durations.items()):
+                out.extend(hist.lines("crm_http_request_duration_seconds", _labels(endpoint=endpoint)))
+            family("crm_sql_queries_per_request", "histogram", "SQL statements run by one request.")
+            for endpoint, hist in sorted(self.queries.items()):
+                out.extend(hist.lines("crm_sql_queries_per_request", _labels(endpoint=endpoint)))
+            family("crm_sql_seconds_total", "counter", "Time spent executing SQL.")
+            for endpoint, seconds in sorted(self.sql_seconds.items()):
+                out.append(f"crm_sql_seconds_total{{{_labels(endpoint=endpoint)}}} {seconds:.6f}")
+            out.append(f"crm_sql_seconds_total{{{_labels(endpoint=BACKGROUND)}}} {self.background[1]:.6f}")
+            family("crm_sql_queries_total", "counter", "SQL statements run outside a request.")
+            out.append(f"crm_sql_queries_total{{{_labels(endpoint=BACKGROUND)}}} {self.background[0]}")
+            family("crm_json_encode_seconds_total", "counter", "Time spent encoding JSON responses.")
+            for endpoint, seconds in sorted(self.encode_seconds.items()):
+                out.append(f"crm_json_encode_seconds_total{{{_labels(endpoint=endpoint)}}} {seconds:.6f}")
+            family("crm_slow_query_seconds", "gauge",
+                   f"Latest time of the most recent statements slower than {self.slow_query_ms}ms.")
+            family("crm_slow_query_count", "counter", "Times each sampled slow statement was seen.")
+            for (endpoint, statement), (seconds, count) in self.slow.items():
+                labels = _labels(endpoint=endpoint, statement=statement)
+                out.append(f"crm_slow_query_seconds{{{labels}}} {seconds:.6f}")
+                out.append(f"crm_slow_query_count{{{labels}}} {count}")
+
+        if cache is not None:
+            family("crm_response_cache_hits_total", "counter", "Response cache hits.")
+            out.append(f"crm_response_cache_hits_total {cache.hits}")
+            family("crm_response_cache_misses_total", "counter", "Response cache misses.")
+            out.append(f"crm_response_cache_misses_total {cache.misses}")
+        return "\n".join(out) + "\n"
+
+
+def _labels(**labels):
+    return ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items())
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def get_metrics():
+    return current_app.extensions.get("metrics")
+
+
+# -------------------------------------------------
+# SQL timing
+# -------------------------------------------------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("metrics_started")
+    if not started:
+        return
+    seconds = time.perf_counter() - started.pop()
+    if has_request_context():
+        state = g.get("metrics")
+        if state is None:
+            return
+        state["queries"] += 1
+        state["sql"] += seconds
+        metrics = state["metrics"]
+        endpoint = state["endpoint"]
+    else:
+        # no app context in background threads: use the module-level instance
+        metrics = _instance
+        if metrics is None:
+            return
+        metrics.record_background(seconds)
+        endpoint = BACKGROUND
+    if seconds * 1000 >= metrics.slow_query_ms:
+        metrics.record_slow(endpoint, statement, seconds)
+
+
+# -------------------------------------------------
+# Request hooks
+# -------------------------------------------------
+def _start_request():
+    g.metrics = {
+        "metrics": get_metrics(), "endpoint": request.endpoint or "<unmatched>", "method": request.method,
+        "started": time.perf_counter(), "queries": 0, "sql": 0.0, "encode": 0.0, "status": 500,
+    }
+    if current_app.config.get("METRICS_PROFILE") and request.headers.get("X-Profile") == "1":
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # another profiler is active in this thread
+            return
+        g.metrics["profiler"] = profiler
+
+
+def _finish_response(response):
+    state = g.get("metrics")
+    if state is None:
+        return response
+    state["status"] = response.status_code
+    profiler = state.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        response.headers["X-Profile-File"] = _dump_profile(profiler)
+    if response.is_streamed:
+        # the body is generated after teardown: record once it has been sent
+        state["streamed"] = True
+        response.call_on_close(lambda: _record(state))
+    return response
+
+
+def _teardown(exc):
+    state = g.get("metrics")
+    if state is None or state.get("streamed"):
+        return
+    g.pop("metrics")
+    profiler = state.get("profiler")
+    if profiler is not None:  # the view raised before after_request ran
+        profiler.disable()
+    _record(state)
+
+
+def _record(state):
+    state["metrics"].record_request(
+        state["endpoint"], state["method"], state["status"],
+        time.perf_counter() - state["started"], state["queries"], state["sql"], state["encode"],
+    )
+
+
+def _dump_profile(profiler):
+    directory = current_app.config.get("METRICS_PROFILE_DIR") or os.path.join(current_app.instance_path, "profiles")
+    os.makedirs(directory, exist_ok=True)
+    name = "{}-{}-{}.prof".format(
+        time.strftime("%Y%m%d-%H%M%S"), re.sub(r"[^\w.]+", "_", request.endpoint or "unmatched"), threading.get_ident()
+    )
+    profiler.dump_stats(os.path.join(directory, name))
+    return name
+
+
+def _timed_json_response(response):
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return response(*args, **kwargs)
+        finally:
+            state = g.get("metrics")
+            if state is not None:
+                state["encode"] += time.perf_counter() - started
+    return wrapper
+
+
+_instance = None
+
+
+def init_app(app):
+    """Install the hooks when METRICS is on; call after serializers.init_app."""
+    global _instance
+    if not app.config.get("METRICS", False):
+        return None
+    metrics = Metrics(app.config.get("METRICS_SLOW_QUERY_MS", SLOW_QUERY_MS))
+    app.extensions["metrics"] = metrics
+    _instance = metrics
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    app.before_request(_start_request)
+    app.after_request(_finish_response)
+    app.teardown_request(_teardown)
+    # jsonify() goes through the provider's response(); time it there
+    app.json.response = _timed_json_response(app.json.response)
+    return metrics
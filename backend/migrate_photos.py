@@ -0,0 +1,83 @@
+# Moves inline Photo.imagedata into the blob store.
+#
+#   python migrate_photos.py [--batch-size N] [--vacuum]
+#
+# Rows are processed in primary-key order, one transaction per batch, so the
+# tool can be stopped and re-run; rows that already have a contentHash are
+# skipped.
+#
+# Some old rows hold a file path rather than the image. With --photo-root
+# those are read from the disk, if they resolve to a file under that
+# directory; without it, or outside it, the value is kept as text like any
+# other (decode_legacy_imagedata).
+import argparse
+import os
+import time
+
+from app import create_app, migrate_database
+from ORM_models import db, Photo
+from blobstore import get_store, sniff_mimetype, decode_legacy_imagedata
+
+
+def legacy_file(value, photo_root):
+    """The bytes of the file `value` names, when it resolves to a file under
+    `photo_root`; None otherwise."""
+    if not photo_root:
+        return None
+    root = os.path.realpath(photo_root)
+    path = os.path.realpath(os.path.join(root, value))
+    if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def migrate_photos(batch_size=500, photo_root=None):
+    store = get_store()
+    moved = 0
+    last_key = 0
+    started = time.perf_counter()
+
+    while True:
+        batch = (
+            Photo.query
+            .filter(Photo.photokey > last_key, Photo.contentHash.is_(None), Photo.imagedata.isnot(None))
+            .order_by(Photo.photokey)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            break
+
+        for photo in batch:
+            data = legacy_file(photo.imagedata, photo_root)
+            if data is None:
+                data = decode_legacy_imagedata(photo.imagedata)
+            digest, size = store.put(data)
+            photo.contentHash = digest
+            photo.mimeType = sniff_mimetype(data[:16])
+            photo.byteSize = size
+            photo.imagedata = None
+            moved += 1
+        last_key = batch[-1].photokey
+        db.session.commit()
+        db.session.expunge_all()
+        print(f"moved {moved} photos...")
+
+    elapsed = time.perf_counter() - started
+    print(f"done: {moved} photos moved to {store.root} in {elapsed:.1f}s")
+    return moved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move inline Photo.imagedata into the blob store.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--vacuum", action="store_true", help="reclaim the freed pages afterwards")
+    parser.add_argument("--photo-root", help="directory that rows holding a file path may read from")
+    args = parser.parse_args()
+
+    with create_app(features=()).app_context():
+        migrate_database()
+        if migrate_photos(args.batch_size, args.photo_root) and args.vacuum:
+            with db.engine.connect() as conn:
+                conn.exec_driver_sql("VACUUM")
@@ -0,0 +1,441 @@
+# Versioned schema migrations for the CRM database.
+#
+# create_schema.sql builds the base tables; everything added after that lives
+# here as a numbered step. The applied version is stored in SQLite's
+# PRAGMA user_version, so each step runs exactly once per database file.
+#
+# New databases are copies of a template (create_database): the base schema
+# with every migration applied, built once per schema and cached in instance/.
+import hashlib
+import os
+import shutil
+import sqlite3
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "..", "Phase 2 - schema + queries", "create_schema.sql")
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance")
+
+# tables whose row counts TableStats keeps, for the admin list views (views.py)
+COUNTED_TABLES = [
+    "Photo", "Notes", "SocialType", "RelationshipType", "Category", "Person", "Reminders",
+    "SocialLinks", "NotePhoto", "NotedPerson", "Relationships", "perCat", "remPer", "remCat",
+]
+
+
+def _row_counts(tables):
+    sql = [
+        "-- row counts kept by triggers, so a list page doesn't COUNT(*) the table;",
+        "-- bulk_import.py swaps the insert trigger for one UPDATE per batch",
+        "CREATE TABLE TableStats (",
+        "  tableName TEXT PRIMARY KEY,",
+        "  rowCount  INTEGER NOT NULL",
+        ") WITHOUT ROWID;",
+    ]
+    for table in tables:
+        name = table.lower()
+        sql += [
+            f"INSERT INTO TableStats (tableName, rowCount) SELECT '{table}', COUNT(*) FROM \"{table}\";",
+            f"CREATE TRIGGER {name}_count_ai AFTER INSERT ON \"{table}\" BEGIN",
+            f"  UPDATE TableStats SET rowCount = rowCount + 1 WHERE tableName = '{table}';",
+            "END;",
+            f"CREATE TRIGGER {name}_count_ad AFTER DELETE ON \"{table}\" BEGIN",
+            f"  UPDATE TableStats SET rowCount = rowCount - 1 WHERE tableName = '{table}';",
+            "END;",
+        ]
+    return "\n".join(sql) + "\n"
+
+
+# PersonSummary: per-person aggregates for the contact list (GET /api/persons
+# ?include=summary). Each column's value for person {p}; the triggers of
+# migration 7 recompute single columns with these, or add/subtract 1.
+SUMMARY_COLUMNS = {
+    "noteCount": "(SELECT COUNT(*) FROM NotedPerson np WHERE np.perkey = {p})",
+    "openReminderCount": (
+        "(SELECT COUNT(*) FROM remPer rp JOIN Reminders r ON r.remkey = rp.remkey"
+        " WHERE rp.perkey = {p} AND r.completed = 0)"
+    ),
+    # the earliest open reminder, overdue ones included
+    "nextDueDate": (
+        "(SELECT r.dueDate FROM remPer rp JOIN Reminders r ON r.remkey = rp.remkey"
+        " WHERE rp.perkey = {p} AND r.completed = 0 AND r.dueAt IS NOT NULL ORDER BY r.dueAt, r.remkey LIMIT 1)"
+    ),
+    "relationshipCount": (
+        "((SELECT COUNT(*) FROM Relationships WHERE perkey1 = {p})"
+        " + (SELECT COUNT(*) FROM Relationships WHERE perkey2 = {p}))"
+    ),
+    "categories": (
+        "(SELECT group_concat(name, ', ') FROM (SELECT c.name FROM perCat pc JOIN Category c ON c.catkey = pc.catkey"
+        " WHERE pc.perkey = {p} ORDER BY c.name))"
+    ),
+}
+REMINDER_COLUMNS = ["openReminderCount", "nextDueDate"]
+
+
+def summary_select(where=""):
+    """SELECT of the PersonSummary rows of the people matching `where`, computed."""
+    values = ",\n  ".join(sql.format(p="p.perkey") for sql in SUMMARY_COLUMNS.values())
+    where = " " + where if where else ""
+    return f"SELECT p.perkey,\n  {values}\nFROM Person p{where}"
+
+
+def summary_fill(where=""):
+    """INSERT of the PersonSummary rows of the people matching `where`."""
+    return f"INSERT INTO PersonSummary (perkey, {', '.join(SUMMARY_COLUMNS)})\n{summary_select(where)};"
+
+
+def _refresh(columns, match):
+    sets = ",\n    ".join(f"{c} = {SUMMARY_COLUMNS[c].format(p='PersonSummary.perkey')}" for c in columns)
+    return f"  UPDATE PersonSummary SET\n    {sets}\n  WHERE perkey {match};"
+
+
+def _add(column, delta, match):
+    return f"  UPDATE PersonSummary SET {column} = {column} {delta} WHERE perkey {match};"
+
+
+def _trigger(name, event, body):
+    return f"CREATE TRIGGER {name} {event} BEGIN\n" + "\n".join(body) + "\nEND;"
+
+
+def _person_summary():
+    # inserts and deletes add or subtract 1; a junction row whose keys change
+    # (ON UPDATE CASCADE) recomputes both people, so the order in which
+    # SQLite runs the cascades doesn't matter
+    triggers = [
+        _trigger("person_summary_ai", "AFTER INSERT ON Person",
+                 ["  INSERT INTO PersonSummary (perkey) VALUES (new.perkey);"]),
+        _trigger("person_summary_ad", "AFTER DELETE ON Person",
+                 ["  DELETE FROM PersonSummary WHERE perkey = old.perkey;"]),
+        _trigger("person_summary_au", "AFTER UPDATE OF perkey ON Person", [
+            "  DELETE FROM PersonSummary WHERE perkey IN (old.perkey, new.perkey);",
+            summary_fill("WHERE p.perkey = new.perkey"),
+        ]),
+        _trigger("notedperson_summary_ai", "AFTER INSERT ON NotedPerson", [_add("noteCount", "+ 1", "= new.perkey")]),
+        _trigger("notedperson_summary_ad", "AFTER DELETE ON NotedPerson", [_add("noteCount", "- 1", "= old.perkey")]),
+        _trigger("notedperson_summary_au", "AFTER UPDATE OF perkey ON NotedPerson",
+                 [_refresh(["noteCount"], "IN (old.perkey, new.perkey)")]),
+        _trigger("relationships_summary_ai", "AFTER INSERT ON Relationships",
+                 [_add("relationshipCount", "+ 1", "IN (new.perkey1, new.perkey2)")]),
+        _trigger("relationships_summary_ad", "AFTER DELETE ON Relationships",
+                 [_add("relationshipCount", "- 1", "IN (old.perkey1, old.perkey2)")]),
+        _trigger("relationships_summary_au", "AFTER UPDATE OF perkey1, perkey2 ON Relationships",
+                 [_refresh(["relationshipCount"], "IN (old.perkey1, old.perkey2, new.perkey1, new.perkey2)")]),
+        _trigger("percat_summary_ai", "AFTER INSERT ON perCat", [_refresh(["categories"], "= new.perkey")]),
+        _trigger("percat_summary_ad", "AFTER DELETE ON perCat", [_refresh(["categories"], "= old.perkey")]),
+        _trigger("percat_summary_au", "AFTER UPDATE OF perkey, catkey ON perCat",
+                 [_refresh(["categories"], "IN (old.perkey, new.perkey)")]),
+        _trigger("category_summary_au", "AFTER UPDATE OF name ON Category",
+                 [_refresh(["categories"], "IN (SELECT perkey FROM perCat WHERE catkey = new.catkey)")]),
+        _trigger("remper_summary_ai", "AFTER INSERT ON remPer", [_refresh(REMINDER_COLUMNS, "= new.perkey")]),
+        _trigger("remper_summary_ad", "AFTER DELETE ON remPer", [_refresh(REMINDER_COLUMNS, "= old.perkey")]),
+        _trigger("remper_summary_au", "AFTER UPDATE OF remkey, perkey ON remPer",
+                 [_refresh(REMINDER_COLUMNS, "IN (old.perkey, new.perkey)")]),
+        _trigger("reminders_summary_au", "AFTER UPDATE OF completed, dueDate ON Reminders",
+                 [_refresh(REMINDER_COLUMNS, "IN (SELECT perkey FROM remPer WHERE remkey = new.remkey)")]),
+        _trigger("reminders_summary_ad", "AFTER DELETE ON Reminders",
+                 [_refresh(REMINDER_COLUMNS, "IN (SELECT perkey FROM remPer WHERE remkey = old.remkey)")]),
+    ]
+    return "\n".join([
+        "CREATE TABLE PersonSummary (",
+        "  perkey            INTEGER PRIMARY KEY,",
+        "  noteCount         INTEGER NOT NULL DEFAULT 0,",
+        "  openReminderCount INTEGER NOT NULL DEFAULT 0,",
+        "  nextDueDate       TEXT,",
+        "  relationshipCount INTEGER NOT NULL DEFAULT 0,",
+        "  categories        TEXT",
+        ");",
+        summary_fill(),
+        *triggers,
+    ]) + "\n"
+
+
+# The summary insert triggers bulk_import.py replaces with one statement per
+# batch: table -> (person key columns, statement over the batch's person keys
+# as a JSON array).
+_BATCH = "IN (SELECT value FROM json_each(?))"
+SUMMARY_BATCH = {
+    "Person": (["perkey"], "INSERT INTO PersonSummary (perkey) SELECT value FROM json_each(?)"),
+    "NotedPerson": (["perkey"], _refresh(["noteCount"], _BATCH).strip()),
+    "Relationships": (["perkey1", "perkey2"], _refresh(["relationshipCount"], _BATCH).strip()),
+    "perCat": (["perkey"], _refresh(["categories"], _BATCH).strip()),
+    "remPer": (["perkey"], _refresh(REMINDER_COLUMNS, _BATCH).strip()),
+}
+
+
+# ChangeLog: what changed since a sequence number (GET /api/changes,
+# changelog.py). Every table's primary key columns; an entry names its row by
+# their JSON array, json_array() in the triggers and change_key() in Python.
+CHANGE_KEYS = {
+    "Photo": ["photokey"], "Notes": ["notekey"], "SocialType": ["socialkey"],
+    "RelationshipType": ["relTypeKey"], "Category": ["catkey"], "Person": ["perkey"],
+    "Reminders": ["remkey"], "SocialLinks": ["socialkey", "perkey"], "NotePhoto": ["notekey", "photokey"],
+    "NotedPerson": ["perkey", "notekey"], "Relationships": ["perkey1", "perkey2"],
+    "perCat": ["perkey", "catkey"], "remPer": ["remkey", "perkey"], "remCat": ["remkey", "catkey"],
+}
+
+
+def change_key(values):
+    # what json_array() gives for integers, without the json module's overhead
+    return "[" + ",".join(str(int(v)) for v in values) + "]"
+
+
+def _log_change(table, key, op):
+    # delete + insert rather than INSERT OR REPLACE: an INSERT OR IGNORE on
+    # the source table would turn the trigger's REPLACE into IGNORE too
+    return [
+        f"  DELETE FROM ChangeLog WHERE tableName = '{table}' AND rowKey = {key};",
+        f"  INSERT INTO ChangeLog (tableName, rowKey, op) VALUES ('{table}', {key}, '{op}');",
+    ]
+
+
+def _change_log(keys):
+    # one entry per row, its latest change: each write replaces the row's
+    # entry with a new one, and AUTOINCREMENT keeps seq from ever going back
+    sql = [
+        "CREATE TABLE ChangeLog (",
+        "  seq       INTEGER PRIMARY KEY AUTOINCREMENT,",
+        "  tableName TEXT NOT NULL,",
+        "  rowKey    TEXT NOT NULL,",
+        "  op        TEXT NOT NULL CHECK (op IN ('upsert', 'delete'))",
+        ");",
+        "CREATE UNIQUE INDEX ix_changelog_row ON ChangeLog (tableName, rowKey);",
+    ]
+    for table, columns in keys.items():
+        name = table.lower()
+        new = "json_array({})".format(", ".join(f"new.{c}" for c in columns))
+        old = "json_array({})".format(", ".join(f"old.{c}" for c in columns))
+        moved = [
+            f"  DELETE FROM ChangeLog WHERE tableName = '{table}' AND rowKey = {old} AND {old} <> {new};",
+            f"  INSERT INTO ChangeLog (tableName, rowKey, op) SELECT '{table}', {old}, 'delete' WHERE {old} <> {new};",
+        ]
+        sql += [
+            _trigger(f"{name}_changes_ai", f'AFTER INSERT ON "{table}"', _log_change(table, new, "upsert")),
+            _trigger(f"{name}_changes_ad", f'AFTER DELETE ON "{table}"', _log_change(table, old, "delete")),
+            # a changed primary key (ON UPDATE CASCADE) is a delete + an upsert
+            _trigger(f"{name}_changes_au", f'AFTER UPDATE ON "{table}"', moved + _log_change(table, new, "upsert")),
+        ]
+    return "\n".join(sql) + "\n"
+
+
+MIGRATIONS = [
+    (1, "secondary indexes", """
+-- reverse lookups on the junction tables (each PK only serves its leading column)
+CREATE INDEX IF NOT EXISTS ix_notedperson_notekey ON NotedPerson (notekey, perkey);
+CREATE INDEX IF NOT EXISTS ix_notephoto_photokey ON NotePhoto (photokey, notekey);
+CREATE INDEX IF NOT EXISTS ix_remper_perkey ON remPer (perkey, remkey);
+CREATE INDEX IF NOT EXISTS ix_remcat_catkey ON remCat (catkey, remkey);
+CREATE INDEX IF NOT EXISTS ix_percat_catkey ON perCat (catkey, perkey);
+CREATE INDEX IF NOT EXISTS ix_sociallinks_perkey ON SocialLinks (perkey, socialkey);
+CREATE INDEX IF NOT EXISTS ix_relationships_perkey2 ON Relationships (perkey2, perkey1);
+CREATE INDEX IF NOT EXISTS ix_relationships_reltype ON Relationships (relTypeKey);
+
+-- foreign keys with ON DELETE actions
+CREATE INDEX IF NOT EXISTS ix_person_photokey ON Person (photokey);
+
+-- filter / sort columns
+CREATE INDEX IF NOT EXISTS ix_person_name ON Person (lastName, firstName);
+CREATE INDEX IF NOT EXISTS ix_person_lower_name ON Person (lower(lastName), lower(firstName));
+CREATE INDEX IF NOT EXISTS ix_person_location ON Person (location);
+CREATE INDEX IF NOT EXISTS ix_reminders_due ON Reminders (date(dueDate));
+CREATE INDEX IF NOT EXISTS ix_reminders_open_due ON Reminders (date(dueDate)) WHERE completed = 0;
+
+ANALYZE;
+"""),
+    (2, "photo blob store columns", """
+-- image bytes move to the content-addressed store (blobstore.py); the row keeps
+-- the hash and metadata. imagedata becomes nullable and is emptied by
+-- migrate_photos.py for rows created before this step.
+CREATE TABLE Photo_new (
+  photokey     INTEGER PRIMARY KEY,
+  imagedata    TEXT,
+  contentHash  TEXT,
+  mimeType     TEXT,
+  byteSize     INTEGER
+);
+INSERT INTO Photo_new (photokey, imagedata) SELECT photokey, imagedata FROM Photo;
+DROP TABLE Photo;
+ALTER TABLE Photo_new RENAME TO Photo;
+CREATE INDEX ix_photo_contenthash ON Photo (contentHash);
+"""),
+    (3, "full-text search", """
+-- external-content FTS5 indexes (search.py); triggers keep them in sync
+DROP TABLE IF EXISTS notes_fts;
+DROP TABLE IF EXISTS person_fts;
+DROP TABLE IF EXISTS reminders_fts;
+
+CREATE VIRTUAL TABLE notes_fts USING fts5(
+  title, content,
+  content='Notes', content_rowid='notekey',
+  prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE VIRTUAL TABLE person_fts USING fts5(
+  firstName, lastName, location,
+  content='Person', content_rowid='perkey',
+  prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE VIRTUAL TABLE reminders_fts USING fts5(
+  title, description,
+  content='Reminders', content_rowid='remkey',
+  prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER notes_fts_ai AFTER INSERT ON Notes BEGIN
+  INSERT INTO notes_fts (rowid, title, content) VALUES (new.notekey, new.title, new.content);
+END;
+CREATE TRIGGER notes_fts_ad AFTER DELETE ON Notes BEGIN
+  INSERT INTO notes_fts (notes_fts, rowid, title, content) VALUES ('delete', old.notekey, old.title, old.content);
+END;
+CREATE TRIGGER notes_fts_au AFTER UPDATE OF title, content ON Notes BEGIN
+  INSERT INTO notes_fts (notes_fts, rowid, title, content) VALUES ('delete', old.notekey, old.title, old.content);
+  INSERT INTO notes_fts (rowid, title, content) VALUES (new.notekey, new.title, new.content);
+END;
+
+CREATE TRIGGER person_fts_ai AFTER INSERT ON Person BEGIN
+  INSERT INTO person_fts (rowid, firstName, lastName, location) VALUES (new.perkey, new.firstName, new.lastName, new.location);
+END;
+CREATE TRIGGER person_fts_ad AFTER DELETE ON Person BEGIN
+  INSERT INTO person_fts (person_fts, rowid, firstName, lastName, location) VALUES ('delete', old.perkey, old.firstName, old.lastName, old.location);
+END;
+CREATE TRIGGER person_fts_au AFTER UPDATE OF firstName, lastName, location ON Person BEGIN
+  INSERT INTO person_fts (person_fts, rowid, firstName, lastName, location) VALUES ('delete', old.perkey, old.firstName, old.lastName, old.location);
+  INSERT INTO person_fts (rowid, firstName, lastName, location) VALUES (new.perkey, new.firstName, new.lastName, new.location);
+END;
+
+CREATE TRIGGER reminders_fts_ai AFTER INSERT ON Reminders BEGIN
+  INSERT INTO reminders_fts (rowid, title, description) VALUES (new.remkey, new.title, new.description);
+END;
+CREATE TRIGGER reminders_fts_ad AFTER DELETE ON Reminders BEGIN
+  INSERT INTO reminders_fts (reminders_fts, rowid, title, description) VALUES ('delete', old.remkey, old.title, old.description);
+END;
+CREATE TRIGGER reminders_fts_au AFTER UPDATE OF title, description ON Reminders BEGIN
+  INSERT INTO reminders_fts (reminders_fts, rowid, title, description) VALUES ('delete', old.remkey, old.title, old.description);
+  INSERT INTO reminders_fts (rowid, title, description) VALUES (new.remkey, new.title, new.description);
+END;
+
+INSERT INTO notes_fts (notes_fts) VALUES ('rebuild');
+INSERT INTO person_fts (person_fts) VALUES ('rebuild');
+INSERT INTO reminders_fts (reminders_fts) VALUES ('rebuild');
+"""),
+    (4, "sargable person criteria", """
+-- birthday month/day as indexed generated columns, so Q9 / person_search.py
+-- can filter on them instead of strftime() over every row
+ALTER TABLE Person ADD COLUMN birthMonth INTEGER
+  GENERATED ALWAYS AS (CAST(strftime('%m', birthday) AS INTEGER)) VIRTUAL;
+ALTER TABLE Person ADD COLUMN birthDayOfMonth INTEGER
+  GENERATED ALWAYS AS (CAST(strftime('%d', birthday) AS INTEGER)) VIRTUAL;
+CREATE INDEX ix_person_birth_md ON Person (birthMonth, birthDayOfMonth);
+-- month + name order: "birthdays in July" pages stop after LIMIT rows, no sort
+CREATE INDEX ix_person_birth_name ON Person (birthMonth, lastName, firstName);
+
+-- LIKE is case-insensitive, so only a NOCASE index can serve 'prefix%'
+DROP INDEX IF EXISTS ix_person_location;
+CREATE INDEX ix_person_location ON Person (location COLLATE NOCASE);
+
+ANALYZE;
+"""),
+    (5, "reminder due timestamps", """
+-- dueDate is free-form text; dueAt is the same instant as unix seconds (NULL
+-- when it doesn't parse), indexed for the scheduler and the upcoming query
+ALTER TABLE Reminders ADD COLUMN dueAt INTEGER
+  GENERATED ALWAYS AS (unixepoch(dueDate)) VIRTUAL;
+CREATE INDEX ix_reminders_open_due_at ON Reminders (dueAt, remkey) WHERE completed = 0;
+
+ANALYZE;
+"""),
+    (6, "table row counts", _row_counts(COUNTED_TABLES)),
+    (7, "person summary", _person_summary()),
+    (8, "change log", _change_log(CHANGE_KEYS)),
+    (9, "person search indexes", """
+-- location + name: the prefix range a narrow location search sorts by
+-- name (person_search.py)
+DROP INDEX IF EXISTS ix_person_location;
+CREATE INDEX ix_person_location_name ON Person (location COLLATE NOCASE, lastName, firstName);
+-- month + name order with the location alongside: the location filter is
+-- checked in the index, so only the rows on the page are read
+DROP INDEX IF EXISTS ix_person_birth_name;
+CREATE INDEX ix_person_birth_name ON Person (birthMonth, lastName, firstName, location);
+-- name order with the location alongside: a broad location prefix is
+-- checked while walking it
+DROP INDEX IF EXISTS ix_person_name;
+CREATE INDEX ix_person_name ON Person (lastName, firstName, location);
+-- "has a relationship of this type": one covering probe per side
+CREATE INDEX ix_relationships_perkey1_type ON Relationships (perkey1, relTypeKey);
+CREATE INDEX ix_relationships_perkey2_type ON Relationships (perkey2, relTypeKey);
+
+ANALYZE;
+"""),
+]
+
+# steps that rebuild a table referenced by foreign keys; they run with
+# foreign_keys off so the DROP doesn't cascade into the child tables
+FOREIGN_KEYS_OFF = {2}
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(conn):
+    """Apply every migration newer than the database's user_version.
+
+    `conn` is a DB-API sqlite3 connection (or SQLAlchemy's raw_connection()).
+    Each step runs in its own transaction together with the version bump.
+    Returns the list of applied version numbers.
+    """
+    applied = []
+    current = schema_version(conn)
+    for version, name, sql in MIGRATIONS:
+        if version <= current:
+            continue
+        fk_off = version in FOREIGN_KEYS_OFF
+        if fk_off:
+            conn.execute("PRAGMA foreign_keys = OFF")
+        try:
+            conn.executescript(f"BEGIN;\n{sql}\nPRAGMA user_version = {version};\nCOMMIT;")
+        finally:
+            if fk_off:
+                conn.execute("PRAGMA foreign_keys = ON")
+        applied.append(version)
+    return applied
+
+
+# -------------------------------------------------
+# New databases
+# -------------------------------------------------
+def template_path():
+    """Where the template for the current create_schema.sql and MIGRATIONS
+    lives; editing either gives it a new name."""
+    digest = hashlib.sha1()
+    with open(SCHEMA_PATH, "rb") as f:
+        digest.update(f.read())
+    for version, name, sql in MIGRATIONS:
+        digest.update(f"{version}\0{name}\0{sql}\0".encode())
+    return os.path.join(TEMPLATE_DIR, f"schema-v{LATEST_VERSION}-{digest.hexdigest()[:12]}.sqlite")
+
+
+def build_template(path):
+    """Write an empty database at LATEST_VERSION to `path`: create_schema.sql
+    plus every migration, vacuumed. The file appears complete or not at all."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    conn = sqlite3.connect(tmp)
+    try:
+        with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
+            conn.executescript(f.read())
+        conn.execute("PRAGMA user_version = 0")
+        run_migrations(conn)
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+
+
+def create_database(path):
+    """Create `path` as an empty database at LATEST_VERSION by copying the
+    template, building it first if this schema hasn't been built yet."""
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    template = template_path()
+    if not os.path.exists(template):
+        os.makedirs(os.path.dirname(template), exist_ok=True)
+        build_template(template)
+    shutil.copyfile(template, path)
@@ -0,0 +1,123 @@
+# Criteria search over people (birthday month/day, relationship type,
+# location prefix): the sargable replacement for Q9 in SQL_queries.sql.
+#
+# Only the criteria that are given become predicates -- no "? IS NULL OR"
+# branches -- so the planner can pick an index for each one:
+#   birth month/day -> ix_person_birth_md / ix_person_birth_name on the
+#                      generated columns (migrations 4 and 9); the latter
+#                      carries location, so it is filtered in the index
+#   location        -> prefix LIKE on ix_person_location_name (COLLATE
+#                      NOCASE), or a filter while walking ix_person_name,
+#                      which holds location
+#   relationship    -> instead of the OR join, an EXISTS per side; the type
+#                      name is resolved once and each side probes its
+#                      (perkey, relTypeKey) covering index
+#
+# Results are in (lastName, firstName, location, perkey) order, the order of
+# ix_person_name and, within a month, of ix_person_birth_name: reading one of
+# them SQLite stops after LIMIT rows instead of sorting every match.
+#
+# A location prefix without a month is the one criterion whose best plan
+# depends on how much it matches: sorting every match costs about `matches`
+# index entries, walking ix_person_name until the page is full about
+# people * page / matches. search() first walks the name index up to the
+# break-even sqrt(people * page * cost) entries, checking the location (and the
+# relationship type) as it goes. A broad prefix fills the page within that;
+# a narrow one -- whose matches are few to sort -- falls back to the location
+# range. Both costs are in name index steps: a match in the range also
+# costs a row lookup and its share of the sort (RANGE_COST), and with a
+# relationship type two index probes, which the walk only makes for the
+# matches it reaches (RELATED_COST).
+import sqlite3
+from math import isqrt
+
+from sqlalchemy import text
+
+SELECT_COLUMNS = "p.perkey, p.photokey, p.firstName, p.lastName, p.birthday, p.location"
+ORDER = "p.lastName, p.firstName, p.location, p.perkey"
+
+RELATED_ON_SIDE = """EXISTS (
+    SELECT 1 FROM Relationships r
+    WHERE r.{side} = p.perkey
+      AND r.relTypeKey = (SELECT relTypeKey FROM RelationshipType WHERE name = :relType)
+)"""
+RELATED = "(" + " OR ".join(RELATED_ON_SIDE.format(side=side) for side in ("perkey1", "perkey2")) + ")"
+
+# what a location match in the range costs, in name index steps, without
+# and with a relationship type (measured with bench_person_search.py)
+RANGE_COST = 3
+RELATED_COST = 16
+
+PERSON_COUNT = "SELECT rowCount FROM TableStats WHERE tableName = 'Person'"
+# the last name :budget entries into ix_person_name, where a walk stops
+NAME_AT = "(SELECT lastName FROM Person ORDER BY lastName, firstName, location, perkey LIMIT 1 OFFSET :budget)"
+
+
+def like_prefix(prefix):
+    """A LIKE pattern matching strings that start with `prefix` (escaped)."""
+    escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+
+def scan_budget(people, rows, cost=1):
+    """Name index entries worth walking for a page ending `rows` rows in,
+    when checking a location match in the range costs `cost` steps."""
+    return max(rows, isqrt(max(people or 0, 1) * rows * cost))
+
+
+def build_query(birth_month=None, birth_day=None, rel_type=None, location=None, limit=100, offset=0,
+                by_name=False, budget=None):
+    """Return (sql, params) with named parameters, usable with sqlite3 or text().
+
+    `by_name`: walk ix_person_name, filtering by location instead of
+    searching by it, for about `budget` entries if given."""
+    where = []
+    params = {"limit": limit, "offset": offset}
+    if birth_month is not None:
+        where.append("p.birthMonth = :month")
+        params["month"] = birth_month
+        if birth_day is not None:
+            where.append("p.birthDayOfMonth = :day")
+            params["day"] = birth_day
+    if budget is not None:
+        where.append(f"p.lastName <= {NAME_AT}")
+        params["budget"] = budget
+    if location is not None:
+        # unary + keeps the term from choosing an index: with a month it is
+        # checked in ix_person_birth_name, by name during the walk
+        column = "+p.location" if by_name or birth_month is not None else "p.location"
+        where.append(f"{column} LIKE :location ESCAPE '\\'")
+        params["location"] = like_prefix(location)
+    if rel_type is not None:
+        where.append(RELATED)
+        params["relType"] = rel_type
+
+    sql = f"SELECT {SELECT_COLUMNS} FROM Person p"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql + f" ORDER BY {ORDER} LIMIT :limit OFFSET :offset", params
+
+
+def search(conn, birth_month=None, birth_day=None, rel_type=None, location=None, limit=100, offset=0):
+    """Up to `limit` matching people from `offset` on. `conn` is a sqlite3
+    connection (rows are tuples) or a SQLAlchemy session (mappings)."""
+    criteria = (birth_month, birth_day, rel_type, location, limit, offset)
+    if location is not None and birth_month is None:
+        counted = _fetch(conn, PERSON_COUNT, {})
+        people = counted[0][0] if counted else 0
+        budget = scan_budget(people, offset + limit, RELATED_COST if rel_type is not None else RANGE_COST)
+        # within twice the budget, the whole table
+        bounded = 2 * budget < people
+        rows = _fetch(conn, *build_query(*criteria, by_name=True, budget=budget if bounded else None),
+                      mappings=True)
+        # a full page, or the walk reached the end of the table
+        if len(rows) == limit or not bounded:
+            return rows
+    return _fetch(conn, *build_query(*criteria), mappings=True)
+
+
+def _fetch(conn, sql, params, mappings=False):
+    if isinstance(conn, sqlite3.Connection):
+        return conn.execute(sql, params).fetchall()
+    result = conn.execute(text(sql), params)
+    return result.mappings().all() if mappings else result.all()
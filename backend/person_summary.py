@@ -0,0 +1,60 @@
+# Rebuilds or checks PersonSummary, the per-person aggregates behind
+# GET /api/persons?include=summary.
+#
+#   python person_summary.py            recompute every row
+#   python person_summary.py --check    list the people whose row is stale
+#
+# The triggers of migration 7 (migrations.py) keep the table current, so this
+# is for repairs: after writes made with the triggers dropped, or to verify
+# them. The rebuild is one transaction; readers see the old rows until it
+# commits.
+import argparse
+import sys
+import time
+
+from app import create_app
+from ORM_models import db
+from migrations import SUMMARY_COLUMNS, summary_fill, summary_select
+
+
+def rebuild(conn):
+    """Recompute every PersonSummary row; returns the number of rows."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM PersonSummary")
+        conn.execute(summary_fill())
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return conn.execute("SELECT COUNT(*) FROM PersonSummary").fetchone()[0]
+
+
+def check(conn):
+    """perkeys whose stored row differs from a fresh computation (or is missing)."""
+    fresh = summary_select()
+    stored = f"SELECT perkey, {', '.join(SUMMARY_COLUMNS)} FROM PersonSummary"
+    rows = conn.execute(
+        f"SELECT perkey FROM ({fresh} EXCEPT {stored}) UNION SELECT perkey FROM ({stored} EXCEPT {fresh})"
+    )
+    return [perkey for (perkey,) in rows]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild or check the PersonSummary table.")
+    parser.add_argument("--check", action="store_true", help="only report stale rows")
+    args = parser.parse_args()
+
+    with create_app(features=()).app_context():
+        conn = db.engine.raw_connection()
+        try:
+            started = time.perf_counter()
+            if args.check:
+                stale = check(conn)
+                print(f"{len(stale)} stale rows" + (f": {stale[:20]}" if stale else ""))
+            else:
+                print(f"rebuilt {rebuild(conn)} rows")
+            print(f"{time.perf_counter() - started:.2f}s")
+        finally:
+            conn.close()
+    sys.exit(1 if args.check and stale else 0)
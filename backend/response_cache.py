@@ -0,0 +1,207 @@
+# HTTP response cache for the JSON GET endpoints.
+#
+# Every table has an in-process version counter. Committed ORM writes bump
+# the counters of the tables they touched (session hooks below), plus every
+# table whose foreign keys point at them, since ON DELETE CASCADE / SET NULL
+# changes those rows inside SQLite without the session seeing it. Writes that
+# bypass the session (the import endpoint) call bump_all(). Tables that
+# triggers derive from others (PersonSummary) name their sources in
+# __table_args__ info["derived_from"] and are bumped with them.
+#
+# A view wrapped in @cached("Person", ...) gets a weak ETag built from the
+# versions of the tables it reads; a matching If-None-Match is answered 304
+# without running the view. The serialized body is also kept in a bounded LRU
+# keyed by the request path, so repeated polls are served from memory until
+# one of the tables changes, which evicts the dependent entries.
+#
+# The counters live in the process: with several worker processes a write in
+# one doesn't invalidate the others. Set RESPONSE_CACHE = False there.
+import threading
+import uuid
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, current_app, has_app_context, request
+from sqlalchemy import event
+
+from db_roles import RoutingSession
+
+DEFAULT_SIZE = 512                    # entries
+MAX_BODY_BYTES = 1024 * 1024          # larger bodies get an ETag but aren't stored
+
+
+class ResponseCache:
+    def __init__(self, dependents, size=DEFAULT_SIZE, max_body=MAX_BODY_BYTES):
+        self.dependents = dependents  # table -> tables to bump with it (itself included)
+        self.size = size
+        self.max_body = max_body
+        self._epoch = uuid.uuid4().hex[:8]   # ETags from an earlier process never match
+        self._versions = {}
+        self._entries = OrderedDict()        # key -> (versions, etag, body)
+        self._by_table = {}                  # table -> keys of entries that read it
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def versions(self, tables):
+        with self._lock:
+            return tuple(self._versions.get(t, 0) for t in tables)
+
+    def etag(self, versions):
+        return self._epoch + "-" + ".".join(map(str, versions))
+
+    def bump(self, tables):
+        with self._lock:
+            stale = set()
+            for table in tables:
+                for t in self.dependents.get(table, (table,)):
+                    self._versions[t] = self._versions.get(t, 0) + 1
+                    stale |= self._by_table.pop(t, set())
+            for key in stale:
+                self._entries.pop(key, None)
+
+    def bump_all(self):
+        self.bump(list(self.dependents))
+
+    def get(self, key, versions):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != versions:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, tables, versions, etag, body):
+        if len(body) > self.max_body:
+            return
+        with self._lock:
+            # a write committed while the view ran: the body may predate it
+            if tuple(self._versions.get(t, 0) for t in tables) != versions:
+                return
+            self._entries[key] = (versions, etag, body)
+            self._entries.move_to_end(key)
+            for t in tables:
+                self._by_table.setdefault(t, set()).add(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+
+
+def table_dependents(metadata):
+    """table -> itself plus every table that references it or is derived
+    from it, transitively."""
+    referencing = {name: set() for name in metadata.tables}
+    for table in metadata.tables.values():
+        for fk in table.foreign_keys:
+            referencing[fk.column.table.name].add(table.name)
+        for source in table.info.get("derived_from", ()):
+            referencing[source].add(table.name)
+    dependents = {}
+    for name in referencing:
+        seen = {name}
+        stack = [name]
+        while stack:
+            for child in referencing[stack.pop()]:
+                if child not in seen:
+                    seen.add(child)
+                    stack.append(child)
+        dependents[name] = seen
+    return dependents
+
+
+def get_cache():
+    return current_app.extensions.get("response_cache")
+
+
+def request_tables(tables, include, args):
+    """`tables` plus those of the parts the request's ?include= names;
+    `include` maps part -> tables."""
+    if not include:
+        return tables
+    parts = (args.get("include") or "").split(",")
+    extra = [t for part in parts for t in include.get(part.strip(), ())]
+    return tuple(dict.fromkeys(tables + tuple(extra)))
+
+
+def cached(*tables, include=None):
+    """Conditional GET + body cache for a JSON view that reads `tables`, and
+    the tables of `include` (part -> tables) for the ?include= parts asked."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = get_cache()
+            if cache is None:
+                return view(*args, **kwargs)
+
+            tables_read = request_tables(tables, include, request.args)
+            versions = cache.versions(tables_read)
+            etag = cache.etag(versions)
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                key = request.full_path
+                entry = cache.get(key, versions)
+                if entry is not None:
+                    response = Response(entry[2], mimetype="application/json")
+                else:
+                    response = current_app.make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or response.is_streamed:
+                        return response
+                    cache.put(key, tables_read, versions, etag, response.get_data())
+            response.set_etag(etag, weak=True)
+            response.headers["Cache-Control"] = "no-cache"  # always revalidate
+            return response
+        return wrapper
+    return decorator
+
+
+# -------------------------------------------------
+# Session hooks: bump the tables a transaction wrote once it commits
+# -------------------------------------------------
+def _written(session):
+    return session.info.setdefault("written_tables", set())
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _track_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, "__table__", None)
+        if table is not None:
+            _written(session).add(table.name)
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _track_bulk(state):
+    if (state.is_insert or state.is_update or state.is_delete) and state.bind_mapper is not None:
+        _written(state.session).add(state.bind_mapper.local_table.name)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _bump_written(session):
+    if session.in_nested_transaction():  # a SAVEPOINT (write_queue.py), not the commit
+        return
+    written = session.info.pop("written_tables", None)
+    if written and has_app_context():
+        cache = get_cache()
+        if cache is not None:
+            cache.bump(written)
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _discard_written(session):
+    if not session.in_nested_transaction():  # keep what the rest of the transaction wrote
+        session.info.pop("written_tables", None)
+
+
+def init_app(app, metadata):
+    if not app.config.get("RESPONSE_CACHE", True):
+        return None
+    cache = ResponseCache(table_dependents(metadata), size=app.config.get("RESPONSE_CACHE_SIZE", DEFAULT_SIZE))
+    app.extensions["response_cache"] = cache
+    return cache
@@ -0,0 +1,347 @@
+# Reminder scheduler: an in-process priority queue of the reminders that
+# come due next.
+#
+# Reminders.dueAt (migration 5) is dueDate as unix seconds, indexed for open
+# reminders. The scheduler holds every open reminder whose dueAt lies between
+# now - lookback and its horizon -- the (dueAt, remkey) of the last row it
+# loaded, at most `capacity` rows at a time -- in a dict plus a heap ordered
+# by (dueAt, remkey). /api/reminders/upcoming and /api/reminders/due are
+# answered from memory; the table is only read by index range, to load the
+# window or to extend it past the horizon.
+#
+# ORM writes update it incrementally once their transaction commits. Bulk
+# statements (batch, import) mark it stale, and it reloads on next use or
+# every `resync` seconds, which also picks up writes from other processes.
+#
+# A background thread fires each reminder once, when it comes due, through
+# the configured sinks (see SINKS). Reminders that came due before the
+# scheduler started are not fired.
+import heapq
+import json
+import logging
+import threading
+import time
+import urllib.request
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, text
+
+from db_roles import RoutingSession
+
+log = logging.getLogger("reminders")
+
+DEFAULT_CAPACITY = 1000
+DEFAULT_LOOKBACK = 24 * 3600     # overdue reminders stay listed for a day
+DEFAULT_RESYNC = 300
+
+DONE = (float("inf"), 0)         # horizon once every open reminder is loaded
+
+ROW_COLUMNS = "remkey, title, description, dueDate, dueAt, completed"
+
+
+class ReminderSource:
+    """Reads open reminders by (dueAt, remkey) range with its own engine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def window(self, after, floor, limit):
+        """Open reminders with dueAt >= floor and (dueAt, remkey) > after, in order."""
+        sql = text(
+            f"SELECT {ROW_COLUMNS} FROM Reminders "
+            "WHERE completed = 0 AND dueAt >= :floor "
+            "AND (dueAt > :after_due OR (dueAt = :after_due AND remkey > :after_key)) "
+            "ORDER BY dueAt, remkey LIMIT :limit"
+        )
+        with self.engine.connect() as conn:
+            rows = conn.execute(sql, {
+                "floor": floor, "after_due": after[0], "after_key": after[1], "limit": limit,
+            })
+            return [dict(r._mapping) for r in rows]
+
+    def rows(self, keys):
+        sql = text(f"SELECT {ROW_COLUMNS} FROM Reminders WHERE remkey IN ({','.join('%d' % k for k in keys)})")
+        with self.engine.connect() as conn:
+            return [dict(r._mapping) for r in conn.execute(sql)]
+
+
+def _key(entry):
+    return (entry["dueAt"], entry["remkey"])
+
+
+class ReminderScheduler:
+    def __init__(self, source, sinks=(), capacity=DEFAULT_CAPACITY,
+                 lookback=DEFAULT_LOOKBACK, resync=DEFAULT_RESYNC, clock=time.time):
+        self.source = source
+        self.sinks = list(sinks)
+        self.capacity = capacity
+        self.lookback = lookback
+        self.resync = resync
+        self._clock = clock
+        self._lock = threading.Condition()
+        self._entries = {}       # remkey -> row
+        self._heap = []          # (dueAt, remkey); stale items are skipped on pop
+        self._horizon = None     # None = not loaded
+        self._loaded_at = 0
+        self._fired = {}         # remkey -> dueAt it was fired for
+        self._started_at = clock()
+        self._thread = None
+        self._stopping = False
+
+    # --- window maintenance (call with the lock held) ---
+
+    def _floor(self, now):
+        return int(now - self.lookback)
+
+    def _add(self, row):
+        self._entries[row["remkey"]] = row
+        heapq.heappush(self._heap, _key(row))
+
+    def _reload(self, now):
+        self._entries = {}
+        self._heap = []
+        self._horizon = (self._floor(now) - 1, 0)
+        self._extend(now, self.capacity)
+        self._fired = {k: v for k, v in self._fired.items() if k in self._entries}
+        self._loaded_at = now
+
+    def _extend(self, now, limit):
+        if self._horizon == DONE:
+            return
+        rows = self.source.window(self._horizon, self._floor(now), limit)
+        for row in rows:
+            self._add(row)
+        self._horizon = _key(rows[-1]) if len(rows) == limit else DONE
+
+    def _fresh(self, now):
+        if self._horizon is None or now - self._loaded_at >= self.resync:
+            self._reload(now)
+
+    def _trim(self):
+        """Drop the latest entries once the window holds twice its capacity."""
+        if len(self._entries) <= 2 * self.capacity:
+            return
+        keep = heapq.nsmallest(self.capacity, self._entries.values(), key=_key)
+        self._entries = {row["remkey"]: row for row in keep}
+        self._heap = [_key(row) for row in keep]
+        heapq.heapify(self._heap)
+        self._horizon = _key(keep[-1])
+
+    # --- incremental updates ---
+
+    def apply(self, changed=(), deleted=()):
+        """Fold committed changes in: `changed` remkeys are re-read, `deleted` dropped."""
+        rows = self.source.rows(changed) if changed else []
+        with self._lock:
+            if self._horizon is None:
+                return
+            for remkey in list(deleted) + [row["remkey"] for row in rows]:
+                self._entries.pop(remkey, None)
+            for remkey in deleted:
+                self._fired.pop(remkey, None)
+            for row in rows:
+                if row["completed"] or row["dueAt"] is None:
+                    self._fired.pop(row["remkey"], None)
+                    continue
+                if _key(row) <= self._horizon and row["dueAt"] >= self._floor(self._clock()):
+                    self._add(row)
+            self._trim()
+            self._lock.notify()
+
+    def mark_stale(self):
+        with self._lock:
+            self._horizon = None
+            self._lock.notify()
+
+    # --- queries ---
+
+    def upcoming(self, limit):
+        """Open reminders not yet due, soonest first."""
+        now = self._clock()
+        with self._lock:
+            self._fresh(now)
+            while True:
+                pending = [row for row in self._entries.values() if row["dueAt"] >= now]
+                if len(pending) >= limit or self._horizon == DONE:
+                    break
+                self._extend(now, self.capacity)
+            return heapq.nsmallest(limit, pending, key=_key)
+
+    def due(self, window, limit):
+        """Open reminders due within `window` seconds, plus those overdue by up
+        to `lookback` seconds, soonest first."""
+        now = self._clock()
+        until = now + window
+        with self._lock:
+            self._fresh(now)
+            while self._horizon != DONE and self._horizon[0] <= until:
+                self._extend(now, self.capacity)
+            floor = self._floor(now)
+            rows = [row for row in self._entries.values() if floor <= row["dueAt"] <= until]
+            return heapq.nsmallest(limit, rows, key=_key)
+
+    # --- firing ---
+
+    def _pop_due(self, now):
+        """Pop every heap item that is due; returns the rows to notify."""
+        fire = []
+        while self._heap and self._heap[0][0] <= now:
+            due_at, remkey = heapq.heappop(self._heap)
+            row = self._entries.get(remkey)
+            if row is None or row["dueAt"] != due_at or self._fired.get(remkey) == due_at:
+                continue
+            self._fired[remkey] = due_at
+            if due_at >= self._started_at:
+                fire.append(row)
+        return fire
+
+    def tick(self):
+        """Fire what is due; returns seconds until the next check."""
+        now = self._clock()
+        with self._lock:
+            self._fresh(now)
+            fire = self._pop_due(now)
+            wait = self.resync - (now - self._loaded_at)
+            if self._heap:
+                wait = min(wait, self._heap[0][0] - now)
+        for row in fire:
+            for sink in self.sinks:
+                try:
+                    sink(row)
+                except Exception:
+                    log.exception("reminder sink %r failed for reminder %s", sink, row["remkey"])
+        return max(wait, 0.05)
+
+    def _run(self):
+        while True:
+            try:
+                wait = self.tick()
+            except Exception:
+                log.exception("reminder scheduler tick failed")
+                wait = self.resync
+            with self._lock:
+                if self._stopping:
+                    return
+                self._lock.wait(timeout=wait)
+                if self._stopping:
+                    return
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="reminder-scheduler", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stopping = True
+            self._lock.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+# -------------------------------------------------
+# Notification sinks: callables taking one reminder row
+# -------------------------------------------------
+def log_sink(config):
+    def sink(row):
+        log.info("reminder %s due: %s (%s)", row["remkey"], row["title"], row["dueDate"])
+    return sink
+
+
+def webhook_sink(config):
+    """POSTs the reminder as JSON to REMINDER_WEBHOOK_URL; without a URL it
+    only logs the payload it would send."""
+    url = config.get("REMINDER_WEBHOOK_URL")
+    timeout = config.get("REMINDER_WEBHOOK_TIMEOUT", 5)
+
+    def sink(row):
+        body = json.dumps({"event": "reminder.due", "reminder": row}).encode("utf-8")
+        if not url:
+            log.info("webhook (no REMINDER_WEBHOOK_URL): %s", body.decode("utf-8"))
+            return
+        req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+    return sink
+
+
+# REMINDER_SINKS names -> factory(app.config)
+SINKS = {
+    "log": log_sink,
+    "webhook": webhook_sink,
+}
+
+
+# -------------------------------------------------
+# Session hooks: fold committed ORM writes into the scheduler
+# -------------------------------------------------
+def _changes(session):
+    return session.info.setdefault("reminder_changes", {"changed": set(), "deleted": set(), "bulk": False})
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _track_flush(session, flush_context):
+    from ORM_models import Reminders
+    changes = None
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Reminders):
+            changes = changes or _changes(session)
+            changes["changed"].add(obj.remkey)
+    for obj in session.deleted:
+        if isinstance(obj, Reminders):
+            changes = changes or _changes(session)
+            changes["deleted"].add(obj.remkey)
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _track_bulk(state):
+    from ORM_models import Reminders
+    if (state.is_insert or state.is_update or state.is_delete) and state.bind_mapper is not None \
+            and state.bind_mapper.class_ is Reminders:
+        _changes(state.session)["bulk"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _apply_changes(session):
+    if session.in_nested_transaction():  # a SAVEPOINT (write_queue.py), not the commit
+        return
+    changes = session.info.pop("reminder_changes", None)
+    if not changes or not has_app_context():
+        return
+    scheduler = current_app.extensions.get("reminder_scheduler")
+    if scheduler is None:
+        return
+    if changes["bulk"]:
+        scheduler.mark_stale()
+    else:
+        scheduler.apply(changes["changed"] - changes["deleted"], changes["deleted"])
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _discard_changes(session):
+    if not session.in_nested_transaction():  # keep what the rest of the transaction wrote
+        session.info.pop("reminder_changes", None)
+
+
+def init_app(app, engine):
+    """Create the app's scheduler; its thread starts with the first request."""
+    config = app.config
+    sinks = [SINKS[name](config) for name in config.get("REMINDER_SINKS", ["log"])]
+    scheduler = ReminderScheduler(
+        ReminderSource(engine),
+        sinks,
+        capacity=config.get("REMINDER_SCHEDULER_CAPACITY", DEFAULT_CAPACITY),
+        lookback=config.get("REMINDER_SCHEDULER_LOOKBACK", DEFAULT_LOOKBACK),
+        resync=config.get("REMINDER_SCHEDULER_RESYNC", DEFAULT_RESYNC),
+    )
+    app.extensions["reminder_scheduler"] = scheduler
+    # started lazily so the debug reloader's parent process doesn't fire too
+    app.before_request(scheduler.start)
+    return scheduler
+
+
+def get_scheduler():
+    return current_app.extensions["reminder_scheduler"]
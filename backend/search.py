@@ -0,0 +1,96 @@
+# Full-text search over notes, people and reminders.
+#
+# The FTS5 tables (notes_fts, person_fts, reminders_fts) are created by
+# migration 3 in migrations.py and kept in sync with their source tables by
+# triggers. search() runs one ranked query across all three.
+#
+# Titles and snippets are HTML: FTS5 marks the matches with control
+# characters, and mark_up() escapes the stored text before turning those
+# into <mark> tags, so nothing a user typed is ever served as markup.
+import html
+import re
+
+from sqlalchemy import text
+
+MARK_OPEN = "<mark>"
+MARK_CLOSE = "</mark>"
+# what FTS5 wraps the matches in, replaced by mark_up(); control characters
+# the CRM's text doesn't contain (and were one stored, it would still only
+# ever turn into a mark tag)
+_FTS_OPEN = "\x02"
+_FTS_CLOSE = "\x03"
+
+# one SELECT per entity type; every branch returns the same columns so they
+# can be UNIONed. bm25() depends on each table's own document count and
+# lengths, so ranks from different tables aren't comparable: search() scores
+# every hit as its rank / the best rank of its type (so the best hit of each
+# type scores 1.0) and merges the types by that score.
+_BRANCHES = {
+    "note": """
+        SELECT 'note' AS type, rowid AS id, bm25(notes_fts, 2.0, 1.0) AS rank,
+               highlight(notes_fts, 0, :mo, :mc) AS title,
+               snippet(notes_fts, 1, :mo, :mc, '…', 16) AS snippet
+        FROM notes_fts WHERE notes_fts MATCH :q""",
+    "person": """
+        SELECT 'person' AS type, rowid AS id, bm25(person_fts, 3.0, 3.0, 1.0) AS rank,
+               highlight(person_fts, 0, :mo, :mc) || ' ' || highlight(person_fts, 1, :mo, :mc) AS title,
+               highlight(person_fts, 2, :mo, :mc) AS snippet
+        FROM person_fts WHERE person_fts MATCH :q""",
+    "reminder": """
+        SELECT 'reminder' AS type, rowid AS id, bm25(reminders_fts, 2.0, 1.0) AS rank,
+               highlight(reminders_fts, 0, :mo, :mc) AS title,
+               snippet(reminders_fts, 1, :mo, :mc, '…', 16) AS snippet
+        FROM reminders_fts WHERE reminders_fts MATCH :q""",
+}
+
+TYPES = list(_BRANCHES)
+
+# source table -> (fts table, source key, indexed columns); the matching
+# triggers are named <fts table>_ai / _ad / _au
+FTS_SOURCES = {
+    "Notes": ("notes_fts", "notekey", ["title", "content"]),
+    "Person": ("person_fts", "perkey", ["firstName", "lastName", "location"]),
+    "Reminders": ("reminders_fts", "remkey", ["title", "description"]),
+}
+
+
+def to_match_query(q):
+    """Turn free text into a safe FTS5 query: every word quoted, prefix-matched, ANDed."""
+    words = re.findall(r"\w+", q)
+    return " ".join(f'"{w}"*' for w in words)
+
+
+def mark_up(value):
+    """HTML for a highlight()/snippet() result: the text escaped, the
+    matches in MARK_OPEN/MARK_CLOSE."""
+    if value is None:
+        return None
+    escaped = html.escape(value)
+    return escaped.replace(_FTS_OPEN, MARK_OPEN).replace(_FTS_CLOSE, MARK_CLOSE)
+
+
+def search(session, q, types=None, limit=20, offset=0):
+    """Ranked hits for `q`. Returns (hits, has_more)."""
+    match = to_match_query(q)
+    if not match:
+        return [], False
+
+    hits = "\nUNION ALL\n".join(_BRANCHES[t] for t in (types or TYPES))
+    sql = f"""
+        SELECT *, rank / NULLIF(MIN(rank) OVER (PARTITION BY type), 0) AS score
+        FROM ({hits})
+        ORDER BY score DESC, rank, type, id LIMIT :limit OFFSET :offset"""
+    rows = session.execute(text(sql), {
+        "q": match,
+        "mo": _FTS_OPEN,
+        "mc": _FTS_CLOSE,
+        "limit": limit + 1,
+        "offset": offset,
+    }).all()
+
+    hits = [
+        {"type": r.type, "id": r.id, "rank": r.rank, "score": r.score,
+         "title": mark_up(r.title), "snippet": mark_up(r.snippet)}
+        for r in rows[:limit]
+    ]
+    return hits, len(rows) > limit
@@ -0,0 +1,151 @@
+# Compiled serializers for the JSON API.
+#
+# A Serializer is built once per output shape, at import: the output names and
+# the columns feeding them are fixed, so turning a row into a dict is a
+# dict(zip(names, row)). Handlers select exactly those columns
+# (serializer.query()) and get plain row tuples back, skipping ORM object
+# construction and the per-column getattr of the old model_to_dict.
+#
+# OrjsonProvider replaces Flask's JSON encoder with orjson when it is
+# installed; without it the stdlib encoder is used as before.
+from operator import attrgetter
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import select
+
+from ORM_models import Person, PersonSummary, Notes, Reminders, RelationshipType
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+class Serializer:
+    def __init__(self, model, fields):
+        """`fields` maps output name -> model attribute, in output order."""
+        self.model = model
+        self.fields = dict(fields)
+        self.names = tuple(self.fields)
+        self.columns = tuple(getattr(model, attr) for attr in self.fields.values())
+        getter = attrgetter(*self.fields.values())
+        # attrgetter with one name returns the value, not a 1-tuple
+        self._values = getter if len(self.fields) > 1 else (lambda obj: (getter(obj),))
+        self._subsets = {}
+
+    def only(self, names):
+        """The serializer for a subset of the output names (cached)."""
+        names = tuple(names)
+        subset = self._subsets.get(names)
+        if subset is None:
+            subset = Serializer(self.model, {name: self.fields[name] for name in names})
+            self._subsets[names] = subset
+        return subset
+
+    def query(self, *extra):
+        """SELECT of this shape's columns; `extra` columns go after them and
+        are ignored by row()/rows()."""
+        return select(*self.columns, *extra)
+
+    def row(self, row):
+        return dict(zip(self.names, row))
+
+    def rows(self, rows):
+        names = self.names
+        return [dict(zip(names, row)) for row in rows]
+
+    def obj(self, obj):
+        """Serialize an already loaded ORM instance."""
+        return dict(zip(self.names, self._values(obj)))
+
+
+def table_fields(model):
+    """name -> attribute for every stored column (generated columns skipped)."""
+    return {
+        col.name: col.key
+        for col in model.__table__.columns
+        if col.computed is None  # generated index columns, not data
+    }
+
+
+_table_serializers = {}
+
+
+def for_model(model):
+    serializer = _table_serializers.get(model)
+    if serializer is None:
+        serializer = _table_serializers[model] = Serializer(model, table_fields(model))
+    return serializer
+
+
+def model_to_dict(obj):
+    return for_model(type(obj)).obj(obj)
+
+
+# -------------------------------------------------
+# API shapes: output name -> model attribute
+# -------------------------------------------------
+PERSON_FIELDS = table_fields(Person)
+NOTE_FIELDS = {
+    "id": "notekey",
+    "title": "title",
+    "content": "content",
+    "created_at": "dateCreated",
+    "updated_at": "lastModified",
+}
+REMINDER_FIELDS = {
+    "id": "remkey",
+    "label": "title",                 # map DB title → frontend label
+    "description": "description",
+    "due_date": "dueDate",           # map dueDate → due_date
+    "completed": "completed",
+}
+RELATIONSHIP_TYPE_FIELDS = {"relTypeKey": "relTypeKey", "name": "name", "description": "description"}
+PERSON_SUMMARY_FIELDS = {
+    "notes": "noteCount",
+    "openReminders": "openReminderCount",
+    "nextDue": "nextDueDate",
+    "relationships": "relationshipCount",
+    "categories": "categories",
+}
+
+PERSON = for_model(Person)
+NOTE = Serializer(Notes, NOTE_FIELDS)
+NOTE_SUMMARY = NOTE.only(["id", "title", "content"])   # the per-person note lists
+REMINDER = Serializer(Reminders, REMINDER_FIELDS)
+RELATIONSHIP_TYPE = Serializer(RelationshipType, RELATIONSHIP_TYPE_FIELDS)
+PERSON_SUMMARY = Serializer(PersonSummary, PERSON_SUMMARY_FIELDS)
+
+
+# -------------------------------------------------
+# orjson-backed JSON provider
+# -------------------------------------------------
+class OrjsonProvider(DefaultJSONProvider):
+    """DefaultJSONProvider with orjson doing the encoding. Keys are sorted and
+    debug responses indented like the default provider; anything orjson can't
+    encode natively goes through the default provider's hook."""
+
+    def _option(self):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:  # indent/separators etc: leave it to the stdlib encoder
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._option()).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        option = self._option() | orjson.OPT_APPEND_NEWLINE
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option |= orjson.OPT_INDENT_2
+        body = orjson.dumps(obj, default=self.default, option=option)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_app(app):
+    """Use orjson for jsonify() when it is installed (JSON_ORJSON = False to opt out)."""
+    if orjson is not None and app.config.get("JSON_ORJSON", True):
+        app.json = OrjsonProvider(app)
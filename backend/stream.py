@@ -0,0 +1,384 @@
+# Server-Sent Events for live updates (GET /api/stream).
+#
+# An in-process broker turns ChangeLog entries (migration 8, changelog.py)
+# into events and hands each to the subscribers of its topics:
+#   changes                       every change
+#   persons, notes, reminders     rows of those tables and of their junctions
+#   person:<perkey>               the person's row, its junction rows (notes,
+#                                 reminders, categories, links, relationships)
+#                                 and edits of its notes and reminders
+#   reminders.due                 a reminder coming due (scheduler.py)
+# A change event carries the entry (seq, table, key, op), not the row.
+#
+# Committed ORM writes wake the broker thread (session hooks below), which
+# reads the new entries once for all subscribers and encodes each event once.
+# It also polls every `poll` seconds, for raw writes and other processes.
+# An idle subscriber costs a queue and a heartbeat comment every `heartbeat`
+# seconds; with none, the broker doesn't read ChangeLog at all.
+#
+# Each subscriber's queue holds `queue_size` events. One that falls further
+# behind loses its queue and gets a single "overflow" event with the seq it
+# had reached, to catch up from through GET /api/changes?since=<seq> (due
+# reminders dropped meanwhile are in /api/reminders/due). A reconnecting
+# client's Last-Event-ID is replayed from ChangeLog the same way.
+#
+# The Flask endpoint holds a worker thread per open stream; asgi.py serves
+# /api/stream on its event loop instead, which is what to run for many
+# clients (bench_stream.py measures that). Like the scheduler the broker
+# lives in the process.
+import json
+import logging
+import re
+import threading
+from collections import deque
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, text
+
+from db_roles import RoutingSession
+from migrations import CHANGE_KEYS
+
+log = logging.getLogger("stream")
+
+DEFAULT_QUEUE_SIZE = 256
+DEFAULT_MAX_CLIENTS = 1000
+DEFAULT_HEARTBEAT = 15
+DEFAULT_POLL = 5
+READ_CHUNK = 1000            # ChangeLog entries per read
+
+TOPICS = {"changes", "persons", "notes", "reminders", "reminders.due"}
+PERSON_TOPIC = re.compile(r"person:(\d+)$")
+
+TABLE_TOPICS = {
+    "Person": "persons",
+    "Notes": "notes", "NotedPerson": "notes", "NotePhoto": "notes",
+    "Reminders": "reminders", "remPer": "reminders", "remCat": "reminders",
+}
+# tables whose key names people directly
+PERSON_KEYS = {
+    "Person": ["perkey"], "SocialLinks": ["perkey"], "NotedPerson": ["perkey"], "perCat": ["perkey"],
+    "remPer": ["perkey"], "Relationships": ["perkey1", "perkey2"],
+}
+# tables whose rows reach people through a junction: table -> (junction, key column)
+LINKED_PEOPLE = {"Notes": ("NotedPerson", "notekey"), "Reminders": ("remPer", "remkey")}
+
+
+class StreamBusy(Exception):
+    """Raised by subscribe() when `max_clients` streams are open."""
+
+
+def parse_topics(value):
+    """Set of topics from ?topics=a,b (None for everything); raises ValueError."""
+    if not value:
+        return None
+    topics = {t.strip() for t in value.split(",") if t.strip()}
+    unknown = sorted(t for t in topics if t not in TOPICS and not PERSON_TOPIC.match(t))
+    if unknown:
+        raise ValueError("unknown topics: " + ", ".join(unknown))
+    return topics
+
+
+def parse_last_event_id(value):
+    """The seq of a Last-Event-ID header (None when absent); raises ValueError."""
+    if value in (None, ""):
+        return None
+    try:
+        seq = int(value)
+    except ValueError:
+        raise ValueError("Last-Event-ID must be an integer")
+    if seq < 0:
+        raise ValueError("Last-Event-ID must be >= 0")
+    return seq
+
+
+def encode(name, data, seq=None):
+    """One SSE message."""
+    head = f"id: {seq}\n" if seq is not None else ""
+    return f"{head}event: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+HEARTBEAT = b": keepalive\n\n"
+
+
+class Subscription:
+    def __init__(self, topics, queue_size, seq):
+        self.topics = topics          # None = everything
+        self.queue_size = queue_size
+        self.seq = seq                # the last change taken off the queue
+        self.on_ready = None          # called when events arrive (asgi.py)
+        self._events = deque()        # (seq or None, message)
+        self._overflow = False
+        self._cond = threading.Condition()
+
+    def wants(self, topics):
+        return self.topics is None or not self.topics.isdisjoint(topics)
+
+    def offer(self, seq, message):
+        with self._cond:
+            if self._overflow:
+                return   # the catch-up through /api/changes covers it
+            if len(self._events) >= self.queue_size:
+                self._events.clear()
+                self._overflow = True
+            else:
+                self._events.append((seq, message))
+            self._cond.notify()
+        if self.on_ready is not None:
+            self.on_ready()
+
+    def overflow(self):
+        """Drop what is queued and send the overflow event instead."""
+        with self._cond:
+            self._events.clear()
+            self._overflow = True
+            self._cond.notify()
+        if self.on_ready is not None:
+            self.on_ready()
+
+    def take(self):
+        """The queued messages, joined (b"" for none)."""
+        with self._cond:
+            return self._take()
+
+    def wait(self, timeout):
+        """take(), blocking up to `timeout` seconds for something to arrive."""
+        with self._cond:
+            if not self._events and not self._overflow:
+                self._cond.wait(timeout)
+            return self._take()
+
+    def _take(self):
+        if self._overflow:
+            self._overflow = False
+            return encode("overflow", {"seq": self.seq})
+        messages = []
+        while self._events:
+            seq, message = self._events.popleft()
+            if seq is not None:
+                self.seq = seq
+            messages.append(message)
+        return b"".join(messages)
+
+
+class ChangeSource:
+    """Reads ChangeLog, and the people linked to notes and reminders, with its own engine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def head(self):
+        with self.engine.connect() as conn:
+            return conn.execute(text("SELECT COALESCE(MAX(seq), 0) FROM ChangeLog")).scalar()
+
+    def entries(self, after, limit):
+        with self.engine.connect() as conn:
+            return conn.execute(
+                text("SELECT seq, tableName, rowKey, op FROM ChangeLog WHERE seq > :after ORDER BY seq LIMIT :n"),
+                {"after": after, "n": limit},
+            ).all()
+
+    def people(self, junction, column, keys):
+        """key -> perkeys linked to it through `junction`."""
+        linked = {}
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text(f'SELECT {column}, perkey FROM "{junction}" WHERE {column} IN (SELECT value FROM json_each(:keys))'),
+                {"keys": json.dumps(sorted(keys))},
+            )
+            for key, perkey in rows:
+                linked.setdefault(key, []).append(perkey)
+        return linked
+
+
+class Broker:
+    def __init__(self, source, queue_size=DEFAULT_QUEUE_SIZE, max_clients=DEFAULT_MAX_CLIENTS,
+                 heartbeat=DEFAULT_HEARTBEAT, poll=DEFAULT_POLL):
+        self.source = source
+        self.queue_size = queue_size
+        self.max_clients = max_clients
+        self.heartbeat = heartbeat
+        self.poll_interval = poll
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._seq = None          # the last entry published; None while nobody listens
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopping = False
+        self.published = 0
+
+    def subscribe(self, topics=None, last_seq=None, on_ready=None):
+        """A new Subscription; `on_ready` is set before the replay after
+        `last_seq` is queued, so it hears about that too."""
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                raise StreamBusy()
+            if self._seq is None:
+                self._seq = self.source.head()
+            sub = Subscription(topics, self.queue_size, self._seq)
+            sub.on_ready = on_ready
+            if last_seq is not None and last_seq < self._seq:
+                sub.seq = last_seq
+                self._replay(sub, last_seq)
+            self._subscribers.add(sub)
+        self.start()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+            if not self._subscribers:
+                self._seq = None
+
+    def hello(self, sub):
+        """The first message of a stream: reconnect delay and position."""
+        return f"retry: {self.heartbeat * 1000}\n".encode() + encode("ready", {"seq": sub.seq})
+
+    def wake(self):
+        if self._subscribers:
+            self._wake.set()
+
+    def reminder_due(self, row):
+        """Scheduler sink."""
+        message = encode("reminder.due", row)
+        with self._lock:
+            for sub in self._subscribers:
+                if sub.wants(("reminders.due",)):
+                    sub.offer(None, message)
+
+    # --- publishing (call with the lock held) ---
+
+    def _replay(self, sub, after):
+        entries = [e for e in self.source.entries(after, self.queue_size + 1) if e[0] <= self._seq]
+        if len(entries) > self.queue_size:
+            sub.overflow()
+            return
+        for seq, topics, message in self._events(entries):
+            if sub.wants(topics):
+                sub.offer(seq, message)
+
+    def _events(self, entries):
+        """(seq, topics, message) per entry."""
+        decoded = [(seq, table, json.loads(row_key), op) for seq, table, row_key, op in entries]
+        linked = {}
+        for table, (junction, column) in LINKED_PEOPLE.items():
+            keys = {key[0] for _, t, key, op in decoded if t == table and op == "upsert"}
+            linked[table] = self.source.people(junction, column, keys) if keys else {}
+        events = []
+        for seq, table, key, op in decoded:
+            named = dict(zip(CHANGE_KEYS[table], key))
+            people = [named[c] for c in PERSON_KEYS.get(table, ())]
+            people += linked.get(table, {}).get(key[0], ())
+            topics = {"changes", *(f"person:{p}" for p in people)}
+            if table in TABLE_TOPICS:
+                topics.add(TABLE_TOPICS[table])
+            message = encode("change", {"seq": seq, "table": table, "key": named, "op": op}, seq)
+            events.append((seq, topics, message))
+        return events
+
+    def poll(self):
+        """Publish the entries committed since the last poll."""
+        with self._lock:
+            while self._subscribers:
+                entries = self.source.entries(self._seq, READ_CHUNK)
+                if not entries:
+                    return
+                for seq, topics, message in self._events(entries):
+                    for sub in self._subscribers:
+                        if sub.wants(topics):
+                            sub.offer(seq, message)
+                    self.published += 1
+                self._seq = entries[-1][0]
+
+    # --- background thread ---
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            if self._stopping:
+                return
+            try:
+                self.poll()
+            except Exception:
+                log.exception("stream poll failed")
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="event-broker", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": len(self._subscribers), "seq": self._seq, "published": self.published}
+
+
+def sse(broker, sub):
+    """The WSGI response body of a stream; unsubscribes when the client goes."""
+    try:
+        yield broker.hello(sub)
+        while True:
+            yield sub.wait(broker.heartbeat) or HEARTBEAT
+    finally:
+        broker.unsubscribe(sub)
+
+
+# -------------------------------------------------
+# Session hooks: wake the broker once a write commits
+# -------------------------------------------------
+@event.listens_for(RoutingSession, "after_flush")
+def _track_flush(session, flush_context):
+    if session.new or session.dirty or session.deleted:
+        session.info["stream_wake"] = True
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _track_bulk(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info["stream_wake"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _wake_broker(session):
+    if session.in_nested_transaction():  # a SAVEPOINT (write_queue.py), not the commit
+        return
+    if session.info.pop("stream_wake", False) and has_app_context():
+        broker = current_app.extensions.get("event_broker")
+        if broker is not None:
+            broker.wake()
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _discard_wake(session):
+    if not session.in_nested_transaction():
+        session.info.pop("stream_wake", None)
+
+
+def init_app(app, engine):
+    """Create the app's broker; its thread starts with the first subscriber.
+    Due reminders reach it as a sink of the scheduler, when there is one."""
+    config = app.config
+    broker = Broker(
+        ChangeSource(engine),
+        queue_size=config.get("STREAM_QUEUE_SIZE", DEFAULT_QUEUE_SIZE),
+        max_clients=config.get("STREAM_MAX_CLIENTS", DEFAULT_MAX_CLIENTS),
+        heartbeat=config.get("STREAM_HEARTBEAT", DEFAULT_HEARTBEAT),
+        poll=config.get("STREAM_POLL", DEFAULT_POLL),
+    )
+    app.extensions["event_broker"] = broker
+    scheduler = app.extensions.get("reminder_scheduler")
+    if scheduler is not None:
+        scheduler.sinks.append(broker.reminder_due)
+    return broker
+
+
+def get_broker():
+    return current_app.extensions["event_broker"]
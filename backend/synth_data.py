@@ -0,0 +1,292 @@
+# Deterministic synthetic CRM data for benchmarks and load tests.
+#
+#   python synth_data.py OUT.sqlite --rows 100000 [--seed 1] [--base-date 2026-01-01]
+#                        [--photo-store DIR]
+#
+# Builds a fresh database (create_schema.sql + migrations) holding about
+# --rows rows across all tables, ROWS_PER_PERSON rows for every person:
+#   - people with Zipf-distributed locations and birthdays spread over 1950-2005
+#   - a power-law relationship graph (preferential attachment, EDGES_PER_PERSON
+#     edges per new person), so a few people have thousands of relationships
+#   - notes shared by one or two people, some with a photo
+#   - reminders due from 30 days before to 365 days after --base-date
+#   - photos: PHOTO_VARIANTS distinct tiny PNGs, written to --photo-store
+#
+# The same --rows, --seed and --base-date always give the same database; each
+# table draws from its own seeded generator. Rows are streamed through
+# BulkImporter, so memory stays flat apart from the graph's endpoint array.
+import argparse
+import datetime
+import hashlib
+import os
+import random
+import sqlite3
+import struct
+import zlib
+from array import array
+
+from blobstore import BlobStore
+from bulk_import import BulkImporter
+from migrations import create_database
+
+ROWS_PER_PERSON = 13
+EDGES_PER_PERSON = 2
+NOTES_PER_PERSON = 2
+REMINDERS_PER_PERSON = 1
+PHOTO_VARIANTS = 64
+
+FIRST_NAMES = [
+    "Ada", "Alan", "Alice", "Amir", "Ana", "Ben", "Bianca", "Blake", "Carlos", "Chen", "Chloe", "Dana",
+    "David", "Elena", "Eli", "Emma", "Farah", "Felix", "Grace", "Hana", "Hugo", "Ines", "Ivan", "Jason",
+    "Jin", "Julia", "Kai", "Kofi", "Lara", "Leo", "Lina", "Maya", "Michael", "Mina", "Noah", "Nora",
+    "Omar", "Priya", "Quinn", "Rosa", "Sam", "Sara", "Tariq", "Tess", "Uma", "Victor", "Wei", "Yara",
+    "Yusuf", "Zoe",
+]
+LAST_NAMES = [
+    "Abe", "Adams", "Ali", "Bauer", "Brown", "Chen", "Cohen", "Costa", "Diaz", "Dubois", "Evans", "Fischer",
+    "Garcia", "Gupta", "Hall", "Hoff", "Ito", "Ivanov", "Jones", "Kim", "Klein", "Kowalski", "Lee", "Lopez",
+    "Martin", "Meyer", "Moreau", "Nakamura", "Nguyen", "Novak", "Okafor", "Olsen", "Patel", "Perez",
+    "Quinn", "Rossi", "Sato", "Schmidt", "Silva", "Singh", "Smith", "Suzuki", "Tanaka", "Torres", "Wang",
+    "Weber", "Wilson", "Wong", "Yamada", "Zhang",
+]
+CITIES = [
+    "Merced, CA", "Fresno, CA", "San Jose, CA", "Los Angeles, CA", "San Francisco, CA", "Sacramento, CA",
+    "Oakland, CA", "Modesto, CA", "Stockton, CA", "San Diego, CA", "Portland, OR", "Seattle, WA",
+    "Reno, NV", "Phoenix, AZ", "Denver, CO", "Austin, TX", "Chicago, IL", "Boston, MA", "New York, NY",
+    "Atlanta, GA", "Miami, FL", "Madison, WI", "Minneapolis, MN", "Salt Lake City, UT", "Boise, ID",
+]
+WORDS = (
+    "meeting coffee lunch birthday project deadline call email follow up soccer practice game team "
+    "trip flight hotel conference talk slides review draft report budget invoice contract offer "
+    "interview hiring intro referral gift party wedding dinner movie book concert hike run gym "
+    "doctor dentist visit family kids school homework exam grade class lab study group notes idea "
+    "plan launch release bug fix feature design sketch prototype demo feedback survey data model "
+    "query index cache latency database server client mobile web garden recipe market weekend"
+).split()
+REL_TYPES = [
+    ("Friend", "Friends"), ("Classmate", "Same class"), ("Coworker", "Works together"),
+    ("Family", "Relatives"), ("Project Partner", "Shared project"),
+]
+CATEGORIES = [
+    ("Soccer Player", "Plays soccer"), ("Work", "Work contacts"), ("College", "From college"),
+    ("Neighbors", "Lives nearby"), ("Gym", "Gym buddies"), ("Book Club", "Reads together"),
+    ("VIP", "Keep in touch often"), ("Family", "Family members"),
+]
+PLATFORMS = [
+    ("Instagram", "https://instagram.com/"), ("LinkedIn", "https://linkedin.com/in/"),
+    ("GitHub", "https://github.com/"), ("X", "https://x.com/"), ("Facebook", "https://facebook.com/"),
+]
+
+
+def _rng(seed, table):
+    return random.Random(f"{seed}:{table}")
+
+
+def _zipf_weights(n, s=1.1):
+    return [1 / (i + 1) ** s for i in range(n)]
+
+
+def tiny_png(r, g, b, size=32):
+    """A solid-colour RGB PNG, built without Pillow."""
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body) & 0xFFFFFFFF)
+
+    row = b"\x00" + bytes((r, g, b)) * size
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(row * size))
+        + chunk(b"IEND", b"")
+    )
+
+
+def _words(rng, lo, hi):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(lo, hi)))
+
+
+def _stamp(base, rng, lo_days, hi_days):
+    offset = rng.randint(lo_days * 86400, hi_days * 86400)
+    return (base + datetime.timedelta(seconds=offset)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+# -------------------------------------------------
+# Per-table row generators (tuples in the column order given to insert_rows)
+# -------------------------------------------------
+def photos(n_photos, seed, store):
+    rng = _rng(seed, "Photo")
+    variants = []
+    for _ in range(PHOTO_VARIANTS):
+        data = tiny_png(rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        if store is not None:
+            variants.append(store.put(data))
+        else:
+            variants.append((hashlib.sha256(data).hexdigest(), len(data)))
+    for photokey in range(1, n_photos + 1):
+        digest, size = variants[rng.randrange(PHOTO_VARIANTS)]
+        yield (photokey, digest, "image/png", size)
+
+
+def people(n, n_photos, seed):
+    rng = _rng(seed, "Person")
+    weights = _zipf_weights(len(CITIES))
+    for perkey in range(1, n + 1):
+        photokey = rng.randint(1, n_photos) if n_photos and rng.random() < 0.5 else None
+        yield (
+            perkey, photokey, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES),
+            f"{rng.randint(1950, 2005)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            rng.choices(CITIES, weights)[0],
+        )
+
+
+def notes(n_notes, seed, base):
+    rng = _rng(seed, "Notes")
+    for notekey in range(1, n_notes + 1):
+        created = _stamp(base, rng, -730, 0)
+        yield (notekey, _words(rng, 2, 6).capitalize(), _words(rng, 5, 60), created, created)
+
+
+def reminders(n_reminders, seed, base):
+    rng = _rng(seed, "Reminders")
+    for remkey in range(1, n_reminders + 1):
+        yield (
+            remkey, _words(rng, 2, 5).capitalize(), _words(rng, 0, 20) or None,
+            _stamp(base, rng, -30, 365), 1 if rng.random() < 0.3 else 0,
+        )
+
+
+def social_links(n, seed):
+    rng = _rng(seed, "SocialLinks")
+    for perkey in range(1, n + 1):
+        for socialkey in sorted(rng.sample(range(1, len(PLATFORMS) + 1), rng.randint(0, 3))):
+            handle = f"user{perkey}_{socialkey}"
+            yield (socialkey, perkey, handle, PLATFORMS[socialkey - 1][1] + handle)
+
+
+def note_photos(n_notes, n_photos, seed):
+    rng = _rng(seed, "NotePhoto")
+    if not n_photos:
+        return
+    for notekey in range(1, n_notes + 1):
+        if rng.random() < 0.1:
+            yield (notekey, rng.randint(1, n_photos))
+
+
+def noted_people(n, n_notes, seed):
+    rng = _rng(seed, "NotedPerson")
+    for notekey in range(1, n_notes + 1):
+        first = rng.randint(1, n)
+        yield (first, notekey)
+        if n > 1 and rng.random() < 0.3:
+            second = rng.randint(1, n)
+            if second != first:
+                yield (second, notekey)
+
+
+def relationships(n, seed):
+    """Preferential attachment: each new person links to EDGES_PER_PERSON
+    earlier people picked in proportion to their degree."""
+    rng = _rng(seed, "Relationships")
+    m = EDGES_PER_PERSON
+    endpoints = array("l")
+    core = min(n, m + 1)
+    for a in range(1, core + 1):
+        for b in range(a + 1, core + 1):
+            endpoints.extend((a, b))
+            yield (rng.randint(1, len(REL_TYPES)), a, b)
+    for perkey in range(core + 1, n + 1):
+        targets = set()
+        while len(targets) < m:
+            targets.add(endpoints[rng.randrange(len(endpoints))])
+        for target in sorted(targets):
+            endpoints.extend((target, perkey))
+            yield (rng.randint(1, len(REL_TYPES)), target, perkey)
+
+
+def per_cats(n, seed):
+    rng = _rng(seed, "perCat")
+    for perkey in range(1, n + 1):
+        for catkey in sorted(rng.sample(range(1, len(CATEGORIES) + 1), rng.choice((0, 1, 1, 2)))):
+            yield (perkey, catkey)
+
+
+def rem_pers(n, n_reminders, seed):
+    rng = _rng(seed, "remPer")
+    for remkey in range(1, n_reminders + 1):
+        first = rng.randint(1, n)
+        yield (remkey, first)
+        if n > 1 and rng.random() < 0.2:
+            second = rng.randint(1, n)
+            if second != first:
+                yield (remkey, second)
+
+
+def rem_cats(n_reminders, seed):
+    rng = _rng(seed, "remCat")
+    for remkey in range(1, n_reminders + 1):
+        if rng.random() < 0.3:
+            yield (remkey, rng.randint(1, len(CATEGORIES)))
+
+
+# -------------------------------------------------
+def generate(path, rows, seed=1, base_date=None, photo_store=None):
+    """Create `path` with about `rows` rows; returns the importer's stats dict."""
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    base = datetime.datetime.combine(base_date or datetime.date.today(), datetime.time())
+    n = max(1, rows // ROWS_PER_PERSON)
+    n_photos = n // 2
+    n_notes = n * NOTES_PER_PERSON
+    n_reminders = n * REMINDERS_PER_PERSON
+    store = BlobStore(photo_store) if photo_store else None
+
+    create_database(path)
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = OFF")
+
+        importer = BulkImporter(conn)
+        load = importer.insert_rows
+        load("RelationshipType", ["relTypeKey", "name", "description"],
+             [(i, name, desc) for i, (name, desc) in enumerate(REL_TYPES, 1)])
+        load("Category", ["catkey", "name", "description"],
+             [(i, name, desc) for i, (name, desc) in enumerate(CATEGORIES, 1)])
+        load("SocialType", ["socialkey", "platformName", "platformURL"],
+             [(i, name, url) for i, (name, url) in enumerate(PLATFORMS, 1)])
+        # rows are consistent by construction, so the foreign key sets are skipped
+        load("Photo", ["photokey", "contentHash", "mimeType", "byteSize"], photos(n_photos, seed, store), False)
+        load("Notes", ["notekey", "title", "content", "dateCreated", "lastModified"],
+             notes(n_notes, seed, base), False)
+        load("Person", ["perkey", "photokey", "firstName", "lastName", "birthday", "location"],
+             people(n, n_photos, seed), False)
+        load("Reminders", ["remkey", "title", "description", "dueDate", "completed"],
+             reminders(n_reminders, seed, base), False)
+        load("SocialLinks", ["socialkey", "perkey", "handle", "profileURL"], social_links(n, seed), False)
+        load("NotePhoto", ["notekey", "photokey"], note_photos(n_notes, n_photos, seed), False)
+        load("NotedPerson", ["perkey", "notekey"], noted_people(n, n_notes, seed), False)
+        load("Relationships", ["relTypeKey", "perkey1", "perkey2"], relationships(n, seed), False)
+        load("perCat", ["perkey", "catkey"], per_cats(n, seed), False)
+        load("remPer", ["remkey", "perkey"], rem_pers(n, n_reminders, seed), False)
+        load("remCat", ["remkey", "catkey"], rem_cats(n_reminders, seed), False)
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA synchronous = NORMAL")
+    finally:
+        conn.close()
+    return importer.stats.as_dict()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic CRM database.")
+    parser.add_argument("out", help="path of the new SQLite database")
+    parser.add_argument("--rows", type=int, default=100000, help="approximate total rows (10^3 to 10^7)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--base-date", type=datetime.date.fromisoformat,
+                        help="date reminders and notes are spread around (default: today)")
+    parser.add_argument("--photo-store", help="blob store directory for the photo bytes")
+    args = parser.parse_args()
+
+    result = generate(args.out, args.rows, args.seed, args.base_date, args.photo_store)
+    for table, count in result["rows"].items():
+        print(f"{table:18} {count:>10}")
+    print(f"{result['total']} rows in {result['seconds']}s ({result['rowsPerSecond']} rows/sec)")
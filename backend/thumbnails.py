@@ -0,0 +1,131 @@
+# Thumbnail pipeline for photos in the blob store.
+#
+# Decoding and resizing is CPU bound, so it runs on a ProcessPoolExecutor
+# instead of the request threads. Results are cached on disk next to the
+# blob store, keyed by the photo's content hash:
+#
+#   <THUMBNAIL_CACHE_PATH>/<size>/<aa>/<sha256>.jpg
+#
+# Pillow is optional; without it the pipeline is disabled and callers fall
+# back to the original image.
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+
+from flask import current_app
+
+from blobstore import get_store
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+# name -> longest edge in pixels
+SIZES = {
+    "small": 64,
+    "medium": 256,
+    "large": 1024,
+}
+
+JPEG_QUALITY = 85
+
+
+def thumbnail_path(cache_root, digest, size):
+    return os.path.join(cache_root, size, digest[:2], digest + ".jpg")
+
+
+def render_thumbnails(src_path, digest, cache_root):
+    """Write every missing size for one image. Runs inside a worker process."""
+    img = Image.open(src_path)
+    # let the JPEG decoder downscale while decoding, much cheaper than a full decode
+    img.draft("RGB", (max(SIZES.values()),) * 2)
+    if img.mode in ("RGBA", "LA", "P"):
+        rgba = img.convert("RGBA")
+        img = Image.new("RGB", rgba.size, (255, 255, 255))
+        img.paste(rgba, mask=rgba.split()[-1])
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+
+    # largest first, each smaller size is resized from the previous one
+    written = []
+    for size, edge in sorted(SIZES.items(), key=lambda kv: -kv[1]):
+        dest = thumbnail_path(cache_root, digest, size)
+        img.thumbnail((edge, edge))
+        if os.path.exists(dest):
+            continue
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest), prefix=".thumb-")
+        with os.fdopen(fd, "wb") as out:
+            img.save(out, "JPEG", quality=JPEG_QUALITY, optimize=True)
+        os.replace(tmp, dest)
+        written.append(size)
+    return written
+
+
+class ThumbnailPipeline:
+    def __init__(self, store, cache_root, max_workers=None):
+        self.store = store
+        self.cache_root = cache_root
+        self.max_workers = max_workers
+        self._executor = None
+        self._pending = {}
+        self._lock = Lock()
+
+    @property
+    def enabled(self):
+        return Image is not None
+
+    def path(self, digest, size):
+        return thumbnail_path(self.cache_root, digest, size)
+
+    def is_complete(self, digest):
+        return all(os.path.exists(self.path(digest, size)) for size in SIZES)
+
+    def submit(self, digest):
+        """Queue thumbnail generation for a blob; returns a Future (or None).
+
+        Concurrent submissions for the same hash share one job.
+        """
+        if not self.enabled or self.is_complete(digest):
+            return None
+        with self._lock:
+            future = self._pending.get(digest)
+            if future is not None:
+                return future
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            future = self._executor.submit(
+                render_thumbnails, self.store.path(digest), digest, self.cache_root
+            )
+            self._pending[digest] = future
+        # outside the lock: a future that is already done runs the callback
+        # right here, and _done takes the lock
+        future.add_done_callback(lambda f, d=digest: self._done(d))
+        return future
+
+    def _done(self, digest):
+        with self._lock:
+            self._pending.pop(digest, None)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+_pipelines = {}
+
+
+def get_pipeline():
+    """The ThumbnailPipeline for the current app's blob store."""
+    store = get_store()
+    cache_root = current_app.config.get("THUMBNAIL_CACHE_PATH") or os.path.join(
+        current_app.instance_path, "thumbnails"
+    )
+    if cache_root not in _pipelines:
+        _pipelines[cache_root] = ThumbnailPipeline(
+            store, cache_root, current_app.config.get("THUMBNAIL_WORKERS")
+        )
+    return _pipelines[cache_root]
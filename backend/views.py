@@ -1,27 +1,154 @@
+# Flask-Admin views. LargeTableView keeps the list pages cheap on big tables:
+#   - the row count comes from TableStats (kept by triggers, migrations.py)
+#     instead of a COUNT(*) over the table, unless a search or filter is on
+#   - in the default primary key order, the links to the next and previous
+#     page carry the last / first key of the current page (?after=, ?before=)
+#     and seek to it in the primary key index instead of skipping
+#     page * page_size rows with OFFSET; jumping to any other page still
+#     uses OFFSET
+#   - `query_options` are applied to the list query: defer() for heavy
+#     columns, joinedload().load_only() for the relationship columns shown
+#   - forms leave out the one-to-many collections, and form_ajax_refs turns
+#     the many-to-one selects on big tables into search boxes, so no form
+#     loads a whole table into a <select>
+from flask import g, has_request_context, request
 from flask_admin.contrib.sqla import ModelView
+from flask_admin.tools import iterdecode, iterencode
+from sqlalchemy import inspect, text, tuple_
+from sqlalchemy.orm import defer, joinedload, undefer
 
-class PhotoView(ModelView):
-    column_hide_backrefs = False
-    column_list = ["photokey", "filePath"]
+from ORM_models import Person, Notes, Photo, Reminders, Relationships, RelationshipType, SocialLinks, NotePhoto, NotedPerson, PerCat, RemPer, RemCat, Category
 
-class NotesView(ModelView):
-    column_hide_backrefs = False
-    column_list = ["notekey", "title", "content", "dateCreated", "lastModified"]
+SEEK_ARGS = ("after", "before")
 
-class SocialTypeView(ModelView):
-    column_hide_backrefs = False
+
+def _show(relation, *fields):
+    """column_formatters entry: `fields` of the related row, space separated."""
+    def formatter(view, context, model, name):
+        other = getattr(model, relation)
+        return " ".join(str(getattr(other, f) or "") for f in fields) if other is not None else ""
+    return formatter
+
+
+def _lookup(*fields):
+    """form_ajax_refs entry: search the related table by `fields`."""
+    return {"fields": list(fields), "page_size": 10}
+
+
+class LargeTableView(ModelView):
+    query_options = ()
+    column_auto_select_related = False   # query_options says what to join
+
+    def __init__(self, model, session, **kwargs):
+        self._key = [getattr(model, c.key) for c in inspect(model).primary_key]
+        if self.column_default_sort is None:
+            self.column_default_sort = [(c.key, False) for c in self._key]
+        collections = [r.key for r in inspect(model).relationships if r.uselist]
+        self.form_excluded_columns = list(self.form_excluded_columns or ()) + collections
+        super().__init__(model, session, **kwargs)
+
+    def get_query(self):
+        return super().get_query().options(*self.query_options)
+
+    def get_count_query(self):
+        if g.get("admin_estimated_count"):
+            return None   # get_list reads TableStats instead
+        return super().get_count_query()
+
+    def estimated_count(self):
+        return self.session.execute(
+            text("SELECT rowCount FROM TableStats WHERE tableName = :name"), {"name": self.model.__tablename__}
+        ).scalar()
+
+    def get_list(self, page, sort_column, sort_desc, search, filters, execute=True, page_size=None):
+        if page_size is None:
+            page_size = self.page_size
+        estimated = not search and not filters
+        g.admin_estimated_count = estimated
+        try:
+            seek = self._seek(page, sort_column) if execute and page_size else None
+            if seek is None:
+                count, data = super().get_list(page, sort_column, sort_desc, search, filters, execute, page_size)
+            else:
+                # no LIMIT yet: the seek condition goes in first
+                count, query = super().get_list(None, sort_column, sort_desc, search, filters, False, 0)
+                data = self._seek_page(query, seek, page_size)
+        finally:
+            g.admin_estimated_count = False
+        if estimated:
+            count = self.estimated_count()
+        if execute:
+            g.admin_page = (self, page or 0, search, filters, page_size, self._key_of(data[0]) if data else None,
+                            self._key_of(data[-1]) if data else None)
+        return count, data
+
+    # --- keyset paging ---
+
+    def _key_of(self, model):
+        return iterencode(getattr(model, c.key) for c in self._key)
+
+    def _seek(self, page, sort_column):
+        """("after" | "before", key values) from the request, or None for OFFSET paging."""
+        if not page or sort_column is not None or not has_request_context():
+            return None
+        for direction in SEEK_ARGS:
+            value = request.args.get(direction)
+            if value is None:
+                continue
+            values = iterdecode(value)
+            if len(values) != len(self._key):
+                return None
+            try:
+                return direction, [c.type.python_type(v) for c, v in zip(self._key, values)]
+            except (TypeError, ValueError, NotImplementedError):
+                return None
+        return None
+
+    def _seek_page(self, query, seek, page_size):
+        direction, values = seek
+        key = tuple_(*self._key) if len(self._key) > 1 else self._key[0]
+        bound = tuple_(*values) if len(values) > 1 else values[0]
+        if direction == "after":
+            return query.filter(key > bound).limit(page_size).all()
+        rows = query.filter(key < bound).order_by(None).order_by(*(c.desc() for c in self._key)).limit(page_size).all()
+        return rows[::-1]
+
+    def _get_list_url(self, view_args):
+        extra = {k: v for k, v in view_args.extra_args.items() if k not in SEEK_ARGS}
+        current = g.get("admin_page")
+        if current is not None and current[0] is self and view_args.sort is None:
+            _, page, search, filters, page_size, first, last = current
+            same = (view_args.search, view_args.filters, self.get_safe_page_size(view_args.page_size)) == (
+                search, filters, page_size)
+            target = view_args.page or 0
+            if same and last is not None and target == page + 1:
+                extra["after"] = last
+            elif same and first is not None and target == page - 1 and target > 0:
+                extra["before"] = first
+        return super()._get_list_url(view_args.clone(extra_args=extra))
+
+
+class PhotoView(LargeTableView):
+    column_list = ["photokey", "contentHash", "mimeType", "byteSize"]
+    # legacy inline images can be megabytes each
+    query_options = [defer(Photo.imagedata)]
+
+class NotesView(LargeTableView):
+    column_list = ["notekey", "title", "contentPreview", "dateCreated", "lastModified"]
+    column_labels = {"contentPreview": "Content"}
+    column_sortable_list = ["notekey", "title", "dateCreated", "lastModified"]
+    query_options = [defer(Notes.content), undefer(Notes.contentPreview)]
+
+class SocialTypeView(LargeTableView):
     column_list = ["socialkey", "platformName", "platformURL"]
 
-class RelationshipTypeView(ModelView):
-    column_hide_backrefs = False
+class RelationshipTypeView(LargeTableView):
     column_list = ["relTypeKey", "name", "description"]
 
-class CategoryView(ModelView):
-    column_hide_backrefs = False
+class CategoryView(LargeTableView):
     column_list = ["catkey", "name", "description"]
 
-class PersonView(ModelView):
-    column_hide_backrefs = False
+class PersonView(LargeTableView):
     column_list = [
         "perkey",
         "photokey",
@@ -30,40 +157,72 @@ class PersonView(ModelView):
         "birthday",
         "location",
     ]
+    # generated columns can't be written
+    form_excluded_columns = ["birthMonth", "birthDayOfMonth"]
+    form_ajax_refs = {"photo": _lookup("photokey")}
 
-class SocialLinksView(ModelView):
-    column_hide_backrefs = False
+class SocialLinksView(LargeTableView):
     column_list = [
         "socialkey",
         "perkey",
+        "person",
         "handle",
         "profileURL",
     ]
+    column_formatters = {"person": _show("person", "firstName", "lastName")}
+    query_options = [joinedload(SocialLinks.person).load_only(Person.firstName, Person.lastName)]
+    form_ajax_refs = {"person": _lookup("firstName", "lastName")}
 
-class NotePhotoView(ModelView):
-    column_hide_backrefs = False
+class NotePhotoView(LargeTableView):
     column_list = [
         "notekey",
+        "note",
         "photokey",
     ]
+    column_formatters = {"note": _show("note", "title")}
+    query_options = [joinedload(NotePhoto.note).load_only(Notes.title)]
+    form_ajax_refs = {"note": _lookup("title"), "photo": _lookup("photokey")}
 
-class NotedPersonView(ModelView):
-    column_hide_backrefs = False
+class NotedPersonView(LargeTableView):
     column_list = [
         "perkey",
+        "person",
         "notekey",
+        "note",
+    ]
+    column_formatters = {
+        "person": _show("person", "firstName", "lastName"),
+        "note": _show("note", "title"),
+    }
+    query_options = [
+        joinedload(NotedPerson.person).load_only(Person.firstName, Person.lastName),
+        joinedload(NotedPerson.note).load_only(Notes.title),
     ]
+    form_ajax_refs = {"person": _lookup("firstName", "lastName"), "note": _lookup("title")}
 
-class RelationshipsView(ModelView):
-    column_hide_backrefs = False
+class RelationshipsView(LargeTableView):
     column_list = [
         "relTypeKey",
+        "rel_type",
         "perkey1",
+        "person1",
         "perkey2",
+        "person2",
+    ]
+    column_labels = {"rel_type": "Type", "person1": "Person 1", "person2": "Person 2"}
+    column_formatters = {
+        "rel_type": _show("rel_type", "name"),
+        "person1": _show("person1", "firstName", "lastName"),
+        "person2": _show("person2", "firstName", "lastName"),
+    }
+    query_options = [
+        joinedload(Relationships.rel_type).load_only(RelationshipType.name),
+        joinedload(Relationships.person1).load_only(Person.firstName, Person.lastName),
+        joinedload(Relationships.person2).load_only(Person.firstName, Person.lastName),
     ]
+    form_ajax_refs = {"person1": _lookup("firstName", "lastName"), "person2": _lookup("firstName", "lastName")}
 
-class RemindersView(ModelView):
-    column_hide_backrefs = False
+class RemindersView(LargeTableView):
     column_list = [
         "remkey",
         "title",
@@ -71,18 +230,45 @@ class RemindersView(ModelView):
         "dueDate",
         "completed",
     ]
+    form_excluded_columns = ["dueAt"]  # generated
 
-class PerCatView(ModelView):
-    column_hide_backrefs = False
+class PerCatView(LargeTableView):
     column_list = [
         "perkey",
+        "person",
         "catkey",
+        "category",
     ]
+    column_formatters = {
+        "person": _show("person", "firstName", "lastName"),
+        "category": _show("category", "name"),
+    }
+    query_options = [
+        joinedload(PerCat.person).load_only(Person.firstName, Person.lastName),
+        joinedload(PerCat.category).load_only(Category.name),
+    ]
+    form_ajax_refs = {"person": _lookup("firstName", "lastName")}
 
-class RemPerView(ModelView):
-    column_hide_backrefs = False
-    column_list = ["remkey", "perkey",]
+class RemPerView(LargeTableView):
+    column_list = ["remkey", "reminder", "perkey", "person"]
+    column_formatters = {
+        "reminder": _show("reminder", "title"),
+        "person": _show("person", "firstName", "lastName"),
+    }
+    query_options = [
+        joinedload(RemPer.reminder).load_only(Reminders.title),
+        joinedload(RemPer.person).load_only(Person.firstName, Person.lastName),
+    ]
+    form_ajax_refs = {"reminder": _lookup("title"), "person": _lookup("firstName", "lastName")}
 
-class RemCatView(ModelView):
-    column_hide_backrefs = False
-    column_list = ["remkey", "catkey",]
\ No newline at end of file
+class RemCatView(LargeTableView):
+    column_list = ["remkey", "reminder", "catkey", "category"]
+    column_formatters = {
+        "reminder": _show("reminder", "title"),
+        "category": _show("category", "name"),
+    }
+    query_options = [
+        joinedload(RemCat.reminder).load_only(Reminders.title),
+        joinedload(RemCat.category).load_only(Category.name),
+    ]
+    form_ajax_refs = {"reminder": _lookup("title")}
@@ -0,0 +1,223 @@
+# Single-writer queue for the API's write handlers.
+#
+# SQLite allows one writer at a time. With every request thread committing on
+# its own, concurrent writes queue up inside SQLite's busy handler and fail
+# with "database is locked" once busy_timeout runs out. Here the handlers hand
+# their writes to one writer thread instead and wait for the result:
+#
+#   def unit():
+#       person = Person(firstName=...)
+#       db.session.add(person)
+#       db.session.flush()
+#       return ser.PERSON.obj(person)
+#   result = write_queue.run(unit)
+#
+# A unit uses db.session as usual but never commits or rolls back; it returns
+# plain data (the session is gone by the time the request thread sees it) and
+# must not touch `request`. The writer takes everything queued so far, up to
+# WRITE_QUEUE_MAX_BATCH units, opens one BEGIN IMMEDIATE transaction and runs
+# each unit under its own SAVEPOINT, so a unit that raises (abort(404), an
+# IntegrityError) is rolled back alone and its exception re-raised in the
+# request thread. The group is then committed once: the response cache and
+# scheduler hooks see one commit, and the callers get their results after it.
+#
+# run_exclusive(fn) runs fn(dbapi_connection) on the writer thread between
+# groups, for writers that manage their own transactions (the bulk import).
+#
+# The queue is per process: writes from other processes (several ASGI workers,
+# the admin of another instance, the CLI) still meet it at SQLite's lock,
+# where BEGIN IMMEDIATE waits up to busy_timeout.
+#
+# WRITE_QUEUE = False (CRM_WRITE_QUEUE=0) runs the units inline in the request
+# thread and commits each one, as the handlers used to.
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from flask import current_app
+
+DEFAULT_MAX_BATCH = 64
+
+log = logging.getLogger("write_queue")
+
+
+class Unit:
+    __slots__ = ("fn", "exclusive", "future")
+
+    def __init__(self, fn, exclusive=False):
+        self.fn = fn
+        self.exclusive = exclusive
+        self.future = Future()
+
+
+class WriteQueue:
+    def __init__(self, app, db, max_batch=DEFAULT_MAX_BATCH):
+        self.app = app
+        self.db = db
+        self.max_batch = max_batch
+        self.groups = 0          # transactions committed (or attempted)
+        self.units = 0           # units run in them
+        self._pending = deque()
+        self._lock = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    # --- submitting ---
+
+    def submit(self, fn):
+        """Queue `fn` for the next group; returns a Future with its result."""
+        return self._put(Unit(fn))
+
+    def submit_exclusive(self, fn):
+        """Queue fn(dbapi_connection) to run alone; returns a Future."""
+        return self._put(Unit(fn, exclusive=True))
+
+    def run(self, fn):
+        return self.submit(fn).result()
+
+    def run_exclusive(self, fn):
+        return self.submit_exclusive(fn).result()
+
+    def _put(self, unit):
+        self.start()
+        with self._lock:
+            self._pending.append(unit)
+            self._lock.notify()
+        return unit.future
+
+    # --- the writer thread ---
+
+    def _take(self):
+        """Block for the next group: queued units up to max_batch, or one exclusive unit."""
+        with self._lock:
+            while not self._pending:
+                if self._stopping:
+                    return None
+                self._lock.wait()
+            if self._pending[0].exclusive:
+                return [self._pending.popleft()]
+            group = []
+            while self._pending and len(group) < self.max_batch and not self._pending[0].exclusive:
+                group.append(self._pending.popleft())
+            return group
+
+    def _run(self):
+        while True:
+            group = self._take()
+            if group is None:
+                return
+            try:
+                with self.app.app_context():
+                    if group[0].exclusive:
+                        self._run_exclusive(group[0])
+                    else:
+                        self._run_group(group)
+            except BaseException as e:  # never leave a caller waiting
+                log.exception("write group failed")
+                for unit in group:
+                    if not unit.future.done():
+                        unit.future.set_exception(e)
+
+    def _run_group(self, group):
+        session = self.db.session
+        # take the write lock up front: a deferred transaction that reads
+        # first can't be upgraded while another connection writes
+        session.connection().exec_driver_sql("BEGIN IMMEDIATE")
+        done = []
+        for unit in group:
+            try:
+                with session.begin_nested():
+                    result = unit.fn()
+            except BaseException as e:
+                unit.future.set_exception(e)
+            else:
+                done.append((unit, result))
+        try:
+            session.commit()
+        except BaseException as e:
+            session.rollback()
+            for unit, _ in done:
+                unit.future.set_exception(e)
+            return
+        finally:
+            self.groups += 1
+            self.units += len(group)
+        for unit, result in done:
+            unit.future.set_result(result)
+
+    def _run_exclusive(self, unit):
+        conn = self.db.engine.raw_connection()
+        try:
+            result = unit.fn(conn)
+        except BaseException as e:
+            unit.future.set_exception(e)
+        else:
+            unit.future.set_result(result)
+        finally:
+            conn.close()
+            self.groups += 1
+            self.units += 1
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Finish what is queued, then end the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+            self._lock.notify()
+        if thread is not None:
+            thread.join()
+
+
+class InlineWrites:
+    """WRITE_QUEUE = False: the same interface, run in the calling thread."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def run(self, fn):
+        try:
+            result = fn()
+            self.db.session.commit()
+        except BaseException:
+            self.db.session.rollback()
+            raise
+        return result
+
+    def run_exclusive(self, fn):
+        conn = self.db.engine.raw_connection()
+        try:
+            return fn(conn)
+        finally:
+            conn.close()
+
+
+def init_app(app, db):
+    if not app.config.get("WRITE_QUEUE", True):
+        writes = InlineWrites(db)
+    else:
+        writes = WriteQueue(app, db, max_batch=app.config.get("WRITE_QUEUE_MAX_BATCH", DEFAULT_MAX_BATCH))
+    app.extensions["write_queue"] = writes
+    return writes
+
+
+def get_write_queue():
+    return current_app.extensions["write_queue"]
+
+
+def run(fn):
+    """Run a write unit (see the top of this file) and return its result."""
+    return get_write_queue().run(fn)
+
+
+def run_exclusive(fn):
+    return get_write_queue().run_exclusive(fn)
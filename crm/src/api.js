@@ -10,8 +10,21 @@ export async function apiFetch(path, opts = {}) {
     return res.status === 204 ? null : res.json();
 }
 
+// list endpoints are keyset paginated ({ items, next_after }); follow the cursor
+export async function apiFetchAll(path) {
+    const sep = path.includes('?') ? '&' : '?';
+    let items = [];
+    let after = null;
+    do {
+        const page = await apiFetch(after === null ? path : `${path}${sep}after=${after}`);
+        items = items.concat(page.items);
+        after = page.next_after;
+    } while (after !== null);
+    return items;
+}
+
 export const Persons = {
-    list: () => apiFetch('/persons'),
+    list: () => apiFetchAll('/persons'),
     get: (id) => apiFetch(`/persons/${id}`),
     create: (data) => apiFetch('/persons', { method: 'POST', body: JSON.stringify(data) }),
     update: (id, data) => apiFetch(`/persons/${id}`, { method: 'PUT', body: JSON.stringify(data) }),
@@ -36,22 +49,40 @@ export const Persons = {
 
 
 export const NotesAPI = {
-    list: () => apiFetch('/notes'),
+    list: () => apiFetchAll('/notes'),
     get: (id) => apiFetch(`/notes/${id}`),
     create: (data) => apiFetch('/notes', { method: 'POST', body: JSON.stringify(data) }),
     update: (id, data) => apiFetch(`/notes/${id}`, { method: 'PUT', body: JSON.stringify(data) }),
     del: (id) => apiFetch(`/notes/${id}`, { method: 'DELETE' })
 };
 export const RemindersAPI = {
-    list: () => apiFetch('/reminders'),
+    list: () => apiFetchAll('/reminders'),
     get: (id) => apiFetch(`/reminders/${id}`),
     create: (data) => apiFetch('/reminders', { method: 'POST', body: JSON.stringify(data) }),
     update: (id, data) => apiFetch(`/reminders/${id}`, { method: 'PUT', body: JSON.stringify(data) }),
     del: (id) => apiFetch(`/reminders/${id}`, { method: 'DELETE' })
 };
+// change feed: take head() before loading a list, then since(seq) returns
+// every row changed after it ({ table, key, op: 'upsert' | 'delete', row })
+// and the seq to pass next time
+export const Changes = {
+    head: () => apiFetch('/changes').then((page) => page.seq),
+    since: async (seq) => {
+        let items = [];
+        let page;
+        do {
+            page = await apiFetch(`/changes?since=${seq}&limit=1000`);
+            items = items.concat(page.items);
+            seq = page.seq;
+        } while (page.more);
+        return { items, seq };
+    },
+};
+
 // default export so imports like `import api from '../api'` work
 export default {
     Persons,
     NotesAPI,
-    RemindersAPI
+    RemindersAPI,
+    Changes
 };
@@ -2,6 +2,7 @@
 // src/pages/PersonDetail.jsx
 import { useEffect, useState } from "react";
 import { useParams } from "react-router-dom";
+import { apiFetchAll } from "../api";
 
 const API = "/api"; // Flask base
 
@@ -62,21 +63,25 @@ export default function PersonDetail() {
   const [editingRelationshipForm, setEditingRelationshipForm] = useState({ relTypeKey: "" });
 
   useEffect(() => {
-    loadPerson();
-    loadNotes();
-    loadReminders();
-    loadRelationships();
+    // person, notes, reminders, relationships and relationship types in one request
+    loadFull("notes,reminders,relationships,relationshipTypes").then(d => {
+      setPerson(d.person);
+      setNotes(d.notes);
+      setReminders(d.reminders);
+      setRelationships(d.relationships);
+      setRelTypes(d.relationshipTypes);
+    });
 
-    // Reference lists
-    fetch(`${API}/persons`).then(r => r.json()).then(setAllPeople);
-    fetch(`${API}/relationship_types`).then(r => r.json()).then(setRelTypes);
+    // Reference list
+    apiFetchAll("/persons").then(setAllPeople);
   }, [perkey]);
 
-  // Loads
+  // Loads (after an edit, re-fetch just the part that changed)
+  const loadFull = (include) => fetch(`${API}/persons/${perkey}/full?include=${include}`).then(r => r.json());
   const loadPerson = () => fetch(`${API}/persons/${perkey}`).then(r => r.json()).then(setPerson);
-  const loadNotes = () => fetch(`${API}/persons/${perkey}/notes`).then(r => r.json()).then(setNotes);
-  const loadReminders = () => fetch(`${API}/persons/${perkey}/reminders`).then(r => r.json()).then(setReminders);
-  const loadRelationships = () => fetch(`${API}/persons/${perkey}/relationships`).then(r => r.json()).then(setRelationships);
+  const loadNotes = () => loadFull("notes").then(d => setNotes(d.notes));
+  const loadReminders = () => loadFull("reminders").then(d => setReminders(d.reminders));
+  const loadRelationships = () => loadFull("relationships").then(d => setRelationships(d.relationships));
 
   // Person save
   const savePerson = async () => {
@@ -1,19 +1,31 @@
 
-import React, { useEffect, useState } from "react";
-import { Persons } from "../api";
+import React, { useEffect, useRef, useState } from "react";
+import { Changes, Persons } from "../api";
 import { Link } from "react-router-dom";
 
 export default function PersonsList() {
   const [items, setItems] = useState([]);
+  const seq = useRef(0);   // change feed position the list is current to
 
   useEffect(() => { loadPersons(); }, []);
   function loadPersons() {
-    Persons.list().then(setItems).catch(console.error);
+    Changes.head()
+      .then((head) => { seq.current = head; return Persons.list(); })
+      .then(setItems)
+      .catch(console.error);
+  }
+
+  // apply what changed since the last load/sync instead of re-fetching the list
+  function syncPersons() {
+    return Changes.since(seq.current).then(({ items: changes, seq: next }) => {
+      seq.current = next;
+      setItems((list) => applyPersonChanges(list, changes));
+    });
   }
 
   function deletePerson(id) {
     if (!window.confirm("Delete this person?")) return;
-    Persons.del(id).then(loadPersons).catch(console.error);
+    Persons.del(id).then(syncPersons).catch(console.error);
   }
 
   // --- Styles: grid + card (inline, Tailwind-independent) ---
@@ -89,3 +101,13 @@ export default function PersonsList() {
     </div>
   );
 }
+
+function applyPersonChanges(list, changes) {
+  const byKey = new Map(list.map((p) => [p.perkey, p]));
+  for (const change of changes) {
+    if (change.table !== "Person") continue;
+    if (change.op === "delete") byKey.delete(change.key.perkey);
+    else byKey.set(change.key.perkey, change.row);
+  }
+  return [...byKey.values()].sort((a, b) => a.perkey - b.perkey);
+}
@@ -39,7 +39,7 @@ const btnDanger = {
 
    useEffect(() => {
     // Load all people for dropdown
-    fetch("/api/persons").then((r) => r.json()).then(setAllPeople).catch(console.error);
+    api.Persons.list().then(setAllPeople).catch(console.error);
     if (isEdit) {
       api.RemindersAPI.get(id)
         .then((data) => setForm({